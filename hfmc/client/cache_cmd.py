@@ -0,0 +1,83 @@
+"""Cache management related commands."""
+
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Dict, List
+
+from hfmc.client import cache_controller, model_controller
+from hfmc.utils.size import format_size
+
+if TYPE_CHECKING:
+    from argparse import Namespace
+
+logger = logging.getLogger(__name__)
+
+
+def _dedup() -> None:
+    result = cache_controller.dedup()
+    logger.info(
+        "Linked %d copies of blobs, %s freed. %d blobs newly stored, "
+        "%d unused blobs removed from the store.",
+        result.nb_linked,
+        format_size(result.freed),
+        result.nb_blobs,
+        result.nb_pruned,
+    )
+
+
+async def _evict(to: int | None) -> None:
+    target = to if to is not None else cache_controller.low_watermark()
+    if target is None:
+        logger.error("No capacity is set, set it or give the size to evict to.")
+        return
+
+    result = cache_controller.evict(target)
+    for repo_id in result.repo_ids:
+        await model_controller.notify_cache_change(repo_id)
+    logger.info(
+        "%s freed, the cache uses %s.",
+        format_size(result.freed),
+        format_size(result.usage),
+    )
+
+
+def _gc(dry_run: bool) -> None:
+    report = cache_controller.gc(dry_run)
+    kinds: Dict[str, List[int]] = {}
+    for orphan in report.orphans:
+        logger.debug("Orphan %s: %s", orphan.kind, orphan.path)
+        count = kinds.setdefault(orphan.kind, [0, 0])
+        count[0] += 1
+        count[1] += orphan.size
+    for kind, (nb_orphans, size) in kinds.items():
+        logger.info("%d orphan %ss, %s.", nb_orphans, kind, format_size(size))
+    logger.info(
+        "Stale metadata of %d files and %d file lists.",
+        len(report.stale_files),
+        len(report.stale_file_lists),
+    )
+    if dry_run:
+        logger.info("%s reclaimable.", format_size(report.reclaimable))
+    else:
+        logger.info("%s freed.", format_size(report.reclaimable))
+
+
+def _log_pins(pins: List[str]) -> None:
+    logger.info("Pinned: %s", ", ".join(pins) if pins else "none")
+
+
+async def exec_cmd(args: Namespace) -> None:
+    """Execute command."""
+    if args.cache_command == "dedup":
+        _dedup()
+    elif args.cache_command == "evict":
+        await _evict(args.to)
+    elif args.cache_command == "gc":
+        _gc(args.dry_run)
+    elif args.cache_command == "pin":
+        _log_pins(cache_controller.pin(args.repo, args.revision))
+    elif args.cache_command == "unpin":
+        _log_pins(cache_controller.unpin(args.repo, args.revision))
+    else:
+        raise NotImplementedError
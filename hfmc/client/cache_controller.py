@@ -0,0 +1,391 @@
+"""Manage the disk space of the cache."""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from filelock import Timeout
+
+from hfmc.common import blob_store, eviction, hf_cache, metadata_store
+from hfmc.common.cache_index import CacheIndex, repo_id_of_folder
+from hfmc.common.context import HfmcContext
+from hfmc.common.repo_files import remove_file_list
+from hfmc.config import config_manager
+from hfmc.config.hfmc_config import HfmcConfigOption
+
+logger = logging.getLogger(__name__)
+
+# files younger than this may be in the middle of being added
+GC_GRACE_SEC = 3600.0
+# incomplete files older than this are not resumed anymore
+GC_INCOMPLETE_SEC = 7 * 24 * 3600.0
+
+ORPHAN_BLOB = "blob"
+ORPHAN_INCOMPLETE = "incomplete file"
+ORPHAN_STORED = "stored blob"
+
+
+@dataclass
+class DedupResult:
+    """What deduplicating the cache did."""
+
+    nb_blobs: int = field(default=0)
+    nb_linked: int = field(default=0)
+    freed: int = field(default=0)
+    nb_pruned: int = field(default=0)
+
+
+def _iter_blobs() -> Iterator[Tuple[str, Path]]:
+    """Yield the etag and path of every complete blob of every repo."""
+    for blobs_dir in sorted(HfmcContext.get_model_dir().glob("*/blobs")):
+        for path in sorted(blobs_dir.iterdir()):
+            if blob_store.etag_re.match(path.name) and path.is_file():
+                yield path.name, path
+
+
+def _prune_store() -> int:
+    """Remove blobs of the store no repo links to anymore."""
+    nb_pruned = 0
+    for path in HfmcContext.get_store_dir().iterdir():
+        if path.is_file() and path.stat().st_nlink == 1:
+            path.unlink()
+            nb_pruned += 1
+    return nb_pruned
+
+
+def dedup() -> DedupResult:
+    """Replace copies of the same blob in repos by links to the store.
+
+    Blobs downloaded before the store existed, or by huggingface_hub, are
+    added to the store, and blobs of the store no repo uses are removed.
+    """
+    result = DedupResult()
+    for etag, path in _iter_blobs():
+        store_path = blob_store.get_store_path(etag)
+        if not store_path.exists():
+            blob_store.store_blob(path, etag)
+            result.nb_blobs += 1
+            continue
+        if blob_store.is_same_file(path, store_path):
+            continue
+
+        size = path.stat().st_size
+        if size != store_path.stat().st_size:
+            logger.warning("Skip %s, its size differs from the stored blob", path)
+            continue
+        try:
+            blob_store.replace_with_link(store_path, path)
+        except OSError as e:
+            logger.warning("Failed to link %s to the stored blob: %s", path, e)
+            continue
+        result.nb_linked += 1
+        result.freed += size
+
+    result.nb_pruned = _prune_store()
+    return result
+
+
+def make_room(
+    reserve: int = 0,
+    keep: List[str] | None = None,
+) -> eviction.EvictionResult | None:
+    """Evict files if the cache is over the high watermark of its capacity.
+
+    reserve is the size of files about to be downloaded. Files are evicted
+    until the cache is under the low watermark with them, except those of
+    the pins and of keep, i.e. the revision being added. Return None if
+    nothing needs to be evicted.
+    """
+    config = config_manager.load_config()
+    if not config.capacity:
+        return None
+    usage = eviction.cache_usage()
+    if usage + reserve <= config.high_watermark * config.capacity:
+        return None
+
+    target = max(int(config.low_watermark * config.capacity) - reserve, 0)
+    return evict(target, keep)
+
+
+def low_watermark() -> int | None:
+    """Get the bytes an eviction stops at, None if there is no capacity."""
+    config = config_manager.load_config()
+    if not config.capacity:
+        return None
+    return int(config.low_watermark * config.capacity)
+
+
+def evict(target: int, keep: List[str] | None = None) -> eviction.EvictionResult:
+    """Evict files until the cache uses at most target bytes."""
+    config = config_manager.load_config()
+    result = eviction.evict(target, config.eviction, config.pins + (keep or []))
+    if result.nb_blobs:
+        logger.info(
+            "Evicted %d files of %s.",
+            result.nb_blobs,
+            ", ".join(sorted(result.repo_ids)),
+        )
+    return result
+
+
+def pin(repo_id: str, revision: str | None) -> List[str]:
+    """Never evict files of a repo, or of a revision of it."""
+    pins = config_manager.get_config(HfmcConfigOption.PINS, list)
+    value = f"{repo_id}@{revision}" if revision else repo_id
+    if value not in pins:
+        pins.append(value)
+        config_manager.set_config(HfmcConfigOption.PINS, pins, list)
+    return pins
+
+
+def unpin(repo_id: str, revision: str | None) -> List[str]:
+    """Let files of a repo, or of a revision of it, be evicted again."""
+    pins = config_manager.get_config(HfmcConfigOption.PINS, list)
+    value = f"{repo_id}@{revision}" if revision else repo_id
+    if value in pins:
+        pins.remove(value)
+        config_manager.set_config(HfmcConfigOption.PINS, pins, list)
+    return pins
+
+
+@dataclass
+class Orphan:
+    """A file of the cache nothing uses."""
+
+    kind: str = field()
+    path: Path = field()
+    # bytes freed by removing it, 0 if other links keep the content
+    size: int = field()
+
+
+@dataclass
+class GcReport:
+    """Orphans found, and removed unless it is a dry run."""
+
+    orphans: List[Orphan] = field(default_factory=list)
+    # metadata of snapshot files and revisions not in the cache anymore
+    stale_files: List[str] = field(default_factory=list)
+    stale_file_lists: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def reclaimable(self) -> int:
+        """Bytes freed by removing the orphans."""
+        return sum(o.size for o in self.orphans)
+
+
+def _load_files() -> Dict[str, str]:
+    """Load etags of all snapshot files, indexing the cache the first time."""
+    files = metadata_store.load_files()
+    if files is None:
+        index = CacheIndex(HfmcContext.get_model_dir())
+        index.build()
+        metadata_store.index_files(
+            (cached.file_path, cached.etag, cached.size)
+            for repo in index.get_repos()
+            for cached in repo.files.values()
+            if cached.etag
+        )
+        files = metadata_store.load_files() or {}
+    return files
+
+
+def _freed_size(path: Path, st: os.stat_result) -> int:
+    """Get bytes freed by removing a blob, and its store link if unused."""
+    if st.st_nlink == 1:
+        return st.st_size
+    store_path = blob_store.get_store_path(path.name)
+    if (
+        st.st_nlink == 2  # noqa: PLR2004
+        and store_path.exists()
+        and blob_store.is_same_file(path, store_path)
+    ):
+        return st.st_size
+    return 0
+
+
+def _walk_links(dir_path: str) -> Iterator[Tuple[Path, Path]]:
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_links(entry.path)
+            elif entry.is_symlink():
+                target = os.path.join(dir_path, os.readlink(entry.path))
+                yield Path(entry.path), Path(os.path.normpath(target))
+
+
+def _read_links(repo_dir: Path) -> Dict[Path, Path]:
+    """Map snapshot symlinks of a repo to the blobs they point to.
+
+    Links are read, not resolved, which would stat every blob.
+    """
+    snapshot_dir = repo_dir / "snapshots"
+    if not snapshot_dir.is_dir():
+        return {}
+    try:
+        return dict(_walk_links(str(snapshot_dir)))
+    except OSError as e:
+        # removed meanwhile
+        logger.debug("Failed to read snapshots of %s: %s", repo_dir, e)
+        return {}
+
+
+def _find_blob_orphans(
+    files: Dict[str, str],
+    links: Dict[Path, Path],
+    now: float,
+) -> Iterator[Orphan]:
+    """Find blobs no snapshot links to, and stale incomplete files."""
+    model_dir = HfmcContext.get_model_dir()
+    # blobs of a repo are named by their etags, files not linked are
+    # copies of blobs where symlinks are not supported
+    linked = {
+        model_dir / path.split("/", 1)[0] / "blobs" / etag
+        for path, etag in files.items()
+    }
+    linked.update(links.values())
+    incomplete_sidecar = hf_cache.INCOMPLETE_SUFFIX + hf_cache.SIDECAR_SUFFIX
+    for blobs_dir in sorted(model_dir.glob("*/blobs")):
+        for path in sorted(blobs_dir.iterdir()):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                # removed by a download finishing or an eviction meanwhile
+                continue
+            age = now - st.st_mtime
+            if blob_store.etag_re.match(path.name):
+                if path not in linked and age > GC_GRACE_SEC:
+                    yield Orphan(ORPHAN_BLOB, path, _freed_size(path, st))
+            elif path.name.endswith(hf_cache.INCOMPLETE_SUFFIX):
+                if age > GC_INCOMPLETE_SEC:
+                    yield Orphan(ORPHAN_INCOMPLETE, path, st.st_size)
+            elif path.name.endswith(incomplete_sidecar):
+                incomplete = path.with_name(path.name[: -len(hf_cache.SIDECAR_SUFFIX)])
+                if not incomplete.exists() and age > GC_GRACE_SEC:
+                    yield Orphan(ORPHAN_INCOMPLETE, path, st.st_size)
+
+
+def _unindexed_files(
+    files: Dict[str, str],
+    links: Dict[Path, Path],
+) -> List[Tuple[Path, str, int]]:
+    """Get snapshot files missing in the metadata store, i.e. added by hf_hub."""
+    model_dir = HfmcContext.get_model_dir()
+    unindexed = []
+    for snapshot_path, blob_path in links.items():
+        if snapshot_path.relative_to(model_dir).as_posix() in files:
+            continue
+        if not blob_store.etag_re.match(blob_path.name):
+            continue
+        try:
+            size = blob_path.stat().st_size
+        except OSError:
+            # dangling symlink
+            continue
+        unindexed.append((snapshot_path, blob_path.name, size))
+    return unindexed
+
+
+def _find_store_orphans() -> Iterator[Orphan]:
+    """Find blobs of the store no repo links to."""
+    store_dir = HfmcContext.get_store_dir()
+    if not store_dir.is_dir():
+        return
+    for path in sorted(store_dir.iterdir()):
+        st = path.stat()
+        if blob_store.etag_re.match(path.name) and st.st_nlink == 1:
+            yield Orphan(ORPHAN_STORED, path, st.st_size)
+
+
+def _find_stale_files(files: Dict[str, str]) -> List[str]:
+    """Find saved etags of snapshot files removed."""
+    model_dir = HfmcContext.get_model_dir()
+    return sorted(path for path in files if not os.path.lexists(model_dir / path))
+
+
+def _find_stale_file_lists(now: float) -> List[Tuple[str, str]]:
+    """Find saved file lists of revisions not in the cache."""
+    stale = []
+    for repo_id, revision, saved_at in metadata_store.list_file_lists():
+        repo_path = hf_cache.get_repo_path(repo_id)
+        if (repo_path / "refs" / revision).exists() or (
+            repo_path / "snapshots" / revision
+        ).exists():
+            continue
+        if now - saved_at > GC_GRACE_SEC:
+            stale.append((repo_id, revision))
+    return sorted(stale)
+
+
+def _unlink_orphan(orphan: Orphan) -> None:
+    path = orphan.path
+    if orphan.kind == ORPHAN_BLOB and orphan.size and path.stat().st_nlink > 1:
+        # the store is the other link
+        blob_store.get_store_path(path.name).unlink(missing_ok=True)
+    path.unlink(missing_ok=True)
+    if orphan.kind == ORPHAN_INCOMPLETE:
+        path.with_name(path.name + hf_cache.SIDECAR_SUFFIX).unlink(missing_ok=True)
+
+
+def _remove_orphan(orphan: Orphan) -> None:
+    if orphan.kind != ORPHAN_BLOB:
+        _unlink_orphan(orphan)
+        return
+
+    # a blob linked from the store keeps the old mtime of the store, so
+    # its age doesn't tell if it is being added. Files are added with
+    # the lock of their blob held, check again with the lock.
+    repo_dir = orphan.path.parent.parent
+    repo_id = repo_id_of_folder(repo_dir.name)
+    if repo_id is None:
+        return
+    lock = hf_cache.blob_lock(repo_id, orphan.path.name)
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        logger.debug("Keep %s being added", orphan.path)
+        return
+    try:
+        if orphan.path not in _read_links(repo_dir).values():
+            _unlink_orphan(orphan)
+    finally:
+        lock.release()
+
+
+def gc(dry_run: bool = False) -> GcReport:
+    """Find files of the cache nothing uses, and remove them unless dry_run.
+
+    A blob is used if a snapshot symlink on disk points to it, or a
+    snapshot file of the metadata store has its etag, i.e. a copy where
+    symlinks are not supported. Symlinks are read, not resolved. Files
+    added by huggingface_hub since the last gc are saved to the store.
+    """
+    now = time.time()
+    files = _load_files()
+    links: Dict[Path, Path] = {}
+    for snapshot_dir in HfmcContext.get_model_dir().glob("*/snapshots"):
+        links.update(_read_links(snapshot_dir.parent))
+    report = GcReport(
+        orphans=[*_find_blob_orphans(files, links, now), *_find_store_orphans()],
+        stale_files=_find_stale_files(files),
+        stale_file_lists=_find_stale_file_lists(now),
+    )
+    if dry_run:
+        return report
+
+    for orphan in report.orphans:
+        try:
+            _remove_orphan(orphan)
+        except OSError as e:
+            logger.warning("Failed to remove %s: %s", orphan.path, e)
+    model_dir = HfmcContext.get_model_dir()
+    with metadata_store.batch():
+        metadata_store.index_files(_unindexed_files(files, links))
+        metadata_store.remove_files(model_dir / path for path in report.stale_files)
+        for repo_id, revision in report.stale_file_lists:
+            remove_file_list(repo_id, revision)
+    return report
@@ -0,0 +1,151 @@
+"""Schedule concurrent downloads of the files in a repo."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, List
+
+from hfmc.utils.size import format_size
+
+if TYPE_CHECKING:
+    from hfmc.common.file_meta import FileMeta
+    from hfmc.common.peer import Peer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS = 4
+DEFAULT_ENDPOINT_JOBS = 2
+
+
+@dataclass
+class DownloadTask:
+    """A file to download and the peers having it."""
+
+    file_name: str = field()
+    peers: List[Peer] = field(default_factory=list)
+    meta: FileMeta | None = field(default=None)
+
+    @property
+    def size(self) -> int:
+        """Size of the file, 0 if it is unknown."""
+        if self.meta is None or self.meta.size is None:
+            return 0
+        return self.meta.size
+
+
+class EndpointLimiter:
+    """Limit concurrent downloads from every single endpoint."""
+
+    _limit: int
+    _slots: Dict[str, asyncio.Semaphore]
+
+    def __init__(self, limit: int) -> None:
+        """Init EndpointLimiter."""
+        self._limit = max(limit, 1)
+        self._slots = {}
+
+    def has_free_slot(self, endpoint: str) -> bool:
+        """Check if a download from the endpoint would start right away."""
+        sem = self._slots.get(endpoint)
+        return sem is None or not sem.locked()
+
+    def pick(self, endpoints: List[str]) -> str:
+        """Pick the first endpoint with a free slot, or the first one.
+
+        A task waiting for a busy endpoint holds a job slot of the
+        scheduler, so it is better spent on the next best endpoint.
+        """
+        return next((e for e in endpoints if self.has_free_slot(e)), endpoints[0])
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str) -> AsyncIterator[None]:
+        """Wait for a free download slot of the endpoint."""
+        sem = self._slots.setdefault(endpoint, asyncio.Semaphore(self._limit))
+        async with sem:
+            yield
+
+
+class DownloadScheduler:
+    """Download files concurrently, largest files first.
+
+    At most {jobs} files are downloaded at the same time, and at most
+    {endpoint_jobs} of them from the same endpoint. Downloading large files
+    first keeps all slots busy until the end, instead of leaving one large
+    file downloading alone at the tail.
+    """
+
+    _jobs: int
+    _limiter: EndpointLimiter
+    _nb_done: int
+    _nb_failed: int
+    _size_done: int
+
+    def __init__(
+        self,
+        jobs: int = DEFAULT_JOBS,
+        endpoint_jobs: int = DEFAULT_ENDPOINT_JOBS,
+    ) -> None:
+        """Init DownloadScheduler."""
+        self._jobs = max(jobs, 1)
+        self._limiter = EndpointLimiter(endpoint_jobs)
+        self._nb_done = 0
+        self._nb_failed = 0
+        self._size_done = 0
+
+    @property
+    def limiter(self) -> EndpointLimiter:
+        """Limiter of concurrent downloads per endpoint."""
+        return self._limiter
+
+    def _report(
+        self,
+        task: DownloadTask,
+        success: bool,
+        nb_total: int,
+        size_total: int,
+    ) -> None:
+        self._nb_done += 1
+        if success:
+            self._size_done += task.size
+        else:
+            self._nb_failed += 1
+
+        logger.info(
+            "[%d/%d] %s %s (%s), %s of %s done.",
+            self._nb_done,
+            nb_total,
+            "Added" if success else "Failed to add",
+            task.file_name,
+            format_size(task.size),
+            format_size(self._size_done),
+            format_size(size_total),
+        )
+
+    async def run(
+        self,
+        tasks: List[DownloadTask],
+        download: Callable[[DownloadTask], Awaitable[bool]],
+    ) -> bool:
+        """Run all download tasks, return True if all of them succeed."""
+        tasks = sorted(tasks, key=lambda t: t.size, reverse=True)
+        nb_total = len(tasks)
+        size_total = sum(t.size for t in tasks)
+        # waiters of a semaphore are woken up in FIFO order,
+        # so tasks start in the sorted order
+        sem = asyncio.Semaphore(self._jobs)
+
+        async def _run(task: DownloadTask) -> bool:
+            async with sem:
+                try:
+                    success = await download(task)
+                except (OSError, ValueError) as e:
+                    logger.debug("Download task error", exc_info=e)
+                    success = False
+            self._report(task, success, nb_total, size_total)
+            return success
+
+        results = await asyncio.gather(*[_run(t) for t in tasks])
+        return all(results)
@@ -0,0 +1,478 @@
+"""Download a model file into the cache without blocking the event loop.
+
+The file is streamed with the shared aiohttp session and written into
+the huggingface_hub cache layout. The etag and commit hash are taken from
+the headers of the same response, so no extra metadata request is sent.
+
+An interrupted download is kept as an incomplete file, and the next
+attempt, from any peer or site, resumes it with a range request once the
+response shows the same etag.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from typing import IO, Any, Dict, Optional
+
+import aiohttp
+from filelock import FileLock, Timeout
+from huggingface_hub import constants, hf_hub_url  # type: ignore[import-untyped]
+from huggingface_hub.utils import tqdm  # type: ignore[import-untyped]
+
+from hfmc.client import http_request as request
+from hfmc.common import hf_cache
+from hfmc.common.file_meta import FileMeta
+from hfmc.utils.size import format_size
+
+logger = logging.getLogger(__name__)
+
+BUF_SIZE = 2**20
+HTTP_STATUS_PARTIAL_CONTENT = 206
+HTTP_STATUS_UNAUTHORIZED = 401
+HTTP_STATUS_FORBIDDEN = 403
+LOCK_POLL_SEC = 0.1
+# a wait for a blob downloaded by another process ends if it stalls this long
+LOCK_STALL_SEC = 60
+
+content_range_re = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class GatedRepoError(Exception):
+    """The repo requires authorization to download."""
+
+
+class DownloadProgress:
+    """Progress of a download, to read the file while it is written."""
+
+    # the progress bar is shown along with the progress
+    show_bar = False
+
+    def start(self, partial: hf_cache.PartialFile, offset: int) -> None:
+        """Start writing the incomplete file from offset."""
+
+    def update(self, nb_bytes: int) -> None:
+        """Append bytes to the incomplete file."""
+
+    def follow(self, repo_id: str, etag: str, size: int, commit_hash: str) -> None:
+        """Wait for the blob written by another process or task."""
+
+
+def _content_range(resp: aiohttp.ClientResponse) -> tuple[int, int] | None:
+    """Get the first byte position and the file size of a 206 response."""
+    if resp.status != HTTP_STATUS_PARTIAL_CONTENT:
+        return None
+    match = content_range_re.match(resp.headers.get("Content-Range", ""))
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(3))
+
+
+def _response_meta(resp: aiohttp.ClientResponse) -> FileMeta:
+    """Collect metadata of a file from a response and its redirects.
+
+    The hub redirects LFS files to a CDN. The first response carries the
+    commit hash and the etag of the LFS file in X-Linked-Etag, and the
+    final response carries the content.
+    """
+    hops = [*resp.history, resp]
+    origin = next(
+        (h for h in hops if constants.HUGGINGFACE_HEADER_X_REPO_COMMIT in h.headers),
+        resp,
+    )
+
+    etag = origin.headers.get(constants.HUGGINGFACE_HEADER_X_LINKED_ETAG)
+    etag = etag or origin.headers.get("ETag")
+    size: int | str | None = origin.headers.get(
+        constants.HUGGINGFACE_HEADER_X_LINKED_SIZE,
+    )
+    content_range = _content_range(resp)
+    if content_range:
+        size = size or content_range[1]
+    size = size or resp.headers.get("Content-Length")
+
+    return FileMeta(
+        size=int(size) if size else None,
+        etag=request.normalize_etag(etag),
+        commit_hash=origin.headers.get(constants.HUGGINGFACE_HEADER_X_REPO_COMMIT),
+    )
+
+
+def _write_chunk(f: IO[bytes], buf: bytes, hasher: Optional[Any]) -> None:
+    f.write(buf)
+    # readers of the incomplete file see the bytes counted as written
+    f.flush()
+    if hasher is not None:
+        hasher.update(buf)
+
+
+def _open_partial(partial: hf_cache.PartialFile, offset: int) -> tuple[IO, Any]:
+    """Open the incomplete file to write from offset, hash the bytes before."""
+    hasher = hf_cache.etag_hasher(partial.etag, partial.size)
+    f = partial.path.open("r+b" if offset else "wb")
+    try:
+        while hasher is not None and f.tell() < offset:
+            hasher.update(f.read(min(BUF_SIZE, offset - f.tell())))
+        f.seek(offset)
+        f.truncate()
+    except BaseException:
+        f.close()
+        raise
+    return f, hasher
+
+
+async def _save_body(
+    resp: aiohttp.ClientResponse,
+    partial: hf_cache.PartialFile,
+    offset: int,
+    progress: DownloadProgress | None = None,
+) -> bool:
+    """Stream the body into the incomplete file and verify it.
+
+    If the body ends early, the incomplete file is kept to be resumed.
+    """
+    loop = asyncio.get_running_loop()
+    f, hasher = await loop.run_in_executor(None, _open_partial, partial, offset)
+    written = offset
+    if progress is not None:
+        progress.start(partial, offset)
+
+    with f, tqdm(
+        total=partial.size,
+        initial=offset,
+        unit="B",
+        unit_scale=True,
+        desc=partial.file_name,
+        disable=(progress is not None and not progress.show_bar)
+        or logger.getEffectiveLevel() > logging.INFO,
+    ) as progress_bar:
+        async for buf in resp.content.iter_chunked(BUF_SIZE):
+            await loop.run_in_executor(None, _write_chunk, f, buf, hasher)
+            written += len(buf)
+            progress_bar.update(len(buf))
+            if progress is not None:
+                progress.update(len(buf))
+
+    if written != partial.size:
+        logger.info(
+            "Incomplete download of %s: %d of %d",
+            partial.file_name,
+            written,
+            partial.size,
+        )
+        return False
+    if hasher is not None and hasher.hexdigest() != partial.etag:
+        logger.info(
+            "Failed to verify %s, the content doesn't match etag",
+            partial.file_name,
+        )
+        hf_cache.remove_partial(partial.repo_id, partial.etag)
+        return False
+    return True
+
+
+async def _wait_lock(lock: FileLock, repo_id: str, etag: str, file_name: str) -> bool:
+    """Wait for the lock of a blob held by another process or task.
+
+    Give up and return False if the download of the holder makes no
+    progress for LOCK_STALL_SEC.
+    """
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        logger.info("Wait for %s being downloaded by another process", file_name)
+    else:
+        return True
+
+    loop = asyncio.get_running_loop()
+    incomplete_path = hf_cache.get_incomplete_path(repo_id, etag)
+    written, progress_at = -1, loop.time()
+    while True:
+        await asyncio.sleep(LOCK_POLL_SEC)
+        try:
+            lock.acquire(timeout=0)
+        except Timeout:
+            pass
+        else:
+            return True
+
+        try:
+            size = incomplete_path.stat().st_size
+        except OSError:
+            size = 0
+        if size != written:
+            written, progress_at = size, loop.time()
+        elif loop.time() - progress_at > LOCK_STALL_SEC:
+            logger.warning(
+                "Give up waiting for %s, its download by another process "
+                "is stalled for %d sec",
+                file_name,
+                LOCK_STALL_SEC,
+            )
+            return False
+
+
+async def _save_file(  # noqa: PLR0913
+    resp: aiohttp.ClientResponse,
+    meta: FileMeta,
+    repo_id: str,
+    file_name: str,
+    revision: str,
+    partial: hf_cache.PartialFile | None,
+    offset: int,
+    progress: DownloadProgress | None,
+) -> bool | None:
+    """Save the file of a response, with the lock of its blob held.
+
+    Return None if the download should start over without a range.
+    """
+    if not meta.etag or not meta.commit_hash or meta.size is None:
+        return False
+
+    content_range = _content_range(resp)
+    if partial and (meta.etag != partial.etag or meta.size != partial.size):
+        # the file at this revision has changed since the download began
+        logger.debug("Drop incomplete file of %s, etag changed", file_name)
+        hf_cache.remove_partial(repo_id, partial.etag)
+        partial = None
+    if content_range and (partial is None or content_range[0] != offset):
+        # the range can't be used, start over without it
+        resp.close()
+        if partial:
+            hf_cache.remove_partial(repo_id, partial.etag)
+        return None if offset else False
+
+    if hf_cache.ensure_blob(repo_id, meta.etag):
+        # same content is cached for another revision or repo, or
+        # downloaded by another process meanwhile
+        hf_cache.commit_file(
+            repo_id,
+            file_name,
+            revision,
+            meta.commit_hash,
+            meta.etag,
+        )
+        return True
+
+    if content_range is None:
+        # no range is requested, or the server ignored it
+        offset = 0
+    else:
+        logger.info("Resume %s from %s", file_name, format_size(offset))
+
+    hf_cache.prepare_snapshot(repo_id, file_name, revision, meta.commit_hash)
+    partial = hf_cache.PartialFile(
+        repo_id=repo_id,
+        etag=meta.etag,
+        size=meta.size,
+        file_name=file_name,
+        commit_hash=meta.commit_hash,
+    )
+    hf_cache.save_partial(partial)
+    start = time.monotonic()
+    if not await _save_body(resp, partial, offset, progress):
+        return False
+
+    elapsed = max(time.monotonic() - start, 1e-6)
+    logger.debug(
+        "Downloaded %s from %s at %s/s",
+        file_name,
+        resp.url.host,
+        format_size((meta.size - offset) / elapsed),
+    )
+    hf_cache.commit_file(
+        repo_id,
+        file_name,
+        revision,
+        meta.commit_hash,
+        meta.etag,
+        partial.path,
+    )
+    return True
+
+
+async def _download(  # noqa: PLR0913
+    endpoint: str,
+    repo_id: str,
+    file_name: str,
+    revision: str,
+    headers: Dict[str, str] | None,
+    etag: str | None,
+    progress: DownloadProgress | None,
+    commit_hash: str | None,
+    etag_locked: bool,
+) -> bool | None:
+    """Download a file once, None if it should start over without a range.
+
+    If etag_locked is true, the lock of the blob of etag is held already.
+    """
+    url = (
+        request.blob_url(endpoint, etag)
+        if etag and commit_hash
+        else hf_hub_url(
+            repo_id=repo_id,
+            filename=file_name,
+            revision=revision,
+            endpoint=endpoint,
+        )
+    )
+    partial = (
+        hf_cache.load_partial(repo_id, etag)
+        if etag
+        else hf_cache.find_partial(repo_id, file_name)
+    )
+    offset = partial.offset() if partial else 0
+
+    req_headers = {**(headers or {}), "Accept-Encoding": "identity"}
+    if offset:
+        req_headers["Range"] = f"bytes={offset}-"
+
+    async with request.get_stream(url, req_headers) as resp:
+        if resp.status in (HTTP_STATUS_UNAUTHORIZED, HTTP_STATUS_FORBIDDEN):
+            raise GatedRepoError
+        if resp.status not in (request.HTTP_STATUS_OK, HTTP_STATUS_PARTIAL_CONTENT):
+            logger.debug("Failed to download %s: HTTP %d", url, resp.status)
+            return False
+
+        meta = _response_meta(resp)
+        if commit_hash:
+            if meta.etag != etag:
+                return False
+            # the peer may send the commit of another repo
+            meta.commit_hash = commit_hash
+        if not meta.etag or not meta.commit_hash or meta.size is None:
+            logger.debug("No etag, commit hash or size in response of %s", url)
+            return False
+
+        if etag_locked and meta.etag == etag:
+            return await _save_file(
+                resp,
+                meta,
+                repo_id,
+                file_name,
+                revision,
+                partial,
+                offset,
+                progress,
+            )
+
+        lock = hf_cache.blob_lock(repo_id, meta.etag)
+        try:
+            lock.acquire(timeout=0)
+            locked = True
+        except Timeout:
+            locked = False
+        if locked:
+            try:
+                return await _save_file(
+                    resp,
+                    meta,
+                    repo_id,
+                    file_name,
+                    revision,
+                    partial,
+                    offset,
+                    progress,
+                )
+            finally:
+                lock.release()
+
+    # another process is downloading the blob, wait for it, and then
+    # link the file to the blob or resume the download
+    if progress is not None:
+        progress.follow(repo_id, meta.etag, meta.size, meta.commit_hash)
+    return await download_file(
+        endpoint,
+        repo_id,
+        file_name,
+        revision,
+        headers,
+        meta.etag,
+        progress,
+        commit_hash,
+    )
+
+
+async def download_file(  # noqa: PLR0913
+    endpoint: str,
+    repo_id: str,
+    file_name: str,
+    revision: str,
+    headers: Dict[str, str] | None = None,
+    etag: str | None = None,
+    progress: DownloadProgress | None = None,
+    commit_hash: str | None = None,
+) -> bool:
+    """Download a file from a peer or a site into the cache.
+
+    If etag is known, only the incomplete file of that etag is resumed.
+    Raise GatedRepoError if the site requires authorization.
+
+    If commit_hash is given too, the file is downloaded by its content
+    from a peer, which may have it for another repo or revision.
+
+    A blob is downloaded by one process or task at a time. If another one
+    is downloading it, wait for it to finish, and then link the file to
+    the blob, or resume the download if it failed. If etag is known, the
+    wait comes before the request, so the blob is fetched only once.
+    """
+    args = (endpoint, repo_id, file_name, revision, headers, etag, progress)
+    if etag:
+        lock = hf_cache.blob_lock(repo_id, etag)
+        if not await _wait_lock(lock, repo_id, etag, file_name):
+            return False
+        try:
+            if commit_hash and hf_cache.ensure_blob(repo_id, etag):
+                # downloaded by the process or task holding the lock
+                hf_cache.commit_file(repo_id, file_name, revision, commit_hash, etag)
+                return True
+            result = await _download(*args, commit_hash, etag_locked=True)
+        finally:
+            lock.release()
+    else:
+        result = await _download(*args, commit_hash, etag_locked=False)
+
+    if result is not None:
+        return result
+    # the range can't be used, start over without it
+    return await download_file(
+        endpoint,
+        repo_id,
+        file_name,
+        revision,
+        headers,
+        etag if commit_hash else None,
+        progress,
+        commit_hash,
+    )
+
+
+async def get_file_meta(
+    endpoint: str,
+    repo_id: str,
+    file_name: str,
+    revision: str,
+    headers: Dict[str, str] | None = None,
+) -> FileMeta | None:
+    """Get metadata of a file from a peer or a site, None if not found.
+
+    Raise GatedRepoError if the site requires authorization.
+    """
+    url = hf_hub_url(
+        repo_id=repo_id,
+        filename=file_name,
+        revision=revision,
+        endpoint=endpoint,
+    )
+    req_headers = {**(headers or {}), "Accept-Encoding": "identity"}
+    async with request.get_head(url, req_headers) as resp:
+        if resp.status in (HTTP_STATUS_UNAUTHORIZED, HTTP_STATUS_FORBIDDEN):
+            raise GatedRepoError
+        if resp.status != request.HTTP_STATUS_OK:
+            return None
+        meta = _response_meta(resp)
+    if not meta.etag or not meta.commit_hash or meta.size is None:
+        return None
+    return meta
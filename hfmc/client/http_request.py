@@ -5,39 +5,94 @@ from __future__ import annotations
 import asyncio
 import logging
 import time
+import weakref
 from contextlib import asynccontextmanager
-from typing import AsyncContextManager, AsyncIterator, List
+from typing import AsyncContextManager, AsyncIterator, Dict, List
 
 import aiohttp
-from huggingface_hub import (  # type: ignore[import-untyped]
-    get_hf_file_metadata,
-    hf_hub_url,
-)
+from huggingface_hub import constants  # type: ignore[import-untyped]
 
 from hfmc.common.context import HfmcContext
 from hfmc.common.api_settings import (
+    API_DAEMON_CACHE_CHANGE,
     API_DAEMON_PEERS_ALIVE,
     API_DAEMON_PEERS_CHANGE,
+    API_DAEMON_PEER_THROUGHPUT,
+    API_DAEMON_PEERS_WITH_BLOB,
+    API_DAEMON_PEERS_WITH_FILE,
     API_DAEMON_RUNNING,
     API_DAEMON_STOP,
+    API_DISTRIBUTE_PULL,
+    API_FETCH_BLOB,
     API_FETCH_FILE_CLIENT,
+    API_FETCH_FILES_META,
+    API_FETCH_REPO_META,
     API_FETCH_REPO_FILE_LIST,
+    API_PEERS_GOSSIP,
+    API_PEERS_INVENTORY,
+    API_PEERS_PING_REQ,
     API_PEERS_PROBE,
+    HEADER_INVENTORY,
+    HEADER_NO_PROXY,
+    HEADER_UPLOADS,
     TIMEOUT_DAEMON,
+    TIMEOUT_DOWNLOAD,
     TIMEOUT_PEERS,
+    TIMEOUT_PROBE,
     ApiType,
 )
-from hfmc.common.peer import Peer
+from hfmc.common.file_meta import FileMeta
+from hfmc.common.peer import Peer, ewma
+from hfmc.common.pull_status import PullStatus
 from hfmc.common.repo_files import RepoFileList
+from hfmc.common.repo_meta import RepoMeta
 
 logger = logging.getLogger(__name__)
 
 
 HTTP_STATUS_OK = 200
 
+# headers of file requests to peers
+PEER_HEADERS = {HEADER_NO_PROXY: "1"}
+
+# connection pool of the shared session
+POOL_LIMIT = 100
+POOL_LIMIT_PER_HOST = 16
+KEEPALIVE_SEC = 30
+DNS_CACHE_SEC = 300
+
+# one session per event loop, as a session can't be shared across loops
+_sessions: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop,
+    aiohttp.ClientSession,
+] = weakref.WeakKeyDictionary()
+
 
 def _http_session() -> aiohttp.ClientSession:
-    return aiohttp.ClientSession()
+    """Get the session shared by all requests on the running loop.
+
+    Connections are kept alive and reused between requests, instead of
+    paying TCP setup for each ping, HEAD, or API call.
+    """
+    loop = asyncio.get_running_loop()
+    sess = _sessions.get(loop)
+    if sess is None or sess.closed:
+        connector = aiohttp.TCPConnector(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            keepalive_timeout=KEEPALIVE_SEC,
+            ttl_dns_cache=DNS_CACHE_SEC,
+        )
+        sess = aiohttp.ClientSession(connector=connector)
+        _sessions[loop] = sess
+    return sess
+
+
+async def close_session() -> None:
+    """Close the shared session of the running loop."""
+    sess = _sessions.pop(asyncio.get_running_loop(), None)
+    if sess is not None and not sess.closed:
+        await sess.close()
 
 
 def _api_url(peer: Peer, api: ApiType) -> str:
@@ -46,11 +101,10 @@ def _api_url(peer: Peer, api: ApiType) -> str:
 
 @asynccontextmanager
 async def _quiet_request(
-    sess: aiohttp.ClientSession,
     req: AsyncContextManager,
 ) -> AsyncIterator[aiohttp.ClientResponse | None]:
     try:
-        async with sess, req as resp:
+        async with req as resp:
             yield resp
     except (
         aiohttp.ClientError,
@@ -68,9 +122,8 @@ async def _quiet_get(
     url: str,
     timeout: aiohttp.ClientTimeout,
 ) -> AsyncIterator[aiohttp.ClientResponse | None]:
-    sess = _http_session()
-    req = sess.get(url, timeout=timeout)
-    async with _quiet_request(sess, req) as resp:
+    req = _http_session().get(url, timeout=timeout)
+    async with _quiet_request(req) as resp:
         try:
             yield resp
         except (OSError, ValueError, RuntimeError) as e:
@@ -82,10 +135,25 @@ async def _quiet_get(
 async def _quiet_head(
     url: str,
     timeout: aiohttp.ClientTimeout,
+    headers: Dict[str, str] | None = None,
+) -> AsyncIterator[aiohttp.ClientResponse | None]:
+    req = _http_session().head(url, headers=headers, timeout=timeout)
+    async with _quiet_request(req) as resp:
+        try:
+            yield resp
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.debug("Failed to get response: %s", e)
+            yield None
+
+
+@asynccontextmanager
+async def _quiet_post(
+    url: str,
+    data: object,
+    timeout: aiohttp.ClientTimeout,
 ) -> AsyncIterator[aiohttp.ClientResponse | None]:
-    sess = _http_session()
-    req = sess.head(url, timeout=timeout)
-    async with _quiet_request(sess, req) as resp:
+    req = _http_session().post(url, json=data, timeout=timeout)
+    async with _quiet_request(req) as resp:
         try:
             yield resp
         except (OSError, ValueError, RuntimeError) as e:
@@ -93,15 +161,79 @@ async def _quiet_head(
             yield None
 
 
+def _update_peer_state(
+    target: Peer,
+    resp: aiohttp.ClientResponse | None,
+    start: float,
+) -> None:
+    """Update a peer by the response to a probe sent at start."""
+    target.alive = resp is not None and resp.status == HTTP_STATUS_OK
+    target.epoch = int(time.time())
+    if resp is not None and target.alive:
+        target.rtt = ewma(target.rtt, time.monotonic() - start)
+        target.inventory = resp.headers.get(HEADER_INVENTORY, "")
+        target.uploads = _int_or_none(resp.headers.get(HEADER_UPLOADS)) or 0
+
+
 async def ping(target: Peer) -> Peer:
     """Ping a peer to check if it is alive."""
     url = _api_url(target, API_PEERS_PROBE)
-    async with _quiet_get(url, TIMEOUT_PEERS) as resp:
-        target.alive = resp is not None and resp.status == HTTP_STATUS_OK
-        target.epoch = int(time.time())
+    start = time.monotonic()
+    async with _quiet_get(url, TIMEOUT_PROBE) as resp:
+        _update_peer_state(target, resp, start)
         return target
 
 
+async def gossip(target: Peer, message: dict) -> dict | None:
+    """Send a gossip message to a peer, return its reply or None if down."""
+    url = _api_url(target, API_PEERS_GOSSIP)
+    start = time.monotonic()
+    async with _quiet_post(url, message, TIMEOUT_PROBE) as resp:
+        _update_peer_state(target, resp, start)
+        if resp is None or not target.alive:
+            return None
+        try:
+            return await resp.json()
+        except (aiohttp.ClientError, ValueError) as e:
+            logger.debug("Bad gossip from %s: %s", target, e)
+            return None
+
+
+async def ping_req(helper: Peer, target: Peer, message: dict) -> dict | None:
+    """Ask a peer to send a gossip message to target, return target reply."""
+    url = _api_url(helper, API_PEERS_PING_REQ)
+    data = {"ip": target.ip, "port": target.port, "message": message}
+    async with _quiet_post(url, data, TIMEOUT_PEERS) as resp:
+        if resp is None or resp.status != HTTP_STATUS_OK:
+            return None
+        try:
+            return await resp.json()
+        except (aiohttp.ClientError, ValueError) as e:
+            logger.debug("Bad gossip from %s: %s", helper, e)
+            return None
+
+
+async def get_inventory(
+    peer: Peer,
+    epoch: str | None,
+    since: int | None,
+) -> dict | None:
+    """Get the inventory filter of a peer, or its changes since a version."""
+    params = {}
+    if epoch is not None and since is not None:
+        params = {"epoch": epoch, "since": str(since)}
+    url = _api_url(peer, API_PEERS_INVENTORY)
+    req = _http_session().get(url, params=params, timeout=TIMEOUT_PEERS)
+    async with _quiet_request(req) as resp:
+        if resp is None or resp.status != HTTP_STATUS_OK:
+            return None
+        try:
+            return await resp.json()
+        except (aiohttp.ClientError, ValueError) as e:
+            logger.debug("Bad inventory from %s: %s", peer, e)
+            return None
+
+
 async def stop_daemon() -> bool:
     """Stop a daemon service."""
     url = _api_url(HfmcContext.get_daemon(), API_DAEMON_STOP)
@@ -125,6 +257,48 @@ async def get_alive_peers() -> List[Peer]:
         return [Peer(**peer) for peer in await resp.json()]
 
 
+async def get_peers_with_file(
+    repo_id: str,
+    file_name: str,
+    revision: str,
+) -> List[Peer] | None:
+    """Get alive peers which probably have target file, None on error."""
+    user, model = repo_id.strip().split("/")
+    url = _api_url(
+        HfmcContext.get_daemon(),
+        API_DAEMON_PEERS_WITH_FILE.format(user=user, model=model, revision=revision),
+    )
+    req = _http_session().get(
+        url,
+        params={"file_name": file_name},
+        timeout=TIMEOUT_DAEMON,
+    )
+    async with _quiet_request(req) as resp:
+        if not resp or resp.status != HTTP_STATUS_OK:
+            return None
+        return [Peer(**peer) for peer in await resp.json()]
+
+
+async def get_peers_with_blob(etag: str) -> List[Peer] | None:
+    """Get alive peers which probably have a file content, None on error."""
+    url = _api_url(
+        HfmcContext.get_daemon(),
+        API_DAEMON_PEERS_WITH_BLOB.format(etag=etag),
+    )
+    async with _quiet_get(url, TIMEOUT_DAEMON) as resp:
+        if not resp or resp.status != HTTP_STATUS_OK:
+            return None
+        return [Peer(**peer) for peer in await resp.json()]
+
+
+async def report_peer_throughput(peer: Peer, throughput: float) -> bool:
+    """Tell daemon the speed of a download from a peer in B/s."""
+    url = _api_url(HfmcContext.get_daemon(), API_DAEMON_PEER_THROUGHPUT)
+    data = {"ip": peer.ip, "port": peer.port, "throughput": throughput}
+    async with _quiet_post(url, data, TIMEOUT_DAEMON) as resp:
+        return resp is not None and resp.status == HTTP_STATUS_OK
+
+
 async def notify_peers_change() -> bool:
     """Notify peers about a change in peer list."""
     url = _api_url(HfmcContext.get_daemon(), API_DAEMON_PEERS_CHANGE)
@@ -132,13 +306,48 @@ async def notify_peers_change() -> bool:
         return resp is not None and resp.status == HTTP_STATUS_OK
 
 
-async def check_file_exist(
+async def notify_cache_change(repo_id: str) -> bool:
+    """Notify daemon that files of a repo are added or removed."""
+    user, model = repo_id.strip().split("/")
+    url = _api_url(
+        HfmcContext.get_daemon(),
+        API_DAEMON_CACHE_CHANGE.format(user=user, model=model),
+    )
+    async with _quiet_get(url, TIMEOUT_DAEMON) as resp:
+        return resp is not None and resp.status == HTTP_STATUS_OK
+
+
+def _int_or_none(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def normalize_etag(etag: str | None) -> str | None:
+    """Get the etag value of an ETag header, without quotes and weak prefix."""
+    if not etag:
+        return None
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    return etag.strip('"') or None
+
+
+def _file_meta(resp: aiohttp.ClientResponse) -> FileMeta:
+    return FileMeta(
+        size=_int_or_none(resp.headers.get("Content-Length")),
+        etag=normalize_etag(resp.headers.get("ETag")),
+        commit_hash=resp.headers.get(constants.HUGGINGFACE_HEADER_X_REPO_COMMIT),
+    )
+
+
+async def get_file_meta(
     peer: Peer,
     repo_id: str,
     file_name: str,
     revision: str,
-) -> tuple[Peer, bool]:
-    """Check if the peer has target file."""
+) -> tuple[Peer, FileMeta | None]:
+    """Get metadata of target file if the peer has it."""
     url = _api_url(
         peer,
         API_FETCH_FILE_CLIENT.format(
@@ -147,42 +356,139 @@ async def check_file_exist(
             file_name=file_name,
         ),
     )
-    async with _quiet_head(url, TIMEOUT_PEERS) as resp:
-        return (peer, resp is not None and resp.status == HTTP_STATUS_OK)
+    async with _quiet_head(url, TIMEOUT_PEERS, PEER_HEADERS) as resp:
+        if resp is None or resp.status != HTTP_STATUS_OK:
+            return peer, None
+        return peer, _file_meta(resp)
 
 
-async def get_file_etag(
-    endpoint: str,
+def get_stream(
+    url: str,
+    headers: Dict[str, str] | None = None,
+) -> AsyncContextManager[aiohttp.ClientResponse]:
+    """Request a file to read its body as a stream.
+
+    Unlike other requests, errors are raised to the caller, as they
+    may occur while reading the body.
+    """
+    return _http_session().get(url, headers=headers, timeout=TIMEOUT_DOWNLOAD)
+
+
+def get_head(
+    url: str,
+    headers: Dict[str, str] | None = None,
+) -> AsyncContextManager[aiohttp.ClientResponse]:
+    """Request the headers of a file, errors are raised to the caller."""
+    return _http_session().head(
+        url,
+        headers=headers,
+        allow_redirects=True,
+        timeout=TIMEOUT_PEERS,
+    )
+
+
+def get_file_range(  # noqa: PLR0913
+    peer: Peer,
     repo_id: str,
     file_name: str,
     revision: str,
-) -> str | None:
-    """Get the ETag of a file."""
-    url = hf_hub_url(
-        repo_id=repo_id,
-        filename=file_name,
-        revision=revision,
-        endpoint=endpoint,
+    first: int,
+    last: int,
+) -> AsyncContextManager[aiohttp.ClientResponse]:
+    """Request a byte range of target file from the peer."""
+    url = _api_url(
+        peer,
+        API_FETCH_FILE_CLIENT.format(
+            repo=repo_id,
+            revision=revision,
+            file_name=file_name,
+        ),
     )
+    return get_stream(url, {**PEER_HEADERS, "Range": f"bytes={first}-{last}"})
 
-    try:
-        metadata = get_hf_file_metadata(url)
-        if metadata:
-            return metadata.etag
-    except (OSError, ValueError):
-        logger.debug(
-            "Failed to get ETag: %s, %s, %s, %s",
-            endpoint,
-            repo_id,
-            file_name,
-            revision,
-        )
-    return None
+
+async def get_files_meta(
+    peer: Peer,
+    repo_id: str,
+    revision: str,
+    file_names: List[str] | None = None,
+) -> tuple[Peer, Dict[str, FileMeta] | None]:
+    """Get metadata of the files the peer has in one request.
+
+    If file_names is None, get all files of the revision on the peer.
+    """
+    user, model = repo_id.strip().split("/")
+    url = _api_url(
+        peer,
+        API_FETCH_FILES_META.format(user=user, model=model, revision=revision),
+    )
+    async with _quiet_post(url, file_names, TIMEOUT_PEERS) as resp:
+        if resp is None or resp.status != HTTP_STATUS_OK:
+            return peer, None
+        try:
+            body = await resp.json()
+            commit_hash = body["commit_hash"]
+            return peer, {
+                name: FileMeta(size=f["size"], etag=f["etag"], commit_hash=commit_hash)
+                for name, f in body["files"].items()
+            }
+        except (aiohttp.ClientError, KeyError, TypeError, ValueError) as e:
+            logger.debug("Bad files meta from %s: %s", peer, e)
+            return peer, None
+
+
+async def check_file_exist(
+    peer: Peer,
+    repo_id: str,
+    file_name: str,
+    revision: str,
+) -> tuple[Peer, bool]:
+    """Check if the peer has target file."""
+    _, meta = await get_file_meta(peer, repo_id, file_name, revision)
+    return peer, meta is not None
+
+
+async def check_blob_exist(peer: Peer, etag: str) -> tuple[Peer, bool]:
+    """Check if the peer has a file content, in any repo."""
+    url = _api_url(peer, API_FETCH_BLOB.format(etag=etag))
+    async with _quiet_head(url, TIMEOUT_PEERS) as resp:
+        return peer, resp is not None and resp.status == HTTP_STATUS_OK
 
 
-async def check_repo_exist() -> tuple[Peer, bool]:
-    """Check if the peer has target model."""
-    raise NotImplementedError
+def blob_url(endpoint: str, etag: str) -> str:
+    """Get the url of a file content on a peer."""
+    return endpoint + API_FETCH_BLOB.format(etag=etag)
+
+
+async def get_repo_meta(
+    peer: Peer,
+    repo_id: str,
+    revision: str,
+) -> tuple[Peer, RepoMeta | None]:
+    """Get how much of target model the peer has."""
+    user, model = repo_id.strip().split("/")
+    url = _api_url(
+        peer,
+        API_FETCH_REPO_META.format(user=user, model=model, revision=revision),
+    )
+    async with _quiet_get(url, TIMEOUT_PEERS) as resp:
+        if resp is None or resp.status != HTTP_STATUS_OK:
+            return peer, None
+        try:
+            return peer, RepoMeta(**await resp.json())
+        except (aiohttp.ClientError, TypeError, ValueError) as e:
+            logger.debug("Bad repo meta from %s: %s", peer, e)
+            return peer, None
+
+
+async def check_repo_exist(
+    peer: Peer,
+    repo_id: str,
+    revision: str,
+) -> tuple[Peer, bool]:
+    """Check if the peer has files of target model."""
+    _, meta = await get_repo_meta(peer, repo_id, revision)
+    return peer, meta is not None and meta.nb_files > 0
 
 
 async def get_repo_file_list(
@@ -204,3 +510,64 @@ async def get_repo_file_list(
         if not resp or resp.status != HTTP_STATUS_OK:
             return None
         return await resp.json()
+
+
+def _pull_status(body: object) -> PullStatus:
+    if not isinstance(body, dict):
+        raise TypeError
+    return PullStatus(**body)
+
+
+async def start_pull(  # noqa: PLR0913
+    peer: Peer,
+    repo_id: str,
+    commit_hash: str,
+    files: List[str],
+    parent: Peer | None,
+    ref: str | None = None,
+) -> tuple[Peer, PullStatus | None]:
+    """Ask the peer to pull files of a commit from its parent.
+
+    If parent is None, the peer pulls from the local daemon, at the ip
+    the request is sent from.
+    """
+    user, model = repo_id.strip().split("/")
+    url = _api_url(
+        peer,
+        API_DISTRIBUTE_PULL.format(user=user, model=model, revision=commit_hash),
+    )
+    source = (
+        {"ip": parent.ip, "port": parent.port}
+        if parent
+        else {"port": HfmcContext.get_port()}
+    )
+    data = {"files": files, "source": source, "ref": ref}
+    async with _quiet_post(url, data, TIMEOUT_PEERS) as resp:
+        if resp is None or resp.status != HTTP_STATUS_OK:
+            return peer, None
+        try:
+            return peer, _pull_status(await resp.json())
+        except (aiohttp.ClientError, TypeError, ValueError) as e:
+            logger.debug("Bad pull status from %s: %s", peer, e)
+            return peer, None
+
+
+async def get_pull_status(
+    peer: Peer,
+    repo_id: str,
+    commit_hash: str,
+) -> tuple[Peer, PullStatus | None]:
+    """Get how far the peer is in pulling a commit."""
+    user, model = repo_id.strip().split("/")
+    url = _api_url(
+        peer,
+        API_DISTRIBUTE_PULL.format(user=user, model=model, revision=commit_hash),
+    )
+    async with _quiet_get(url, TIMEOUT_PEERS) as resp:
+        if resp is None or resp.status != HTTP_STATUS_OK:
+            return peer, None
+        try:
+            return peer, _pull_status(await resp.json())
+        except (aiohttp.ClientError, TypeError, ValueError) as e:
+            logger.debug("Bad pull status from %s: %s", peer, e)
+            return peer, None
@@ -3,16 +3,19 @@
 from __future__ import annotations
 
 import logging
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Dict, List
 
 from prettytable import PrettyTable
 
 from hfmc.client import model_controller
+from hfmc.utils.size import format_size
 
 if TYPE_CHECKING:
     from argparse import Namespace
 
     from hfmc.client.model_controller import FileInfo, RepoInfo
+    from hfmc.common.peer import Peer
+    from hfmc.common.pull_status import PullStatus
 
 logger = logging.getLogger(__name__)
 
@@ -91,15 +94,18 @@ async def _add(args: Namespace) -> None:
         success = await model_controller.repo_add(
             args.repo,
             args.revision,
+            args.jobs,
+            args.endpoint_jobs,
         )
 
     if success:
         logger.info("%s added.", target)
+        await model_controller.notify_cache_change(args.repo)
     else:
         logger.info("%s failed to add.", target)
 
 
-def _rm(args: Namespace) -> None:
+async def _rm(args: Namespace) -> None:
     if args.file:
         if not args.revision:
             logger.info("Remove file failed, must specify the revision!")
@@ -120,32 +126,97 @@ def _rm(args: Namespace) -> None:
 
     if success:
         logger.info("%s remove is done.", target)
+        await model_controller.notify_cache_change(args.repo)
     else:
         logger.info("%s failed to remove.", target)
 
 
+async def _search_repo(args: Namespace) -> None:
+    results = await model_controller.repo_search(args.repo, args.revision)
+    if not results:
+        logger.info("NO peer has target model.")
+        return
+
+    names = ["PEER", "COMMIT", "NB FILES", "FRACTION", "SIZE"]
+    rows = [
+        [
+            f"{peer.ip}:{peer.port}",
+            meta.commit_hash[:8],
+            str(meta.nb_files) + (f"/{meta.nb_total}" if meta.nb_total else ""),
+            f"{meta.fraction:.0%}" if meta.fraction is not None else "-",
+            format_size(meta.size),
+        ]
+        for peer, meta in results
+    ]
+    _tablize(names, rows)
+
+
 async def _search(args: Namespace) -> None:
-    if args.file:
-        target = "file"
-        peers = await model_controller.file_search(
-            args.repo,
-            args.file,
-            args.revision,
-        )
-    else:
-        target = "model"
-        peers = await model_controller.repo_search()
+    if not args.file:
+        await _search_repo(args)
+        return
 
+    peers = await model_controller.file_search(
+        args.repo,
+        args.file,
+        args.revision,
+    )
     if peers:
         logger.info(
-            "Peers that have target %s:\n[%s]",
-            target,
+            "Peers that have target file:\n[%s]",
             ",".join(
                 [f"{p.ip}:{p.port}" for p in peers],
             ),
         )
     else:
-        logger.info("NO peer has target %s.", target)
+        logger.info("NO peer has target file.")
+
+
+def _report_distribution(statuses: Dict[Peer, PullStatus]) -> None:
+    nb_done = sum(s.finished for s in statuses.values())
+    received = sum(s.received for s in statuses.values())
+    logger.info(
+        "%d/%d daemons finished, %s received",
+        nb_done,
+        len(statuses),
+        format_size(received),
+    )
+
+
+async def _distribute(args: Namespace) -> None:
+    targets = await model_controller.distribution_targets(args.to)
+    if not targets:
+        logger.info("NO daemon to distribute to.")
+        return
+
+    fanout = 1 if args.topology == "chain" else args.fanout
+    statuses = await model_controller.distribute(
+        args.repo,
+        args.revision,
+        targets,
+        fanout,
+        _report_distribution,
+    )
+    if statuses is None:
+        logger.info("Model %s failed to distribute.", args.repo)
+        return
+
+    parents = model_controller.plan_distribution(targets, fanout)
+    names = ["PEER", "PARENT", "STATE", "FILES", "RECEIVED", "ERROR"]
+    rows = []
+    for peer, parent in parents.items():
+        status = statuses[peer]
+        rows.append(
+            [
+                f"{peer.ip}:{peer.port}",
+                f"{parent.ip}:{parent.port}" if parent else "local",
+                status.state,
+                f"{status.nb_done}/{status.nb_files}",
+                format_size(status.received),
+                status.error,
+            ],
+        )
+    _tablize(names, rows)
 
 
 async def exec_cmd(args: Namespace) -> None:
@@ -155,8 +226,10 @@ async def exec_cmd(args: Namespace) -> None:
     elif args.model_command == "add":
         await _add(args)
     elif args.model_command == "rm":
-        _rm(args)
+        await _rm(args)
     elif args.model_command == "search":
         await _search(args)
+    elif args.model_command == "distribute":
+        await _distribute(args)
     else:
         raise NotImplementedError
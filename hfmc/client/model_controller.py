@@ -4,25 +4,53 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import sqlite3
+import time
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Any, Coroutine, List, TypeVar
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Dict, List, TypeVar
 
-from huggingface_hub import hf_hub_download  # type: ignore[import-untyped]
-from huggingface_hub.utils import GatedRepoError  # type: ignore[import-untyped]
+import aiohttp
+from filelock import Timeout
+from huggingface_hub.utils import build_hf_headers  # type: ignore[import-untyped]
 
+from hfmc.client import cache_controller, file_download
 from hfmc.client import http_request as request
-from hfmc.common import hf_wrapper
+from hfmc.client.download_scheduler import (
+    DEFAULT_ENDPOINT_JOBS,
+    DEFAULT_JOBS,
+    DownloadScheduler,
+    DownloadTask,
+    EndpointLimiter,
+)
+from hfmc.client.swarm_download import SWARM_MIN_SIZE, SwarmDownload
+from hfmc.common import hf_cache, hf_wrapper
+from hfmc.common.cache_index import CacheIndex
+from hfmc.common.cache_removal import CacheRemover
 from hfmc.common.context import HfmcContext
-from hfmc.common.etag import save_etag
+from hfmc.common.peer import Peer
+from hfmc.common.pull_status import PULL_FAILED, PullStatus
 from hfmc.common.repo_files import RepoFileList, load_file_list, save_file_list
 
 if TYPE_CHECKING:
     from pathlib import Path
 
-    from hfmc.common.peer import Peer
+    from hfmc.common.file_meta import FileMeta
+    from hfmc.common.repo_meta import RepoMeta
 
 logger = logging.getLogger(__name__)
 
+SITE_ENDPOINTS = ["https://hf-mirror.com", "https://huggingface.co"]
+
+# speed assumed for peers not downloaded from yet, high enough to try them
+DEFAULT_THROUGHPUT = 100 * 10**6  # 100 MB/s
+# smaller downloads take too little time to measure the speed
+MIN_REPORT_SIZE = 10**6
+
+# children of every daemon in a distribution tree, 1 for a chain
+DEFAULT_FANOUT = 2
+DISTRIBUTE_POLL_SEC = 1.0
+# a daemon not answering so many polls in a row is considered failed
+DISTRIBUTE_MAX_MISSES = 10
 
 T = TypeVar("T")
 
@@ -34,13 +62,29 @@ async def _safe_gather(
     return [r for r in results if not isinstance(r, BaseException)]
 
 
+async def _candidate_peers(
+    repo_id: str,
+    file_name: str,
+    revision: str,
+) -> List[Peer]:
+    """Get alive peers which probably have target file.
+
+    Daemon answers from the inventory filters of peers without asking
+    them, so only the candidates need to be asked.
+    """
+    peers = await request.get_peers_with_file(repo_id, file_name, revision)
+    if peers is None:
+        peers = await request.get_alive_peers()
+    return peers
+
+
 async def file_search(
     repo_id: str,
     file_name: str,
     revision: str,
 ) -> List[Peer]:
     """Check which peers have target file."""
-    alives = await request.get_alive_peers()
+    alives = await _candidate_peers(repo_id, file_name, revision)
     tasks = [
         request.check_file_exist(alive, repo_id, file_name, revision)
         for alive in alives
@@ -50,9 +94,124 @@ async def file_search(
     return [alive for alive in alives if alive in exists]
 
 
-async def repo_search() -> List[Peer]:
-    """Check which peers have target model."""
-    raise NotImplementedError
+async def blob_search(etag: str) -> List[Peer]:
+    """Check which peers have a file content, in any repo."""
+    alives = await request.get_peers_with_blob(etag)
+    if alives is None:
+        alives = await request.get_alive_peers()
+    results = await _safe_gather(
+        [request.check_blob_exist(alive, etag) for alive in alives],
+    )
+    exists = {s[0] for s in results if s[1]}
+    return [alive for alive in alives if alive in exists]
+
+
+def _make_task(
+    file_name: str,
+    alives: List[Peer],
+    metas: Dict[Peer, FileMeta],
+) -> DownloadTask:
+    peers = [alive for alive in alives if alive in metas]
+    meta: FileMeta | None = metas[peers[0]] if peers else None
+    if meta is not None:
+        # only peers having the same content can serve parts of the file
+        peers = [p for p in peers if metas[p].etag == meta.etag]
+    return DownloadTask(file_name=file_name, peers=peers, meta=meta)
+
+
+async def _search_file_meta(
+    alives: List[Peer],
+    repo_id: str,
+    file_name: str,
+    revision: str,
+) -> DownloadTask:
+    """Find peers having target file along with its metadata."""
+    tasks = [
+        request.get_file_meta(alive, repo_id, file_name, revision) for alive in alives
+    ]
+    results = await _safe_gather(tasks)
+    metas = {peer: meta for peer, meta in results if meta is not None}
+    return _make_task(file_name, alives, metas)
+
+
+async def _search_files_meta(
+    alives: List[Peer],
+    repo_id: str,
+    file_names: List[str],
+    revision: str,
+) -> List[DownloadTask]:
+    """Find peers having target files, with one request per peer."""
+    tasks = [
+        request.get_files_meta(alive, repo_id, revision, file_names) for alive in alives
+    ]
+    results = await _safe_gather(tasks)
+    peer_metas = {peer: metas for peer, metas in results if metas is not None}
+
+    file_metas: Dict[str, Dict[Peer, FileMeta]] = {f: {} for f in file_names}
+    for peer, metas in peer_metas.items():
+        for file_name, meta in metas.items():
+            if file_name in file_metas:
+                file_metas[file_name][peer] = meta
+
+    return [_make_task(f, alives, file_metas[f]) for f in file_names]
+
+
+async def notify_cache_change(repo_id: str) -> None:
+    """Let daemon know that files of a repo are added or removed."""
+    if not await request.notify_cache_change(repo_id):
+        logger.debug("Daemon is not notified of cache change: %s", repo_id)
+
+
+async def _make_room(repo_id: str, revision: str, reserve: int) -> None:
+    """Evict files to keep the cache under its capacity with new ones."""
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        None,
+        cache_controller.make_room,
+        reserve,
+        [f"{repo_id}@{revision}"],
+    )
+    if result is not None:
+        for evicted in result.repo_ids:
+            await notify_cache_change(evicted)
+
+
+class _StartNotifier(file_download.DownloadProgress):
+    """Let daemon know a file is being downloaded, to relay it to peers."""
+
+    show_bar = True
+    _repo_id: str
+    _notify: asyncio.Task[None] | None
+
+    def __init__(self, repo_id: str) -> None:
+        """Init _StartNotifier of a file of the repo."""
+        self._repo_id = repo_id
+        self._notify = None
+
+    def start(self, partial: hf_cache.PartialFile, offset: int) -> None:
+        """Notify daemon without waiting for it."""
+        self._notify = asyncio.create_task(notify_cache_change(self._repo_id))
+
+
+async def repo_search(
+    repo_id: str,
+    revision: str,
+) -> List[tuple[Peer, RepoMeta]]:
+    """Check how much of target model every peer has, best seeds first."""
+    alives = await request.get_alive_peers()
+    tasks = [request.get_repo_meta(alive, repo_id, revision) for alive in alives]
+    results = await _safe_gather(tasks)
+    found = [(peer, meta) for peer, meta in results if meta and meta.nb_files]
+
+    # peers only know the number of files if they have added the repo,
+    # fill in the number from the local file list
+    for _, meta in found:
+        if meta.nb_total is None:
+            files = load_file_list(repo_id, meta.commit_hash)
+            meta.nb_total = len(files) if files else None
+
+    found.sort(key=lambda r: (r[1].fraction or 0.0, r[1].size), reverse=True)
+    return found
 
 
 async def _download_file(
@@ -60,43 +219,56 @@ async def _download_file(
     repo_id: str,
     file_name: str,
     revision: str,
+    etag: str | None = None,
+    commit_hash: str | None = None,
 ) -> bool:
+    # peers serve /{user}/{model}/resolve/{revision}/{file_name:.*}
+    # like the sites, and send the etag and commit hash along with the file
+    headers = build_hf_headers() if endpoint in SITE_ENDPOINTS else request.PEER_HEADERS
     try:
-        # hf_hub_download will send request to the endpoint
-        # on /{user}/{model}/resolve/{revision}/{file_name:.*}
-        # daemon server can handle the request and return the file
-        _ = hf_hub_download(
-            endpoint=endpoint,
-            repo_id=repo_id,
-            revision=revision,
-            filename=file_name,
-            cache_dir=HfmcContext.get_model_dir_str(),
-        )
-
-        etag = await request.get_file_etag(
+        return await file_download.download_file(
             endpoint,
             repo_id,
             file_name,
             revision,
+            headers,
+            etag,
+            _StartNotifier(repo_id),
+            commit_hash,
         )
-        if not etag:
-            return False
-
-        save_etag(etag, repo_id, file_name, revision)
-    except GatedRepoError:
+    except file_download.GatedRepoError:
         logger.info("Model is gated. Login with `hfmc auth login` first.")
-        return False
-    except (OSError, ValueError) as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
         logger.info(f"Failed to download model. ERROR: {e}")
         logger.debug("Download file error", exc_info=e)
-        return False
-    return True
+    return False
+
+
+def _peer_endpoint(peer: Peer) -> str:
+    return f"http://{peer.ip}:{peer.port}"
+
+
+def _expected_time(peer: Peer, size: int) -> float:
+    """Estimate the time to download a file of the size from a peer."""
+    throughput = peer.throughput or DEFAULT_THROUGHPUT
+    # concurrent uploads share the bandwidth of the peer
+    throughput /= 1 + peer.uploads
+    return peer.rtt + size / throughput
+
 
+def rank_peers(peers: List[Peer], size: int) -> List[Peer]:
+    """Sort peers by the expected time to download a file of the size."""
+    return sorted(peers, key=lambda p: _expected_time(p, size))
 
-def _gen_endpoints(peers: List[Peer]) -> List[str]:
-    peer_ends = [f"http://{peer.ip}:{peer.port}" for peer in peers]
-    site_ends = ["https://hf-mirror.com", "https://huggingface.co"]
-    return peer_ends + site_ends
+
+def _gen_endpoints(peers: List[Peer], size: int = 0) -> List[str]:
+    peer_ends = [_peer_endpoint(peer) for peer in rank_peers(peers, size)]
+    return peer_ends + SITE_ENDPOINTS
+
+
+async def _report_throughput(peer: Peer, size: int, elapsed: float) -> None:
+    if size >= MIN_REPORT_SIZE and elapsed > 0:
+        await request.report_peer_throughput(peer, size / elapsed)
 
 
 async def file_add(
@@ -109,14 +281,261 @@ async def file_add(
         # file is already downloaded
         return True
 
-    peers = await file_search(repo_id, file_name, revision)
-    endpoints = _gen_endpoints(peers)
+    alives = await _candidate_peers(repo_id, file_name, revision)
+    task = await _search_file_meta(alives, repo_id, file_name, revision)
+    await _make_room(repo_id, revision, task.size)
+    limiter = EndpointLimiter(DEFAULT_ENDPOINT_JOBS)
+    return await _add_file_from_peers(repo_id, revision, task, limiter)
+
+
+async def _swarm_download(
+    repo_id: str,
+    revision: str,
+    task: DownloadTask,
+    limiter: EndpointLimiter,
+) -> bool:
+    """Download a large file from all peers having it at the same time."""
+    meta = task.meta
+    if (
+        len(task.peers) < 2  # noqa: PLR2004
+        or meta is None
+        or meta.size is None
+        or meta.size < SWARM_MIN_SIZE
+        or not meta.etag
+        or not meta.commit_hash
+    ):
+        return False
+
+    lock = hf_cache.blob_lock(repo_id, meta.etag)
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        # another process is downloading it, wait in the normal download
+        return False
+    try:
+        return await _swarm_download_locked(repo_id, revision, task, limiter)
+    finally:
+        lock.release()
+
 
-    for endpoint in endpoints:
-        logger.info("Try to add file %s from %s", file_name, endpoint)
-        success = await _download_file(endpoint, repo_id, file_name, revision)
+async def _swarm_download_locked(
+    repo_id: str,
+    revision: str,
+    task: DownloadTask,
+    limiter: EndpointLimiter,
+) -> bool:
+    meta = task.meta
+    if meta is None or meta.size is None or not meta.etag or not meta.commit_hash:
+        return False
+
+    if hf_cache.ensure_blob(repo_id, meta.etag):
+        # downloaded by another process meanwhile
+        hf_cache.commit_file(
+            repo_id,
+            task.file_name,
+            revision,
+            meta.commit_hash,
+            meta.etag,
+        )
+        return True
+
+    loop = asyncio.get_running_loop()
+    partial = hf_cache.load_partial(repo_id, meta.etag)
+    offset = partial.offset() if partial and partial.size == meta.size else 0
+    partial = hf_cache.PartialFile(
+        repo_id=repo_id,
+        etag=meta.etag,
+        size=meta.size,
+        file_name=task.file_name,
+        commit_hash=meta.commit_hash,
+        # chunks are written out of order
+        sequential=False,
+    )
+    tmp_path = partial.path
+    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+    hf_cache.save_partial(partial)
+    swarm = SwarmDownload(
+        repo_id,
+        task.file_name,
+        meta.commit_hash,
+        meta.size,
+        tmp_path,
+        task.peers,
+        limiter,
+        offset,
+    )
+
+    try:
+        if not await swarm.run():
+            # keep the bytes downloaded from the start to resume later
+            with tmp_path.open("r+b") as f:
+                f.truncate(swarm.valid_size)
+            partial.sequential = True
+            hf_cache.save_partial(partial)
+            return False
+        if await loop.run_in_executor(
+            None,
+            hf_cache.verify_etag,
+            tmp_path,
+            meta.etag,
+        ):
+            hf_cache.commit_file(
+                repo_id,
+                task.file_name,
+                revision,
+                meta.commit_hash,
+                meta.etag,
+                tmp_path,
+            )
+            for peer, throughput in swarm.peer_throughputs().items():
+                await request.report_peer_throughput(peer, throughput)
+            return True
+        logger.info("Failed to verify %s downloaded from peers.", task.file_name)
+    except (OSError, ValueError) as e:
+        logger.debug("Swarm download error", exc_info=e)
+
+    hf_cache.remove_partial(repo_id, meta.etag)
+    return False
+
+
+async def _resolve_file_meta(
+    repo_id: str,
+    file_name: str,
+    revision: str,
+) -> FileMeta | None:
+    """Ask the sites for the etag and commit hash of a file."""
+    for endpoint in SITE_ENDPOINTS:
+        try:
+            meta = await file_download.get_file_meta(
+                endpoint,
+                repo_id,
+                file_name,
+                revision,
+                build_hf_headers(),
+            )
+        except file_download.GatedRepoError:
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.debug("Failed to get meta of %s from %s: %s", file_name, endpoint, e)
+            continue
+        if meta is not None:
+            return meta
+    return None
 
+
+async def _add_file_by_content(
+    repo_id: str,
+    revision: str,
+    task: DownloadTask,
+    limiter: EndpointLimiter,
+) -> bool:
+    """Download a file from peers having the same content for any repo.
+
+    Forks and fine-tunes share most files with their base model, so a
+    peer may have a file under another repo even if no peer has the repo.
+    """
+    meta = task.meta
+    if meta is None or not meta.etag or not meta.commit_hash:
+        return False
+    task.meta = meta
+
+    peers = rank_peers(await blob_search(meta.etag), task.size)
+    peer_of = {_peer_endpoint(peer): peer for peer in peers}
+    remaining = list(peer_of)
+    while remaining:
+        endpoint = limiter.pick(remaining)
+        remaining.remove(endpoint)
+        peer = peer_of[endpoint]
+        logger.info("Try to add file %s by content from %s", task.file_name, endpoint)
+        async with limiter.slot(endpoint):
+            start = time.monotonic()
+            success = await _download_file(
+                endpoint,
+                repo_id,
+                task.file_name,
+                revision,
+                meta.etag,
+                meta.commit_hash,
+            )
+            elapsed = time.monotonic() - start
         if success:
+            await _report_throughput(peer, task.size, elapsed)
+            return True
+    return False
+
+
+def _add_file_from_cache(repo_id: str, revision: str, task: DownloadTask) -> bool:
+    """Link a file to the same content cached for another repo or revision."""
+    meta = task.meta
+    if meta is None or not meta.etag or not meta.commit_hash:
+        return False
+    # gc doesn't remove a blob while its lock is held
+    lock = hf_cache.blob_lock(repo_id, meta.etag)
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        # being downloaded, wait for it with the download
+        return False
+    try:
+        if not hf_cache.ensure_blob(repo_id, meta.etag):
+            return False
+        hf_cache.commit_file(
+            repo_id,
+            task.file_name,
+            revision,
+            meta.commit_hash,
+            meta.etag,
+        )
+    finally:
+        lock.release()
+    logger.info("Add file %s from the local cache", task.file_name)
+    return True
+
+
+async def _add_file_from_peers(
+    repo_id: str,
+    revision: str,
+    task: DownloadTask,
+    limiter: EndpointLimiter,
+) -> bool:
+    if not task.peers and task.meta is None:
+        task.meta = await _resolve_file_meta(repo_id, task.file_name, revision)
+    if _add_file_from_cache(repo_id, revision, task):
+        return True
+    if await _swarm_download(repo_id, revision, task, limiter):
+        return True
+    if not task.peers and await _add_file_by_content(
+        repo_id,
+        revision,
+        task,
+        limiter,
+    ):
+        return True
+
+    remaining = _gen_endpoints(task.peers, task.size)
+    peer_of = {_peer_endpoint(peer): peer for peer in task.peers}
+
+    while remaining:
+        # peers come first, a busy one is skipped for a free one
+        peer_endpoints = [e for e in remaining if e in peer_of]
+        endpoint = limiter.pick(peer_endpoints) if peer_endpoints else remaining[0]
+        remaining.remove(endpoint)
+        logger.info("Try to add file %s from %s", task.file_name, endpoint)
+        async with limiter.slot(endpoint):
+            start = time.monotonic()
+            # an incomplete file left by a previous endpoint is resumed
+            success = await _download_file(
+                endpoint,
+                repo_id,
+                task.file_name,
+                revision,
+                task.meta.etag if task.meta else None,
+            )
+            elapsed = time.monotonic() - start
+
+        if success:
+            if endpoint in peer_of:
+                await _report_throughput(peer_of[endpoint], task.size, elapsed)
             return True
 
     return False
@@ -181,11 +600,38 @@ async def _get_repo_file_list(
     return files
 
 
+async def _plan_repo_add(
+    repo_id: str,
+    files: RepoFileList,
+    revision: str,
+) -> List[DownloadTask]:
+    """Find peers and sizes of files which are not downloaded yet."""
+    # scan the repo once instead of scanning the cache for every file
+    index = CacheIndex(HfmcContext.get_model_dir())
+    index.refresh_repo(repo_id)
+    missing = [
+        file_name
+        for file_name in files
+        if index.get_file(repo_id, revision, file_name) is None
+    ]
+    if len(missing) < len(files):
+        logger.info("%d files are already added.", len(files) - len(missing))
+
+    alives = await request.get_alive_peers()
+    return await _search_files_meta(alives, repo_id, missing, revision)
+
+
 async def repo_add(
     repo_id: str,
     revision: str,
+    jobs: int = DEFAULT_JOBS,
+    endpoint_jobs: int = DEFAULT_ENDPOINT_JOBS,
 ) -> bool:
-    """Download and add all files in a repo to HFMC."""
+    """Download and add all files in a repo to HFMC.
+
+    Files are downloaded by {jobs} concurrent tasks, and at most
+    {endpoint_jobs} of them download from the same peer or site.
+    """
     normalized_rev = hf_wrapper.verify_revision(
         repo_id,
         revision,
@@ -200,13 +646,115 @@ async def repo_add(
         logger.error("Failed to get file list of %s", repo_id)
         return False
 
-    for file_name in files:
-        success = await file_add(repo_id, file_name, normalized_rev)
-        if not success:
-            logger.error("Failed to add file: %s", file_name)
-            return False
+    tasks = await _plan_repo_add(repo_id, files, normalized_rev)
+    await _make_room(repo_id, normalized_rev, sum(t.size for t in tasks))
+    scheduler = DownloadScheduler(jobs, endpoint_jobs)
 
-    return True
+    async def _download(task: DownloadTask) -> bool:
+        return await _add_file_from_peers(
+            repo_id,
+            normalized_rev,
+            task,
+            scheduler.limiter,
+        )
+
+    return await scheduler.run(tasks, _download)
+
+
+def plan_distribution(
+    targets: List[Peer],
+    fanout: int = DEFAULT_FANOUT,
+) -> Dict[Peer, Peer | None]:
+    """Get the parent of every target in a tree rooted at the local daemon.
+
+    Targets fill the tree level by level in the given order, every daemon
+    has at most fanout children, and a fanout of 1 makes a chain. The
+    parent is None for children of the local daemon.
+    """
+    fanout = max(fanout, 1)
+    # node 0 is the local daemon, node i + 1 is targets[i]
+    return {
+        target: targets[i // fanout - 1] if i >= fanout else None
+        for i, target in enumerate(targets)
+    }
+
+
+async def distribution_targets(to: str) -> List[Peer]:
+    """Get the daemons to distribute to, "all" or "IP[:PORT],..."."""
+    if to == "all":
+        return await request.get_alive_peers()
+
+    targets: List[Peer] = []
+    for target in to.split(","):
+        ip, _, port = target.strip().partition(":")
+        targets.append(
+            Peer(ip=ip, port=int(port) if port else HfmcContext.get_port()),
+        )
+    return targets
+
+
+async def distribute(  # noqa: PLR0913
+    repo_id: str,
+    revision: str,
+    targets: List[Peer],
+    fanout: int = DEFAULT_FANOUT,
+    report: Callable[[Dict[Peer, PullStatus]], None] | None = None,
+) -> Dict[Peer, PullStatus] | None:
+    """Push a revision of the local cache to the targets.
+
+    Every target pulls the files from its parent in the distribution tree
+    while it relays them to its children. report is called with the
+    progress of the targets every {DISTRIBUTE_POLL_SEC} seconds. Return
+    the final progress, or None if the revision is not cached.
+    """
+    index = CacheIndex(HfmcContext.get_model_dir())
+    index.refresh_repo(repo_id)
+    commit_hash = index.resolve_revision(repo_id, revision)
+    files = index.get_revision_files(repo_id, commit_hash) if commit_hash else []
+    if not commit_hash or not files:
+        logger.error("%s is not in the cache.", repo_id)
+        return None
+
+    ref = None if commit_hash.startswith(revision) else revision
+    file_names = sorted(f.file_name for f in files)
+    parents = plan_distribution(targets, fanout)
+    started = dict(
+        await _safe_gather(
+            [
+                request.start_pull(t, repo_id, commit_hash, file_names, parents[t], ref)
+                for t in targets
+            ],
+        ),
+    )
+
+    statuses: Dict[Peer, PullStatus] = {
+        t: started.get(t) or PullStatus(PULL_FAILED, len(files), 0, 0, "Unreachable")
+        for t in targets
+    }
+    misses: Dict[Peer, int] = {t: 0 for t in targets}
+    while not all(s.finished for s in statuses.values()):
+        await asyncio.sleep(DISTRIBUTE_POLL_SEC)
+        running = [t for t, s in statuses.items() if not s.finished]
+        results = await _safe_gather(
+            [request.get_pull_status(t, repo_id, commit_hash) for t in running],
+        )
+        for peer, status in results:
+            if status is not None:
+                misses[peer] = 0
+                statuses[peer] = status
+                continue
+            misses[peer] += 1
+            if misses[peer] >= DISTRIBUTE_MAX_MISSES:
+                statuses[peer] = PullStatus(
+                    PULL_FAILED,
+                    len(files),
+                    0,
+                    0,
+                    "Not answering",
+                )
+        if report is not None:
+            report(statuses)
+    return statuses
 
 
 @dataclass
@@ -266,59 +814,11 @@ def repo_list() -> List[RepoInfo]:
     ]
 
 
-def _is_relative_to(child: Path, parent: Path) -> bool:
-    try:
-        _ = child.relative_to(parent)
-    except ValueError:
-        return False
-    return True
-
-
-def _rm_file(fp: Path, root_path: Path) -> None:
-    if not fp.relative_to(root_path):
-        logger.debug(
-            "Cache structure error: path=%s, root=%s",
-            str(fp),
-            str(root_path),
-        )
-        raise ValueError
-
-    # remove target file
-    if fp.exists() and fp.is_file():
-        fp.unlink()
-
-    # remove parent directories if empty up to root_path
-    parent_dir = fp.parent
-    while _is_relative_to(parent_dir, root_path):
-        if not any(parent_dir.iterdir()):
-            parent_dir.rmdir()
-            parent_dir = parent_dir.parent
-        else:
-            break
-
-
-def _can_delete_blob(
-    file_name: str,
-    snapshot_path: Path,
-    blob_path: Path,
-) -> bool:
-    """Delete blob only if there is NO symlink pointing to it."""
-    if not snapshot_path.exists():
-        # delete blob if snapshot path is not existing
-        return True
-
-    for snapshot_dir in snapshot_path.iterdir():
-        snapshot_file = snapshot_dir / file_name
-        if (
-            snapshot_file.exists()
-            and snapshot_file.is_symlink()
-            and (snapshot_file.resolve() == blob_path)
-        ):
-            # there is still symlink pointing to the blob file
-            # don't delete the blob
-            return False
-
-    return True
+def _repo_index(repo_id: str) -> CacheIndex:
+    """Scan only the repo, once for a whole removal."""
+    index = CacheIndex(HfmcContext.get_model_dir())
+    index.refresh_repo(repo_id)
+    return index
 
 
 def file_rm(
@@ -327,76 +827,55 @@ def file_rm(
     revision: str,
 ) -> bool:
     """Remove target model file."""
-    try:
-        repo = hf_wrapper.get_repo_info(repo_id)
-        rev = hf_wrapper.get_revision_info(repo_id, revision)
-        f = hf_wrapper.get_file_info(repo_id, revision, file_name)
-
-        if not repo or not rev or not f:
-            logger.info(
-                "Repo or file not found: repo=%s, file=%s, rev=%s",
-                repo_id,
-                file_name,
-                revision,
-            )
-            return False
-
-        # remove snapshot file
-        _rm_file(f.file_path, repo.repo_path / "snapshots")
-
-        # remove blob file
-        # blob path and file path are the same on windows
-        if f.blob_path != f.file_path and (
-            _can_delete_blob(
-                file_name,
-                repo.repo_path / "snapshots",
-                f.blob_path,
-            )
-        ):
-            _rm_file(f.blob_path, repo.repo_path / "blobs")
-
-        # if the snapshot dir is not longer existing, it means that the
-        # revision is deleted entirely, hence all the refs pointing to
-        # the revision should be deleted
-        ref_dir = repo.repo_path / "refs"
-        if not rev.snapshot_path.exists() and ref_dir.exists():
-            ref_files = [ref_dir / ref for ref in rev.refs]
-            for ref in ref_files:
-                _rm_file(ref, ref_dir)
-
-        # remove model repo directory if empty
-        if not any(repo.repo_path.iterdir()):
-            repo.repo_path.rmdir()
-    except (OSError, ValueError):
+    index = _repo_index(repo_id)
+    f = index.get_file(repo_id, revision, file_name)
+    if f is None:
+        logger.info(
+            "Repo or file not found: repo=%s, file=%s, rev=%s",
+            repo_id,
+            file_name,
+            revision,
+        )
         return False
 
+    try:
+        remover = CacheRemover(index)
+        remover.remove([f])
+        remover.finish()
+    except (OSError, ValueError, sqlite3.Error):
+        return False
     return True
 
 
 def repo_rm(repo_id: str, revision: str | None) -> bool:
-    """Remove target repo."""
-    try:
-        repo = hf_wrapper.get_repo_info(repo_id)
-        if not repo:
-            return True
-
-        for rev in repo.revisions:
-            if (
-                revision
-                and revision not in rev.refs
-                and not rev.commit_hash.startswith(revision)
-            ):
-                continue
+    """Remove target repo, or a revision of it.
+
+    The repo is scanned once, and blobs no other revision links to are
+    removed along with the snapshots.
+    """
+    index = _repo_index(repo_id)
+    repo = index.get_repo(repo_id)
+    if repo is None:
+        return True
 
-            # remove snapshot files
-            for f in rev.files:
-                file_rm(
-                    repo_id,
-                    str(f.file_path.relative_to(rev.snapshot_path)),
-                    rev.commit_hash,
-                )
+    if revision:
+        commit_hash = index.resolve_revision(repo_id, revision)
+        if commit_hash is None:
+            return True
+        files = index.get_revision_files(repo_id, commit_hash)
+    else:
+        files = list(repo.files.values())
 
-    except (OSError, ValueError):
+    try:
+        remover = CacheRemover(index)
+        remover.remove(files)
+        result = remover.finish()
+    except (OSError, ValueError, sqlite3.Error):
         return False
-
+    logger.debug(
+        "Removed %d files and %d blobs of %s",
+        result.nb_files,
+        result.nb_blobs,
+        repo_id,
+    )
     return True
@@ -39,10 +39,14 @@ async def rm(ip: str, port: int) -> None:
 
 
 async def get() -> List[tuple[Peer, bool]]:
-    """Get all peers with liveness info."""
+    """Get all peers with liveness info.
+
+    Alive peers learned by gossip are listed after the configured ones.
+    """
     peers = config_manager.get_config(HfmcConfigOption.PEERS, List[Peer])
 
     # get_alive_peers uses Peer in HfmcContext intead of Peer in HfmcConfig
     alives = {Peer(ip=p.ip, port=p.port) for p in await request.get_alive_peers()}
+    learned = sorted(alives - set(peers), key=lambda p: (p.ip, p.port))
 
-    return [(peer, peer in alives) for peer in peers]
+    return [(peer, peer in alives) for peer in peers] + [(p, True) for p in learned]
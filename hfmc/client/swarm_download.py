@@ -0,0 +1,218 @@
+"""Download a single file from several peers at the same time.
+
+The file is split into chunks which are fetched with range requests.
+Every peer has a worker taking the next pending chunk once it finishes
+one, so faster peers fetch more chunks. When no chunk is pending, idle
+workers also fetch chunks still in flight on slower peers, and the
+first copy to arrive wins. Chunks are written in place into a file of
+the final size.
+
+A download can resume a file whose first bytes are already downloaded,
+and a failed download reports how many bytes from the start are valid,
+so the file can be kept to be resumed later.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import IO, TYPE_CHECKING, Deque, Dict, List
+
+import aiohttp
+
+from hfmc.client import http_request as request
+from hfmc.utils.size import format_size
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from hfmc.client.download_scheduler import EndpointLimiter
+    from hfmc.common.peer import Peer
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 2**20  # 16 MB
+SWARM_MIN_SIZE = 4 * CHUNK_SIZE  # smaller files are fetched from one peer
+MAX_PEER_ERRORS = 2  # a peer is dropped after this many failed chunks
+MAX_CHUNK_WORKERS = 2  # workers fetching the same chunk at the end
+BUF_SIZE = 2**20
+
+
+@dataclass
+class _Chunk:
+    first: int = field()
+    last: int = field()
+    done: bool = field(default=False)
+    workers: int = field(default=0)
+
+
+def _write_at(f: IO[bytes], offset: int, buf: bytes) -> None:
+    f.seek(offset)
+    f.write(buf)
+
+
+class SwarmDownload:
+    """Download a file from peers in parallel."""
+
+    _repo_id: str
+    _file_name: str
+    _commit_hash: str
+    _size: int
+    _path: Path
+    _peers: List[Peer]
+    _limiter: EndpointLimiter
+    _chunks: List[_Chunk]
+    _pending: Deque[_Chunk]
+    _nb_done: int
+    _peer_bytes: Dict[Peer, int]
+    _elapsed: float
+
+    def __init__(  # noqa: PLR0913
+        self,
+        repo_id: str,
+        file_name: str,
+        commit_hash: str,
+        size: int,
+        path: Path,
+        peers: List[Peer],
+        limiter: EndpointLimiter,
+        offset: int = 0,
+    ) -> None:
+        """Init SwarmDownload writing the file into path.
+
+        Bytes before offset are already in the file.
+        """
+        self._repo_id = repo_id
+        self._file_name = file_name
+        self._commit_hash = commit_hash
+        self._size = size
+        self._path = path
+        self._peers = peers
+        self._limiter = limiter
+        self._chunks = [
+            _Chunk(first, min(first + CHUNK_SIZE, size) - 1)
+            for first in range(0, size, CHUNK_SIZE)
+        ]
+        for chunk in self._chunks:
+            chunk.done = chunk.last < offset
+        self._pending = deque(c for c in self._chunks if not c.done)
+        self._nb_done = len(self._chunks) - len(self._pending)
+        self._peer_bytes = {}
+        self._elapsed = 0.0
+
+    @property
+    def done(self) -> bool:
+        """Whether all chunks are downloaded."""
+        return self._nb_done == len(self._chunks)
+
+    @property
+    def valid_size(self) -> int:
+        """Number of bytes downloaded from the start of the file."""
+        for chunk in self._chunks:
+            if not chunk.done:
+                return chunk.first
+        return self._size
+
+    def peer_throughputs(self) -> Dict[Peer, float]:
+        """Get the speed of every peer in B/s, after run() returns."""
+        elapsed = max(self._elapsed, 1e-6)
+        return {peer: n / elapsed for peer, n in self._peer_bytes.items()}
+
+    def _next_chunk(self) -> _Chunk | None:
+        while self._pending:
+            chunk = self._pending.popleft()
+            if not chunk.done:
+                return chunk
+
+        # nothing pending, help with the chunks still in flight
+        in_flight = [
+            c for c in self._chunks if not c.done and 0 < c.workers < MAX_CHUNK_WORKERS
+        ]
+        return min(in_flight, key=lambda c: c.workers, default=None)
+
+    async def _fetch_chunk(self, peer: Peer, chunk: _Chunk, f: IO[bytes]) -> bool:
+        loop = asyncio.get_running_loop()
+        endpoint = f"http://{peer.ip}:{peer.port}"
+        content_range = f"bytes {chunk.first}-{chunk.last}/{self._size}"
+
+        async with self._limiter.slot(endpoint), request.get_file_range(
+            peer,
+            self._repo_id,
+            self._file_name,
+            self._commit_hash,
+            chunk.first,
+            chunk.last,
+        ) as resp:
+            if resp.status != 206 or resp.headers.get("Content-Range") != content_range:
+                logger.debug("Bad range response from %s: %s", endpoint, resp.status)
+                return False
+
+            offset = chunk.first
+            async for buf in resp.content.iter_chunked(BUF_SIZE):
+                if chunk.done:
+                    # another peer has fetched this chunk
+                    return True
+                await loop.run_in_executor(None, _write_at, f, offset, buf)
+                offset += len(buf)
+                self._peer_bytes[peer] = self._peer_bytes.get(peer, 0) + len(buf)
+
+            return offset == chunk.last + 1
+
+    async def _worker(self, peer: Peer) -> None:
+        errors = 0
+        with self._path.open("r+b") as f:
+            while errors < MAX_PEER_ERRORS:
+                chunk = self._next_chunk()
+                if chunk is None:
+                    return
+
+                chunk.workers += 1
+                try:
+                    success = await self._fetch_chunk(peer, chunk, f)
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                    logger.debug("Failed to fetch chunk from %s: %s", peer, e)
+                    success = False
+                finally:
+                    chunk.workers -= 1
+
+                if success and not chunk.done:
+                    chunk.done = True
+                    self._nb_done += 1
+                elif not success:
+                    errors += 1
+                    if not chunk.done and chunk.workers == 0:
+                        self._pending.appendleft(chunk)
+
+        logger.info("Stop downloading from %s:%d, too many errors", peer.ip, peer.port)
+
+    async def run(self) -> bool:
+        """Download the file, return True if all chunks are downloaded."""
+        with self._path.open("ab") as f:
+            # keep the downloaded bytes, extend to the final size
+            f.truncate(self._size)
+
+        logger.info(
+            "Downloading %s (%s) from %d peers.",
+            self._file_name,
+            format_size(self._size),
+            len(self._peers),
+        )
+        start = time.monotonic()
+        workers = [self._worker(peer) for peer in self._peers]
+        await asyncio.gather(*workers)
+        self._elapsed = time.monotonic() - start
+
+        if not self.done:
+            logger.info("Failed to download %s from peers.", self._file_name)
+            return False
+
+        logger.info(
+            "Downloaded %s from %d peers at %s/s.",
+            self._file_name,
+            len(self._peers),
+            format_size(self._size / max(self._elapsed, 1e-6)),
+        )
+        return True
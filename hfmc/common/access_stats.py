@@ -0,0 +1,101 @@
+"""Record when blobs are used, to evict the least useful ones first.
+
+A blob is used when it is added to the cache, and every time the daemon
+sends it to a peer. The daemon and clients share the stats in the
+metadata store.
+
+Accesses are counted in memory and written in a single batch at most
+every {FLUSH_SEC} seconds, and when a command exits. In the daemon they
+are written by an executor thread, not to block the event loop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Tuple
+
+from hfmc.common import metadata_store
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SEC = 10.0
+
+_pending: Dict[str, BlobAccess] = {}
+_last_flush = 0.0
+
+
+@dataclass
+class BlobAccess:
+    """When a blob was used last, and how many times."""
+
+    last_access: float = field()
+    hits: int = field(default=0)
+
+
+def record_access(etag: str, hit: bool = True) -> None:
+    """Record a use of a blob, counted as a hit unless hit is false."""
+    access = _pending.setdefault(etag, BlobAccess(last_access=0.0))
+    access.last_access = time.time()
+    if hit:
+        access.hits += 1
+    if time.monotonic() - _last_flush > FLUSH_SEC:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            flush()
+        else:
+            _flush_in_executor(loop)
+
+
+def _take_pending() -> Dict[str, Tuple[float, int]]:
+    global _last_flush  # noqa: PLW0603
+    _last_flush = time.monotonic()
+    accesses = {etag: (a.last_access, a.hits) for etag, a in _pending.items()}
+    _pending.clear()
+    return accesses
+
+
+def _save(accesses: Dict[str, Tuple[float, int]]) -> bool:
+    try:
+        metadata_store.add_accesses(accesses)
+    except (OSError, sqlite3.Error) as e:
+        logger.debug("Failed to save access stats: %s", e)
+        return False
+    return True
+
+
+def _flush_in_executor(loop: asyncio.AbstractEventLoop) -> None:
+    """Write accesses without blocking the loop, they are lost on errors."""
+    accesses = _take_pending()
+    if accesses:
+        loop.run_in_executor(None, _save, accesses)
+
+
+def flush() -> None:
+    """Write accesses counted in memory."""
+    accesses = _take_pending()
+    if accesses and not _save(accesses):
+        # keep them for the next flush
+        for etag, (last, hits) in accesses.items():
+            access = _pending.setdefault(etag, BlobAccess(last_access=last))
+            access.last_access = max(access.last_access, last)
+            access.hits += hits
+
+
+def load_stats() -> Dict[str, BlobAccess]:
+    """Get the accesses of all blobs, including ones not written yet."""
+    flush()
+    return {
+        etag: BlobAccess(last_access=last, hits=hits)
+        for etag, (last, hits) in metadata_store.load_accesses().items()
+    }
+
+
+def forget(etags: Iterable[str]) -> None:
+    """Drop the stats of blobs removed from the cache."""
+    flush()
+    metadata_store.remove_accesses(etags)
@@ -7,6 +7,17 @@ ApiType = str
 API_PREFIX: ApiType = "/hfmc_api/{service}"
 
 API_PEERS_PROBE: ApiType = API_PREFIX.format(service="peers/ping")
+API_PEERS_INVENTORY: ApiType = API_PREFIX.format(service="peers/inventory")
+API_PEERS_GOSSIP: ApiType = API_PREFIX.format(service="peers/gossip")
+API_PEERS_PING_REQ: ApiType = API_PREFIX.format(service="peers/ping_req")
+
+# epoch and version of the inventory filter, sent in ping responses
+HEADER_INVENTORY = "X-Hfmc-Inventory"
+# number of files being uploaded, sent in ping responses
+HEADER_UPLOADS = "X-Hfmc-Uploads"
+# sent to peers, a daemon in proxy mode must not fetch missing files for
+# other daemons, or requests would loop between them
+HEADER_NO_PROXY = "X-Hfmc-No-Proxy"
 
 API_DAEMON_RUNNING: ApiType = API_PREFIX.format(service="daemon/status")
 API_DAEMON_STOP: ApiType = API_PREFIX.format(service="daemon/stop")
@@ -16,15 +27,45 @@ API_DAEMON_PEERS_ALIVE: ApiType = API_PREFIX.format(
 API_DAEMON_PEERS_CHANGE: ApiType = API_PREFIX.format(
     service="daemon/peers_change",
 )
+API_DAEMON_CACHE_CHANGE: ApiType = API_PREFIX.format(
+    service="daemon/cache_change/{user}/{model}",
+)
+API_DAEMON_PEER_THROUGHPUT: ApiType = API_PREFIX.format(
+    service="daemon/peer_throughput",
+)
+API_DAEMON_PEERS_WITH_FILE: ApiType = API_PREFIX.format(
+    service="daemon/peers_with_file/{user}/{model}/{revision}",
+)
+API_DAEMON_PEERS_WITH_BLOB: ApiType = API_PREFIX.format(
+    service="daemon/peers_with_blob/{etag}",
+)
 
 API_FETCH_FILE_CLIENT: ApiType = "/{repo}/resolve/{revision}/{file_name}"
 API_FETCH_FILE_DAEMON: ApiType = "/{user}/{model}/resolve/{revision}/{file_name:.*}"
 API_FETCH_REPO_FILE_LIST: ApiType = API_PREFIX.format(
     service="fetch/repo_file_list/{user}/{model}/{revision}"
 )
+API_FETCH_REPO_META: ApiType = API_PREFIX.format(
+    service="fetch/repo_meta/{user}/{model}/{revision}"
+)
+API_FETCH_FILES_META: ApiType = API_PREFIX.format(
+    service="fetch/files_meta/{user}/{model}/{revision}"
+)
+# a file by its content, whatever repo and revision it is cached for
+API_FETCH_BLOB: ApiType = API_PREFIX.format(service="blob/{etag}")
+
+# start a job pulling a revision from a parent daemon (POST), or get its
+# progress (GET)
+API_DISTRIBUTE_PULL: ApiType = API_PREFIX.format(
+    service="distribute/pull/{user}/{model}/{revision}"
+)
 
 
 # timeout in sec
 TIMEOUT_PEERS = ClientTimeout(total=10)
+# a probe holds a slot of the prober, give up on dead peers early
+TIMEOUT_PROBE = ClientTimeout(total=3)
 TIMEOUT_DAEMON = ClientTimeout(total=2)
 TIMEOUT_FETCH = ClientTimeout(total=30)
+# no limit on the total time of a download, only on stalls
+TIMEOUT_DOWNLOAD = ClientTimeout(total=None, sock_connect=10, sock_read=60)
@@ -0,0 +1,82 @@
+"""Share identical blobs across repos and revisions of the cache.
+
+huggingface_hub keeps blobs per repo, so shards of a base model cached
+for several fine-tunes take the disk space several times. The store
+keeps a hard link to every blob by its etag, which is a hash of the
+content:
+
+    store/{etag}
+
+A blob in the store is linked into other repos instead of being
+downloaded again. Blobs are never modified in place, so repos can share
+the same inode.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+from typing import TYPE_CHECKING
+
+from hfmc.common.context import HfmcContext
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LINK_SUFFIX = ".link"
+
+# sha1 of regular files and sha256 of LFS files
+etag_re = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+
+
+def get_store_path(etag: str) -> Path:
+    """Get the path of a blob in the store."""
+    return HfmcContext.get_store_dir() / etag
+
+
+def is_same_file(path: Path, other: Path) -> bool:
+    """Check if two paths are links to the same inode."""
+    stat, other_stat = path.stat(), other.stat()
+    return (stat.st_dev, stat.st_ino) == (other_stat.st_dev, other_stat.st_ino)
+
+
+def replace_with_link(src: Path, dst: Path) -> None:
+    """Replace dst with a hard link to src, readers of dst see either."""
+    tmp_path = dst.with_name(dst.name + LINK_SUFFIX)
+    tmp_path.unlink(missing_ok=True)
+    os.link(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def store_blob(blob_path: Path, etag: str) -> None:
+    """Keep a link to a blob in the store, unless the etag is stored."""
+    store_path = get_store_path(etag)
+    if store_path.exists():
+        return
+    try:
+        store_path.parent.mkdir(parents=True, exist_ok=True)
+        os.link(blob_path, store_path)
+    except FileExistsError:
+        # stored by another process meanwhile
+        pass
+    except OSError as e:
+        # i.e. hard links are not supported by the file system
+        logger.debug("Failed to store blob %s: %s", etag, e)
+
+
+def link_blob(etag: str, blob_path: Path) -> bool:
+    """Link the stored blob of etag to blob_path, False if not stored."""
+    store_path = get_store_path(etag)
+    if not store_path.exists():
+        return False
+    try:
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        replace_with_link(store_path, blob_path)
+    except OSError as e:
+        logger.debug("Failed to link stored blob %s: %s", etag, e)
+        return False
+    logger.debug("Linked stored blob %s to %s", etag, blob_path)
+    return True
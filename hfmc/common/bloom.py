@@ -0,0 +1,83 @@
+"""Bloom filter to tell compactly which keys a set probably holds."""
+
+from __future__ import annotations
+
+import hashlib
+import math
+from typing import Iterable, List
+
+
+class BloomFilter:
+    """A Bloom filter with {nb_hashes} bits set per key.
+
+    A key which is added is always found, and a key which is not added is
+    found with a probability of about the false positive rate it is sized
+    for. Keys can't be removed, a filter is rebuilt instead.
+    """
+
+    _nb_bits: int
+    _nb_hashes: int
+    _bits: bytearray
+
+    def __init__(self, nb_bits: int, nb_hashes: int, bits: bytes = b"") -> None:
+        """Init an empty filter, or load it from the bits of another one."""
+        self._nb_bits = max(nb_bits, 8)
+        self._nb_hashes = max(nb_hashes, 1)
+        nb_bytes = (self._nb_bits + 7) // 8
+        if bits and len(bits) != nb_bytes:
+            raise ValueError
+        self._bits = bytearray(bits) if bits else bytearray(nb_bytes)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, fp_rate: float = 0.01) -> BloomFilter:
+        """Create a filter holding {capacity} keys at the false positive rate."""
+        capacity = max(capacity, 1)
+        nb_bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+        nb_hashes = round(nb_bits / capacity * math.log(2))
+        return cls(nb_bits, nb_hashes)
+
+    @property
+    def nb_bits(self) -> int:
+        """Size of the filter in bits."""
+        return self._nb_bits
+
+    @property
+    def nb_hashes(self) -> int:
+        """Number of bits set per key."""
+        return self._nb_hashes
+
+    def positions(self, key: str) -> List[int]:
+        """Get the bit positions of a key."""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self._nb_bits for i in range(self._nb_hashes)]
+
+    def add(self, key: str) -> List[int]:
+        """Add a key, return the bit positions newly set."""
+        added = []
+        for pos in self.positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                added.append(pos)
+        return added
+
+    def set_bits(self, positions: Iterable[int]) -> None:
+        """Set bits at positions, i.e. to apply a delta of another filter."""
+        for pos in positions:
+            if 0 <= pos < self._nb_bits:
+                byte, bit = divmod(pos, 8)
+                self._bits[byte] |= 1 << bit
+
+    def __contains__(self, key: str) -> bool:
+        """Check if the key is probably added."""
+        for pos in self.positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self._bits[byte] & (1 << bit):
+                return False
+        return True
+
+    def to_bytes(self) -> bytes:
+        """Get the bits of the filter."""
+        return bytes(self._bits)
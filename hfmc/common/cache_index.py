@@ -0,0 +1,437 @@
+"""In-memory index of the model cache.
+
+huggingface_hub.scan_cache_dir walks and stats the whole cache on every
+call, which is too slow to run per request in the daemon. CacheIndex
+scans the cache once with os.scandir, and then it is kept up to date by
+rescanning only the repo that changed.
+
+Files being downloaded are indexed as well, so they can be relayed to
+peers before they are complete.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Set, Tuple
+
+from hfmc.common import metadata_store
+
+if TYPE_CHECKING:
+    from hfmc.common.hf_cache import PartialFile
+
+logger = logging.getLogger(__name__)
+
+REPO_FOLDER_PREFIX = "models--"
+REPO_ID_SEPARATOR = "--"
+
+
+def repo_folder_name(repo_id: str) -> str:
+    """Get the cache folder name of a model repo."""
+    return REPO_FOLDER_PREFIX + repo_id.replace("/", REPO_ID_SEPARATOR)
+
+
+def repo_id_of_folder(folder_name: str) -> str | None:
+    """Get the repo id of a cache folder, None if it is not a model repo."""
+    if not folder_name.startswith(REPO_FOLDER_PREFIX):
+        return None
+    return folder_name[len(REPO_FOLDER_PREFIX) :].replace(REPO_ID_SEPARATOR, "/")
+
+
+@dataclass
+class CachedFile:
+    """A file in a snapshot of the cache."""
+
+    repo_id: str = field()
+    commit_hash: str = field()
+    file_name: str = field()
+    file_path: Path = field()
+    blob_path: Path = field()
+    size: int = field()
+    etag: str | None = field()
+
+
+@dataclass
+class CachedRepo:
+    """Refs and files of a repo in the cache."""
+
+    repo_id: str = field()
+    repo_path: Path = field()
+    refs: Dict[str, str] = field(default_factory=dict)
+    # (commit hash, file name) -> file
+    files: Dict[Tuple[str, str], CachedFile] = field(default_factory=dict)
+    commits: Dict[str, List[CachedFile]] = field(default_factory=dict)
+    # etag -> a file having the content
+    blobs: Dict[str, CachedFile] = field(default_factory=dict)
+    # (commit hash, file name) -> file being downloaded in order
+    partials: Dict[Tuple[str, str], PartialFile] = field(default_factory=dict)
+    scan_time: float = field(default=0.0)
+
+
+def _walk_files(dir_path: str, prefix: str = "") -> Iterator[Tuple[str, os.DirEntry]]:
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            name = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path, name + "/")
+            else:
+                yield name, entry
+
+
+def _read_refs(repo_path: Path) -> Dict[str, str]:
+    refs: Dict[str, str] = {}
+    ref_dir = repo_path / "refs"
+    if not ref_dir.is_dir():
+        return refs
+    for ref, entry in _walk_files(str(ref_dir)):
+        try:
+            refs[ref] = Path(entry.path).read_text().strip()
+        except OSError:
+            logger.debug("Failed to read ref: %s", entry.path)
+    return refs
+
+
+class CacheIndex:
+    """Index of cached files keyed by repo, revision and file name."""
+
+    _model_dir: Path
+    _repos: Dict[str, CachedRepo]
+    # etag -> a file having the content, in any repo
+    _blobs: Dict[str, CachedFile]
+    # etag -> a file being downloaded in order, in any repo
+    _blob_partials: Dict[str, PartialFile]
+    _misses: Dict[str, float]
+    _listeners: List[Callable[[str], None]]
+
+    # a missing repo or file is rescanned at most once in RESCAN_SEC,
+    # in case it was added without notifying the daemon
+    RESCAN_SEC = 10
+
+    def __init__(self, model_dir: Path) -> None:
+        """Init an empty index, call build() to fill it."""
+        self._model_dir = model_dir
+        self._repos = {}
+        self._blobs = {}
+        self._blob_partials = {}
+        self._misses = {}
+        self._listeners = []
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """Call listener with the repo id after a repo is rescanned."""
+        self._listeners.append(listener)
+
+    def build(self) -> None:
+        """Scan the whole cache."""
+        repos: Dict[str, CachedRepo] = {}
+        if self._model_dir.is_dir():
+            with os.scandir(self._model_dir) as it:
+                for entry in it:
+                    repo_id = repo_id_of_folder(entry.name)
+                    if repo_id and entry.is_dir():
+                        repos[repo_id] = self._scan_repo(repo_id, Path(entry.path))
+        self._repos = repos
+        self._blobs = {}
+        self._blob_partials = {}
+        for repo in repos.values():
+            self._index_blobs(None, repo)
+        self._misses = {}
+        logger.debug(
+            "Cache index is built: %d repos, %d files",
+            len(repos),
+            sum(len(r.files) for r in repos.values()),
+        )
+
+    def refresh_repo(self, repo_id: str) -> None:
+        """Rescan a single repo after it is changed."""
+        repo_path = self._model_dir / repo_folder_name(repo_id)
+        new = self._scan_repo(repo_id, repo_path) if repo_path.is_dir() else None
+        self._set_repo(repo_id, new)
+
+    def _set_repo(self, repo_id: str, new: CachedRepo | None) -> None:
+        old = self._repos.get(repo_id)
+        if new is not None:
+            self._repos[repo_id] = new
+            self._misses.pop(repo_id, None)
+        else:
+            self._repos.pop(repo_id, None)
+            self._add_miss(repo_id, time.monotonic())
+        self._index_blobs(old, new)
+
+        for listener in self._listeners:
+            listener(repo_id)
+
+    def _add_miss(self, repo_id: str, now: float) -> None:
+        """Remember a missing repo, misses are keyed by ids of any request."""
+        # older misses don't hold back a rescan anymore, drop them in order
+        while self._misses:
+            oldest = next(iter(self._misses))
+            if now - self._misses[oldest] < self.RESCAN_SEC:
+                break
+            del self._misses[oldest]
+        self._misses.pop(repo_id, None)
+        self._misses[repo_id] = now
+
+    def _index_blobs(self, old: CachedRepo | None, new: CachedRepo | None) -> None:
+        """Update the etag maps after a repo is rescanned or removed."""
+        dropped: Set[str] = set()
+        dropped_partials: Set[str] = set()
+        if old is not None:
+            for etag, cached in old.blobs.items():
+                if self._blobs.get(etag) is cached:
+                    del self._blobs[etag]
+                    dropped.add(etag)
+            for partial in old.partials.values():
+                if self._blob_partials.get(partial.etag) is partial:
+                    del self._blob_partials[partial.etag]
+                    dropped_partials.add(partial.etag)
+        if new is not None:
+            for etag, cached in new.blobs.items():
+                self._blobs.setdefault(etag, cached)
+            for partial in new.partials.values():
+                self._blob_partials.setdefault(partial.etag, partial)
+
+        # other repos may have the content of the dropped etags
+        dropped -= self._blobs.keys()
+        dropped_partials -= self._blob_partials.keys()
+        if not dropped and not dropped_partials:
+            return
+        for repo in self._repos.values():
+            for etag in dropped & repo.blobs.keys():
+                self._blobs.setdefault(etag, repo.blobs[etag])
+            for partial in repo.partials.values():
+                if partial.etag in dropped_partials:
+                    self._blob_partials.setdefault(partial.etag, partial)
+
+    def _scan_partials(
+        self,
+        repo_id: str,
+        repo_path: Path,
+    ) -> Dict[Tuple[str, str], PartialFile]:
+        # pylint: disable=import-outside-toplevel
+        from hfmc.common import hf_cache  # cyclic import
+
+        partials: Dict[Tuple[str, str], PartialFile] = {}
+        blob_dir = repo_path / "blobs"
+        suffix = hf_cache.INCOMPLETE_SUFFIX + hf_cache.SIDECAR_SUFFIX
+        if not blob_dir.is_dir():
+            return partials
+
+        with os.scandir(blob_dir) as it:
+            etags = [e.name[: -len(suffix)] for e in it if e.name.endswith(suffix)]
+        for etag in etags:
+            partial = hf_cache.load_partial(repo_id, etag)
+            # bytes of a file written out of order can't be read before the end
+            if partial and partial.sequential:
+                partials[(partial.commit_hash, partial.file_name)] = partial
+        return partials
+
+    def _scan_repo(self, repo_id: str, repo_path: Path) -> CachedRepo:
+        repo = CachedRepo(
+            repo_id=repo_id,
+            repo_path=repo_path,
+            refs=_read_refs(repo_path),
+            partials=self._scan_partials(repo_id, repo_path),
+            scan_time=time.monotonic(),
+        )
+
+        snapshot_dir = repo_path / "snapshots"
+        if not snapshot_dir.is_dir():
+            return repo
+
+        with os.scandir(snapshot_dir) as it:
+            snapshots = [e for e in it if e.is_dir()]
+
+        saved_etags: Dict[str, str] | None = None
+        for snapshot in snapshots:
+            commit_files = repo.commits.setdefault(snapshot.name, [])
+            for file_name, entry in _walk_files(snapshot.path):
+                file_path = Path(entry.path)
+                try:
+                    if entry.is_symlink():
+                        # cheaper than realpath, which stats every parent
+                        target = os.path.join(
+                            os.path.dirname(entry.path),
+                            os.readlink(entry.path),
+                        )
+                        blob_path = Path(os.path.normpath(target))
+                    else:
+                        blob_path = file_path
+                    size = entry.stat().st_size
+                except OSError:
+                    # dangling symlink
+                    continue
+
+                if blob_path != file_path:
+                    # blobs are named by their etags
+                    etag: str | None = blob_path.name
+                else:
+                    # no symlinks (i.e. on Windows), load etags saved by HFMC
+                    if saved_etags is None:
+                        saved_etags = metadata_store.load_etags(repo_path.name)
+                    rel_path = file_path.relative_to(self._model_dir).as_posix()
+                    etag = saved_etags.get(rel_path)
+
+                cached = CachedFile(
+                    repo_id=repo_id,
+                    commit_hash=snapshot.name,
+                    file_name=file_name,
+                    file_path=file_path,
+                    blob_path=blob_path,
+                    size=size,
+                    etag=etag,
+                )
+                repo.files[(snapshot.name, file_name)] = cached
+                commit_files.append(cached)
+                if cached.etag:
+                    repo.blobs[cached.etag] = cached
+
+        return repo
+
+    def _rescan_on_miss(self, repo_id: str) -> bool:
+        """Rescan a repo if it is not rescanned recently.
+
+        Return True if the repo is rescanned already. On the event loop of
+        the daemon, the repo is rescanned by an executor, and later
+        requests find the files.
+        """
+        now = time.monotonic()
+        repo = self._repos.get(repo_id)
+        last_scan = repo.scan_time if repo else self._misses.get(repo_id, 0.0)
+        if last_scan and now - last_scan < self.RESCAN_SEC:
+            return False
+        repo_path = self._model_dir / repo_folder_name(repo_id)
+        if repo is None and not repo_path.is_dir():
+            self._add_miss(repo_id, now)
+            return False
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.refresh_repo(repo_id)
+            return True
+        # no other rescan until this one is done
+        if repo is not None:
+            repo.scan_time = now
+        else:
+            self._add_miss(repo_id, now)
+        rescan = loop.run_in_executor(None, self._scan_repo, repo_id, repo_path)
+        rescan.add_done_callback(functools.partial(self._on_rescanned, repo_id))
+        return False
+
+    def _on_rescanned(self, repo_id: str, rescan: asyncio.Future[CachedRepo]) -> None:
+        if rescan.cancelled():
+            return
+        if rescan.exception() is not None:
+            logger.debug("Failed to rescan %s", repo_id, exc_info=rescan.exception())
+            return
+        repo = rescan.result()
+        current = self._repos.get(repo_id)
+        if current is None or current.scan_time <= repo.scan_time:
+            # not refreshed after the rescan began
+            self._set_repo(repo_id, repo)
+
+    def get_repo(self, repo_id: str) -> CachedRepo | None:
+        """Get a repo by repo id."""
+        return self._repos.get(repo_id)
+
+    def get_repos(self) -> List[CachedRepo]:
+        """Get all repos."""
+        return list(self._repos.values())
+
+    def _resolve(self, repo: CachedRepo, revision: str) -> str | None:
+        if revision in repo.refs:
+            return repo.refs[revision]
+        if revision in repo.commits:
+            return revision
+        for commit in repo.commits:
+            if commit.startswith(revision):
+                return commit
+        return None
+
+    def resolve_revision(self, repo_id: str, revision: str) -> str | None:
+        """Get the commit hash of a ref or a (short) commit hash."""
+        repo = self._repos.get(repo_id)
+        commit = self._resolve(repo, revision) if repo else None
+        if commit is None and self._rescan_on_miss(repo_id):
+            repo = self._repos.get(repo_id)
+            commit = self._resolve(repo, revision) if repo else None
+        return commit
+
+    def get_file(
+        self,
+        repo_id: str,
+        revision: str,
+        file_name: str,
+    ) -> CachedFile | None:
+        """Get a file by repo id, revision and file name."""
+        cached = self._lookup(repo_id, revision, file_name)
+        if (cached is None or not cached.file_path.exists()) and (
+            self._rescan_on_miss(repo_id)
+        ):
+            cached = self._lookup(repo_id, revision, file_name)
+        return cached
+
+    def _lookup(
+        self,
+        repo_id: str,
+        revision: str,
+        file_name: str,
+    ) -> CachedFile | None:
+        repo = self._repos.get(repo_id)
+        if not repo:
+            return None
+        commit = self._resolve(repo, revision)
+        if not commit:
+            return None
+        return repo.files.get((commit, file_name))
+
+    def get_partial(
+        self,
+        repo_id: str,
+        revision: str,
+        file_name: str,
+    ) -> PartialFile | None:
+        """Get a file being downloaded by repo id, revision and file name."""
+        repo = self._repos.get(repo_id)
+        commit = self._resolve(repo, revision) if repo else None
+        if repo is None or commit is None:
+            return None
+        return repo.partials.get((commit, file_name))
+
+    def get_revision_partials(self, repo_id: str, revision: str) -> List[PartialFile]:
+        """Get all files of a revision being downloaded."""
+        repo = self._repos.get(repo_id)
+        commit = self._resolve(repo, revision) if repo else None
+        if repo is None or commit is None:
+            return []
+        return [p for (c, _), p in repo.partials.items() if c == commit]
+
+    def get_blob(self, etag: str) -> CachedFile | None:
+        """Get a file having the content of etag, in any repo."""
+        cached = self._blobs.get(etag)
+        if cached is None or cached.file_path.exists():
+            return cached
+        # removed without notifying the daemon, try the other repos
+        for repo in self._repos.values():
+            cached = repo.blobs.get(etag)
+            if cached is not None and cached.file_path.exists():
+                self._blobs[etag] = cached
+                return cached
+        return None
+
+    def get_blob_partial(self, etag: str) -> PartialFile | None:
+        """Get a file being downloaded having the content of etag."""
+        return self._blob_partials.get(etag)
+
+    def get_revision_files(self, repo_id: str, revision: str) -> List[CachedFile]:
+        """Get all files of a revision."""
+        commit = self.resolve_revision(repo_id, revision)
+        repo = self._repos.get(repo_id)
+        if not commit or not repo:
+            return []
+        return list(repo.commits.get(commit, []))
@@ -0,0 +1,181 @@
+"""Remove files of the cache in bulk.
+
+Removing a file one by one requires to know whether other snapshots
+still link to its blob. CacheRemover counts the links to every blob once
+from a CacheIndex, and then removes any number of files: a blob is
+removed with the last snapshot file linking to it. finish() cleans up
+what removed files leave behind, once for all of them: empty snapshot
+dirs, refs of removed revisions, repo dirs left empty, and metadata of
+removed files and revisions in a single transaction.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Set, Tuple
+
+from hfmc.common import access_stats, blob_store, metadata_store
+from hfmc.common.repo_files import remove_file_list, remove_file_lists
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from hfmc.common.cache_index import CachedFile, CacheIndex
+
+
+@dataclass
+class RemovalResult:
+    """What a removal did."""
+
+    nb_files: int = field(default=0)
+    nb_blobs: int = field(default=0)
+    freed: int = field(default=0)
+    repo_ids: Set[str] = field(default_factory=set)
+    # (repo id, commit hash) of revisions without files anymore
+    commits: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def _remove_empty_dirs(root: Path) -> None:
+    """Remove empty dirs under root and root itself, bottom-up."""
+    if not root.is_dir():
+        return
+    for dir_path, _, _ in os.walk(root, topdown=False):
+        try:
+            os.rmdir(dir_path)
+        except OSError:
+            # not empty
+            pass
+
+
+class CacheRemover:
+    """Remove files of the repos of an index, and blobs nothing links to."""
+
+    _index: CacheIndex
+    _links: Dict[Path, int]
+    _touched: Set[Tuple[str, str]]
+    _removed: List[Path]
+    _freed_etags: List[str]
+    result: RemovalResult
+
+    def __init__(self, index: CacheIndex) -> None:
+        """Init CacheRemover, counting links to the blobs of the index."""
+        self._index = index
+        self._links = {}
+        self._touched = set()
+        self._removed = []
+        self._freed_etags = []
+        self.result = RemovalResult()
+        for repo in index.get_repos():
+            for cached in repo.files.values():
+                if cached.blob_path != cached.file_path:
+                    self._links[cached.blob_path] = (
+                        self._links.get(cached.blob_path, 0) + 1
+                    )
+
+    def _remove_blob(self, blob_path: Path, etag: str | None) -> int:
+        """Remove a blob, and its store link if no other repo uses it."""
+        try:
+            st = blob_path.stat()
+        except OSError:
+            return 0
+        blob_path.unlink()
+        self.result.nb_blobs += 1
+
+        nlink = st.st_nlink - 1
+        if etag:
+            store_path = blob_store.get_store_path(etag)
+            if nlink == 1 and store_path.exists():
+                store_stat = store_path.stat()
+                if (store_stat.st_dev, store_stat.st_ino) == (st.st_dev, st.st_ino):
+                    store_path.unlink()
+                    nlink = 0
+            if nlink == 0:
+                self._freed_etags.append(etag)
+        return st.st_size if nlink == 0 else 0
+
+    def remove(self, files: Iterable[CachedFile]) -> int:
+        """Remove snapshot files, and their blobs if unused, return bytes freed.
+
+        The files must be in the index the remover was created with.
+        """
+        freed = 0
+        for cached in files:
+            is_blob = cached.blob_path == cached.file_path
+            if is_blob:
+                # no symlinks (i.e. on Windows), the file is the blob
+                freed += cached.size
+            cached.file_path.unlink(missing_ok=True)
+            self._removed.append(cached.file_path)
+            self._touched.add((cached.repo_id, cached.commit_hash))
+            self.result.repo_ids.add(cached.repo_id)
+            self.result.nb_files += 1
+            if is_blob:
+                continue
+
+            self._links[cached.blob_path] = self._links.get(cached.blob_path, 1) - 1
+            if self._links[cached.blob_path] <= 0:
+                freed += self._remove_blob(cached.blob_path, cached.etag)
+
+        self.result.freed += freed
+        return freed
+
+    def _remove_revision(self, repo_id: str, commit_hash: str) -> None:
+        """Remove refs and the file list of a revision without files."""
+        repo = self._index.get_repo(repo_id)
+        if repo is None:
+            return
+        for ref, commit in repo.refs.items():
+            if commit == commit_hash:
+                (repo.repo_path / "refs" / ref).unlink(missing_ok=True)
+                remove_file_list(repo_id, ref)
+        remove_file_list(repo_id, commit_hash)
+        self.result.commits.append((repo_id, commit_hash))
+
+    def _clean_repo(self, repo_id: str) -> None:
+        """Remove a repo dir if it has no snapshots anymore."""
+        repo = self._index.get_repo(repo_id)
+        if repo is None:
+            return
+        _remove_empty_dirs(repo.repo_path / "refs")
+
+        snapshot_dir = repo.repo_path / "snapshots"
+        if snapshot_dir.exists():
+            return
+        blob_dir = repo.repo_path / "blobs"
+        if blob_dir.is_dir():
+            for path in blob_dir.iterdir():
+                # keep files being downloaded
+                if blob_store.etag_re.match(path.name):
+                    self.result.freed += self._remove_blob(path, path.name)
+        _remove_empty_dirs(repo.repo_path)
+        if not repo.repo_path.exists():
+            remove_file_lists(repo_id)
+
+    def finish(self) -> RemovalResult:
+        """Clean up after removed files, and refresh the index."""
+        with metadata_store.batch():
+            self._finish()
+        for repo_id in sorted(self.result.repo_ids):
+            self._index.refresh_repo(repo_id)
+        access_stats.forget(self._freed_etags)
+        self._touched.clear()
+        self._removed = []
+        self._freed_etags = []
+        return self.result
+
+    def _finish(self) -> None:
+        """Remove what removed files leave behind, the metadata included."""
+        metadata_store.remove_files(self._removed)
+        for repo_id, commit_hash in sorted(self._touched):
+            repo = self._index.get_repo(repo_id)
+            if repo is None:
+                continue
+            snapshot = repo.repo_path / "snapshots" / commit_hash
+            _remove_empty_dirs(snapshot)
+            if not snapshot.exists():
+                self._remove_revision(repo_id, commit_hash)
+            _remove_empty_dirs(repo.repo_path / "snapshots")
+
+        for repo_id in sorted(self.result.repo_ids):
+            self._clean_repo(repo_id)
@@ -9,7 +9,10 @@ from typing import TYPE_CHECKING, List
 from hfmc.common.peer import Peer
 
 if TYPE_CHECKING:
+    from hfmc.common.cache_index import CacheIndex
     from hfmc.config.hfmc_config import HfmcConfig
+    from hfmc.daemon.discovery import LanDiscovery
+    from hfmc.daemon.inventory import Inventory
     from hfmc.daemon.prober import PeerProber
 
 
@@ -23,12 +26,32 @@ class HfmcContext:
     etag_dir: Path = field()
     log_dir: Path = field()
     repo_files_dir: Path = field()
+    store_dir: Path = field()
+    metadata_path: Path = field()
     peers: List[Peer] = field()
+    gossip: bool = field(default=False)
+    discovery: bool = field(default=False)
+    proxy: bool = field(default=False)
     peer_prober: PeerProber | None = field(
         default=None,
         init=False,
         repr=False,
     )
+    cache_index: CacheIndex | None = field(
+        default=None,
+        init=False,
+        repr=False,
+    )
+    inventory: Inventory | None = field(
+        default=None,
+        init=False,
+        repr=False,
+    )
+    lan_discovery: LanDiscovery | None = field(
+        default=None,
+        init=False,
+        repr=False,
+    )
 
     # global context reference
     _instance: HfmcContext | None = field(
@@ -46,16 +69,19 @@ class HfmcContext:
             etag_dir=Path(config.cache_dir) / "etags",
             log_dir=Path(config.cache_dir) / "logs",
             repo_files_dir=Path(config.cache_dir) / "repo_files",
+            store_dir=Path(config.cache_dir) / "store",
+            metadata_path=Path(config.cache_dir) / "metadata.db",
             peers=[Peer(ip=p.ip, port=p.port) for p in config.peers],
+            gossip=config.gossip,
+            discovery=config.discovery,
+            proxy=config.proxy,
         )
         if not cls.get_model_dir().exists():
             cls.get_model_dir().mkdir(parents=True, exist_ok=True)
-        if not cls.get_etag_dir().exists():
-            cls.get_etag_dir().mkdir(parents=True, exist_ok=True)
         if not cls.get_log_dir().exists():
             cls.get_log_dir().mkdir(parents=True, exist_ok=True)
-        if not cls.get_repo_files_dir().exists():
-            cls.get_repo_files_dir().mkdir(parents=True, exist_ok=True)
+        if not cls.get_store_dir().exists():
+            cls.get_store_dir().mkdir(parents=True, exist_ok=True)
         return cls._instance
 
     @classmethod
@@ -79,7 +105,7 @@ class HfmcContext:
 
     @classmethod
     def get_etag_dir(cls) -> Path:
-        """Get etag dir."""
+        """Get the dir of etags saved before the metadata store."""
         if not cls._instance:
             raise ValueError
         return cls._instance.etag_dir
@@ -93,11 +119,25 @@ class HfmcContext:
 
     @classmethod
     def get_repo_files_dir(cls) -> Path:
-        """Get repo file list dir."""
+        """Get the dir of file lists saved before the metadata store."""
         if not cls._instance:
             raise ValueError
         return cls._instance.repo_files_dir
 
+    @classmethod
+    def get_store_dir(cls) -> Path:
+        """Get the dir of blobs shared across repos."""
+        if not cls._instance:
+            raise ValueError
+        return cls._instance.store_dir
+
+    @classmethod
+    def get_metadata_path(cls) -> Path:
+        """Get the path of the metadata store."""
+        if not cls._instance:
+            raise ValueError
+        return cls._instance.metadata_path
+
     @classmethod
     def get_peers(cls) -> List[Peer]:
         """Get peers."""
@@ -105,6 +145,27 @@ class HfmcContext:
             raise ValueError
         return cls._instance.peers
 
+    @classmethod
+    def get_gossip(cls) -> bool:
+        """Get if peers are learned by gossip."""
+        if not cls._instance:
+            raise ValueError
+        return cls._instance.gossip
+
+    @classmethod
+    def get_discovery(cls) -> bool:
+        """Get if peers on the LAN are discovered."""
+        if not cls._instance:
+            raise ValueError
+        return cls._instance.discovery
+
+    @classmethod
+    def get_proxy(cls) -> bool:
+        """Get if missing files are fetched for requesters."""
+        if not cls._instance:
+            raise ValueError
+        return cls._instance.proxy
+
     @classmethod
     def update_peers(
         cls,
@@ -122,6 +183,8 @@ class HfmcContext:
             if peer in peer_map:  # peer match by ip and port
                 peer_map[peer].alive = peer.alive
                 peer_map[peer].epoch = peer.epoch
+                peer_map[peer].rtt = peer.rtt
+                peer_map[peer].throughput = peer.throughput
 
         cls._instance.peers = list(peer_map.values())
 
@@ -149,3 +212,49 @@ class HfmcContext:
         if not cls._instance.peer_prober:
             raise ValueError
         return cls._instance.peer_prober
+
+    @classmethod
+    def set_cache_index(cls, cache_index: CacheIndex) -> None:
+        """Set cache index."""
+        if not cls._instance:
+            raise ValueError
+        cls._instance.cache_index = cache_index
+
+    @classmethod
+    def get_cache_index(cls) -> CacheIndex:
+        """Get cache index."""
+        if not cls._instance:
+            raise ValueError
+        if not cls._instance.cache_index:
+            raise ValueError
+        return cls._instance.cache_index
+
+    @classmethod
+    def set_inventory(cls, inventory: Inventory) -> None:
+        """Set inventory."""
+        if not cls._instance:
+            raise ValueError
+        cls._instance.inventory = inventory
+
+    @classmethod
+    def get_inventory(cls) -> Inventory:
+        """Get inventory."""
+        if not cls._instance:
+            raise ValueError
+        if not cls._instance.inventory:
+            raise ValueError
+        return cls._instance.inventory
+
+    @classmethod
+    def set_lan_discovery(cls, lan_discovery: LanDiscovery) -> None:
+        """Set LAN discovery."""
+        if not cls._instance:
+            raise ValueError
+        cls._instance.lan_discovery = lan_discovery
+
+    @classmethod
+    def get_lan_discovery(cls) -> LanDiscovery | None:
+        """Get LAN discovery, None if discovery is off."""
+        if not cls._instance:
+            raise ValueError
+        return cls._instance.lan_discovery
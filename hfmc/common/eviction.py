@@ -0,0 +1,146 @@
+"""Evict the least useful blobs of the cache.
+
+A blob is the unit of eviction: its content is removed along with every
+snapshot file linking to it, in any repo or revision, so that the space
+is really freed. Blobs are evicted in the order of the policy:
+
+- lru: least recently used first
+- lfu: least frequently used first, least recently used among equals
+
+Blobs never used since the stats exist are ordered by the time they were
+written. Blobs of pinned repos or revisions are never evicted.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import stat
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple
+
+from hfmc.common import access_stats
+from hfmc.common.access_stats import BlobAccess
+from hfmc.common.cache_index import CachedFile, CacheIndex
+from hfmc.common.cache_removal import CacheRemover
+from hfmc.common.context import HfmcContext
+
+logger = logging.getLogger(__name__)
+
+POLICY_LRU = "lru"
+POLICY_LFU = "lfu"
+
+
+@dataclass
+class EvictionResult:
+    """What an eviction did."""
+
+    usage: int = field()
+    nb_blobs: int = field(default=0)
+    freed: int = field(default=0)
+    repo_ids: Set[str] = field(default_factory=set)
+
+
+def cache_usage() -> int:
+    """Get bytes used by the cache, counting linked files once."""
+    inodes: Set[Tuple[int, int]] = set()
+    usage = 0
+    for root in [HfmcContext.get_model_dir(), HfmcContext.get_store_dir()]:
+        for dir_path, _, file_names in os.walk(root):
+            for name in file_names:
+                try:
+                    st = os.lstat(os.path.join(dir_path, name))
+                except OSError:
+                    continue
+                inode = (st.st_dev, st.st_ino)
+                if stat.S_ISREG(st.st_mode) and inode not in inodes:
+                    inodes.add(inode)
+                    usage += st.st_size
+    return usage
+
+
+def parse_pin(pin: str) -> Tuple[str, str | None]:
+    """Split a pin into the repo id and the revision, None for all."""
+    repo_id, _, revision = pin.partition("@")
+    return repo_id, revision or None
+
+
+def _pinned_commits(index: CacheIndex, pins: List[str]) -> Set[Tuple[str, str]]:
+    """Get (repo id, commit hash) of pinned revisions, "" for all."""
+    pinned: Set[Tuple[str, str]] = set()
+    for pin in pins:
+        repo_id, revision = parse_pin(pin)
+        if revision is None:
+            pinned.add((repo_id, ""))
+            continue
+        commit_hash = index.resolve_revision(repo_id, revision)
+        if commit_hash:
+            pinned.add((repo_id, commit_hash))
+    return pinned
+
+
+def _group_blobs(index: CacheIndex) -> Dict[str, List[CachedFile]]:
+    """Group snapshot files by the content they link to."""
+    blobs: Dict[str, List[CachedFile]] = {}
+    for repo in index.get_repos():
+        for cached in repo.files.values():
+            blobs.setdefault(cached.etag or str(cached.blob_path), []).append(cached)
+    return blobs
+
+
+def _priority(
+    key: str,
+    files: List[CachedFile],
+    stats: Dict[str, BlobAccess],
+    policy: str,
+) -> Tuple[float, ...]:
+    access = stats.get(key)
+    if access is None:
+        try:
+            access = BlobAccess(last_access=files[0].blob_path.stat().st_mtime)
+        except OSError:
+            access = BlobAccess(last_access=0.0)
+    if policy == POLICY_LFU:
+        return (access.hits, access.last_access)
+    return (access.last_access,)
+
+
+def evict(target: int, policy: str, pins: List[str]) -> EvictionResult:
+    """Evict blobs until the cache uses at most target bytes."""
+    result = EvictionResult(usage=cache_usage())
+    if result.usage <= target:
+        return result
+
+    index = CacheIndex(HfmcContext.get_model_dir())
+    index.build()
+    stats = access_stats.load_stats()
+    pinned = _pinned_commits(index, pins)
+    candidates = [
+        (key, files)
+        for key, files in _group_blobs(index).items()
+        if not any(
+            (f.repo_id, "") in pinned or (f.repo_id, f.commit_hash) in pinned
+            for f in files
+        )
+    ]
+    candidates.sort(key=lambda c: _priority(c[0], c[1], stats, policy))
+
+    remover = CacheRemover(index)
+    for _, files in candidates:
+        if result.usage <= target:
+            break
+        try:
+            freed = remover.remove(files)
+        except OSError as e:
+            logger.warning("Failed to evict %s: %s", files[0].file_path, e)
+            continue
+        logger.debug("Evicted %s of %s", files[0].file_name, files[0].repo_id)
+        result.nb_blobs += 1
+        result.freed += freed
+        result.usage -= freed
+        result.repo_ids.update(f.repo_id for f in files)
+
+    remover.finish()
+    if result.usage > target:
+        logger.warning("Cache is over the target after evicting all unpinned files.")
+    return result
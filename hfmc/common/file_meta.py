@@ -0,0 +1,13 @@
+"""Metadata of a model file held by a peer or a site."""
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class FileMeta:
+    """Metadata of a model file."""
+
+    size: Optional[int] = field(default=None)
+    etag: Optional[str] = field(default=None)
+    commit_hash: Optional[str] = field(default=None)
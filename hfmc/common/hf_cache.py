@@ -0,0 +1,262 @@
+"""Write downloaded files into the huggingface_hub cache layout.
+
+A repo in the cache looks like:
+
+    models--{user}--{model}/
+        blobs/{etag}
+        refs/{ref}  (content is the commit hash)
+        snapshots/{commit_hash}/{file_name} -> ../../blobs/{etag}
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from filelock import FileLock
+
+from hfmc.common import access_stats, blob_store, metadata_store
+from hfmc.common.cache_index import repo_folder_name
+from hfmc.common.context import HfmcContext
+
+logger = logging.getLogger(__name__)
+
+INCOMPLETE_SUFFIX = ".incomplete"
+LOCK_SUFFIX = ".lock"
+SIDECAR_SUFFIX = ".json"
+
+sha256_re = re.compile(r"^[0-9a-f]{64}$")
+sha1_re = re.compile(r"^[0-9a-f]{40}$")
+
+
+def get_repo_path(repo_id: str) -> Path:
+    """Get the cache directory of a repo."""
+    return HfmcContext.get_model_dir() / repo_folder_name(repo_id)
+
+
+def get_blob_path(repo_id: str, etag: str) -> Path:
+    """Get the path of a blob."""
+    return get_repo_path(repo_id) / "blobs" / etag
+
+
+def ensure_blob(repo_id: str, etag: str) -> bool:
+    """Check if a blob is cached for the repo, linking it from the store."""
+    blob_path = get_blob_path(repo_id, etag)
+    return blob_path.exists() or blob_store.link_blob(etag, blob_path)
+
+
+def get_incomplete_path(repo_id: str, etag: str) -> Path:
+    """Get the path of a blob being downloaded."""
+    return get_repo_path(repo_id) / "blobs" / (etag + INCOMPLETE_SUFFIX)
+
+
+def _get_sidecar_path(repo_id: str, etag: str) -> Path:
+    path = get_incomplete_path(repo_id, etag)
+    return path.with_name(path.name + SIDECAR_SUFFIX)
+
+
+def get_lock_path(repo_id: str, etag: str) -> Path:
+    """Get the path of the lock of a blob, shared with huggingface_hub."""
+    return (
+        HfmcContext.get_model_dir()
+        / ".locks"
+        / repo_folder_name(repo_id)
+        / (etag + LOCK_SUFFIX)
+    )
+
+
+def blob_lock(repo_id: str, etag: str) -> FileLock:
+    """Get the lock held while a blob is written, by any process on the host."""
+    path = get_lock_path(repo_id, etag)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return FileLock(str(path))
+
+
+def get_snapshot_path(repo_id: str, commit_hash: str, file_name: str) -> Path:
+    """Get the path of a file in a snapshot."""
+    return get_repo_path(repo_id) / "snapshots" / commit_hash / file_name
+
+
+def _link_snapshot(blob_path: Path, snapshot_path: Path) -> None:
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    if snapshot_path.is_symlink() or snapshot_path.exists():
+        snapshot_path.unlink()
+
+    try:
+        os.symlink(os.path.relpath(blob_path, snapshot_path.parent), snapshot_path)
+    except OSError:
+        # symlinks are not supported (i.e. on Windows),
+        # move the new blob to the snapshot like huggingface_hub does
+        logger.debug("Symlink not supported, move blob to %s", snapshot_path)
+        shutil.move(str(blob_path), str(snapshot_path))
+
+
+def save_ref(repo_id: str, revision: str, commit_hash: str) -> None:
+    """Point a ref (i.e. main) to a commit."""
+    if commit_hash.startswith(revision):
+        # revision is a commit hash, not a ref
+        return
+
+    ref_path = get_repo_path(repo_id) / "refs" / revision
+    if ref_path.exists() and ref_path.read_text() == commit_hash:
+        return
+    ref_path.parent.mkdir(parents=True, exist_ok=True)
+    ref_path.write_text(commit_hash)
+
+
+def prepare_snapshot(
+    repo_id: str,
+    file_name: str,
+    revision: str,
+    commit_hash: str,
+) -> None:
+    """Save the ref and create the snapshot before a file is downloaded.
+
+    huggingface_hub does the same, and the revision of the file being
+    downloaded can be resolved meanwhile.
+    """
+    save_ref(repo_id, revision, commit_hash)
+    get_snapshot_path(repo_id, commit_hash, file_name).parent.mkdir(
+        parents=True,
+        exist_ok=True,
+    )
+
+
+def commit_file(  # noqa: PLR0913
+    repo_id: str,
+    file_name: str,
+    revision: str,
+    commit_hash: str,
+    etag: str,
+    tmp_path: Path | None = None,
+) -> Path:
+    """Move a downloaded file into the cache, return its snapshot path.
+
+    If tmp_path is None, the blob is already in the cache (i.e. shared
+    with another revision) and only the snapshot is linked to it. New
+    blobs are kept in the store to be shared with other repos.
+    """
+    blob_path = get_blob_path(repo_id, etag)
+    blob_path.parent.mkdir(parents=True, exist_ok=True)
+    if tmp_path is not None:
+        os.replace(tmp_path, blob_path)
+        remove_partial(repo_id, etag)
+        blob_store.store_blob(blob_path, etag)
+
+    # the blob is moved to the snapshot where symlinks are not supported
+    size = blob_path.stat().st_size
+    snapshot_path = get_snapshot_path(repo_id, commit_hash, file_name)
+    _link_snapshot(blob_path, snapshot_path)
+    save_ref(repo_id, revision, commit_hash)
+    metadata_store.save_file(snapshot_path, etag, size)
+    access_stats.record_access(etag)
+    return snapshot_path
+
+
+def etag_hasher(etag: str, size: int) -> Any | None:
+    """Get a hasher to compute the etag of a file with the given size.
+
+    The etag of an LFS file is the sha256 of its content, and the etag of
+    a regular file is its git blob sha1. Return None for etags in other
+    forms, which can't be verified.
+    """
+    if sha256_re.match(etag):
+        return hashlib.sha256()
+    if sha1_re.match(etag):
+        hasher = hashlib.sha1()  # noqa: S324
+        hasher.update(f"blob {size}\0".encode())
+        return hasher
+    return None
+
+
+def verify_etag(file_path: Path, etag: str) -> bool:
+    """Check if the content of a file matches its etag."""
+    hasher = etag_hasher(etag, file_path.stat().st_size)
+    if hasher is None:
+        return True
+
+    buf_size = 2**20
+    with file_path.open("rb") as f:
+        for buf in iter(lambda: f.read(buf_size), b""):
+            hasher.update(buf)
+
+    return hasher.hexdigest() == etag
+
+
+@dataclass
+class PartialFile:
+    """A blob partially downloaded into an incomplete file.
+
+    The sidecar file next to the incomplete file records which file it
+    is. Bytes before the end of the incomplete file are valid, so the
+    download can be resumed from any peer or site having the same etag.
+    """
+
+    repo_id: str = field()
+    etag: str = field()
+    size: int = field()
+    file_name: str = field()
+    commit_hash: str = field()
+    # bytes are written in order, so the file is valid up to its end
+    sequential: bool = field(default=True)
+
+    @property
+    def path(self) -> Path:
+        """Path of the incomplete file."""
+        return get_incomplete_path(self.repo_id, self.etag)
+
+    def offset(self) -> int:
+        """Get the number of bytes downloaded."""
+        try:
+            offset = self.path.stat().st_size
+        except OSError:
+            return 0
+        return offset if offset <= self.size else 0
+
+
+def save_partial(partial: PartialFile) -> None:
+    """Save the sidecar of an incomplete file."""
+    path = _get_sidecar_path(partial.repo_id, partial.etag)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(asdict(partial)))
+
+
+def load_partial(repo_id: str, etag: str) -> PartialFile | None:
+    """Load the sidecar of an incomplete file by etag."""
+    path = _get_sidecar_path(repo_id, etag)
+    try:
+        partial = PartialFile(**json.loads(path.read_text()))
+    except (OSError, ValueError, TypeError):
+        return None
+    return partial if partial.etag == etag and partial.repo_id == repo_id else None
+
+
+def find_partial(repo_id: str, file_name: str) -> PartialFile | None:
+    """Find an incomplete file by file name, when its etag is unknown."""
+    blob_dir = get_repo_path(repo_id) / "blobs"
+    suffix = INCOMPLETE_SUFFIX + SIDECAR_SUFFIX
+    if not blob_dir.is_dir():
+        return None
+
+    for path in blob_dir.glob("*" + suffix):
+        partial = load_partial(repo_id, path.name[: -len(suffix)])
+        if partial and partial.file_name == file_name:
+            return partial
+    return None
+
+
+def remove_partial(repo_id: str, etag: str) -> None:
+    """Remove an incomplete file and its sidecar."""
+    paths = [get_incomplete_path(repo_id, etag), _get_sidecar_path(repo_id, etag)]
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,307 @@
+"""Metadata of the cache in a single SQLite database.
+
+Etags of snapshot files and file lists of revisions used to be small
+files, one per model file or revision, i.e. hundreds of thousands of
+inodes for a large cache. They are rows of metadata.db in the cache dir
+instead:
+
+    files       etag and size of every snapshot file added by HFMC, the
+                etag of an LFS file being the sha256 of its content
+    file_lists  files of a revision of a repo, saved when it is added
+    access      when a blob was used last, and how many times
+    meta        flags of the database, i.e. whether files of the cache
+                added without HFMC are indexed
+
+The daemon and clients share the database in WAL mode, so readers never
+wait for a writer, and every process or thread has a connection of its
+own. Writes of a call are done in a single transaction, and batch()
+groups the writes of several calls.
+
+Data of older versions is imported the first time the database is
+opened, and its files are removed.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from hfmc.common.context import HfmcContext
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+# a writer waits this long for another one before giving up
+BUSY_TIMEOUT_SEC = 30.0
+
+FILES_INDEXED = "files_indexed"
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        etag TEXT NOT NULL,
+        size INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS file_lists (
+        repo_id TEXT NOT NULL,
+        revision TEXT NOT NULL,
+        files TEXT NOT NULL,
+        saved_at REAL NOT NULL,
+        PRIMARY KEY (repo_id, revision)
+    )""",
+    """CREATE TABLE IF NOT EXISTS access (
+        etag TEXT PRIMARY KEY,
+        last_access REAL NOT NULL,
+        hits INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""",
+]
+
+_local = threading.local()
+
+
+def _rel(path: Path) -> str:
+    return path.relative_to(HfmcContext.get_model_dir()).as_posix()
+
+
+def _connect() -> sqlite3.Connection:
+    """Get the connection of the thread, opening the database if needed."""
+    path = HfmcContext.get_metadata_path()
+    db: sqlite3.Connection | None = getattr(_local, "db", None)
+    if db is not None and _local.path == path:
+        return db
+    if db is not None:
+        # the context is initialized with another cache dir
+        db.close()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # transactions are begun and committed explicitly
+    db = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT_SEC, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    # WAL stays consistent on a crash, only the last commits may be lost
+    db.execute("PRAGMA synchronous=NORMAL")
+    _migrate(db)
+    _local.db = db
+    _local.path = path
+    return db
+
+
+@contextmanager
+def batch() -> Iterator[sqlite3.Connection]:
+    """Group writes of several calls in a single transaction."""
+    db = _connect()
+    if db.in_transaction:
+        # nested in another batch
+        yield db
+        return
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+def _import_etags(db: sqlite3.Connection) -> None:
+    model_dir = HfmcContext.get_model_dir()
+    etag_dir = HfmcContext.get_etag_dir()
+    if not etag_dir.is_dir():
+        return
+    rows = []
+    for path in etag_dir.rglob("*"):
+        snapshot_path = model_dir / path.relative_to(etag_dir)
+        try:
+            if path.is_file():
+                etag = path.read_text().strip()
+                rows.append((_rel(snapshot_path), etag, snapshot_path.stat().st_size))
+        except OSError:
+            # the file is not in the cache anymore
+            continue
+    db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", rows)
+
+
+def _import_file_lists(db: sqlite3.Connection) -> None:
+    files_dir = HfmcContext.get_repo_files_dir()
+    if not files_dir.is_dir():
+        return
+    rows = []
+    for path in files_dir.rglob("files.json"):
+        parts = path.parent.relative_to(files_dir).parts
+        if len(parts) < 3:  # noqa: PLR2004
+            continue
+        try:
+            files = json.loads(path.read_text())
+            saved_at = path.stat().st_mtime
+        except (OSError, ValueError):
+            continue
+        repo_id, revision = "/".join(parts[:2]), "/".join(parts[2:])
+        rows.append((repo_id, revision, json.dumps(files), saved_at))
+    db.executemany("INSERT OR IGNORE INTO file_lists VALUES (?, ?, ?, ?)", rows)
+
+
+def _remove_legacy_files() -> None:
+    shutil.rmtree(HfmcContext.get_etag_dir(), ignore_errors=True)
+    shutil.rmtree(HfmcContext.get_repo_files_dir(), ignore_errors=True)
+
+
+def _migrate(db: sqlite3.Connection) -> None:
+    """Create tables, and import data of older versions once."""
+    if db.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+
+    # the write lock lets a single process migrate
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        if db.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            db.execute("ROLLBACK")
+            return
+        for statement in _SCHEMA:
+            db.execute(statement)
+        _import_etags(db)
+        _import_file_lists(db)
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+    logger.debug("Metadata store is created: %s", HfmcContext.get_metadata_path())
+    _remove_legacy_files()
+
+
+def save_file(snapshot_path: Path, etag: str, size: int | None) -> None:
+    """Save the etag and size of a snapshot file."""
+    with batch() as db:
+        db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+            (_rel(snapshot_path), etag, size),
+        )
+
+
+def load_etag(snapshot_path: Path) -> str | None:
+    """Load the etag of a snapshot file, None if not saved."""
+    db = _connect()
+    row = db.execute(
+        "SELECT etag FROM files WHERE path = ?",
+        (_rel(snapshot_path),),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def load_etags(repo_folder: str) -> Dict[str, str]:
+    """Load etags of snapshot files of a repo, keyed by path in the model dir."""
+    # paths under the folder, "0" follows "/" in ASCII
+    rows = _connect().execute(
+        "SELECT path, etag FROM files WHERE path >= ? AND path < ?",
+        (repo_folder + "/", repo_folder + "0"),
+    )
+    return dict(rows)
+
+
+def load_files() -> Dict[str, str] | None:
+    """Load etags of all snapshot files, None if the cache is not indexed.
+
+    The cache is indexed by index_files(), as files added without HFMC,
+    i.e. by huggingface_hub, are not saved.
+    """
+    db = _connect()
+    if not db.execute("SELECT 1 FROM meta WHERE key = ?", (FILES_INDEXED,)).fetchone():
+        return None
+    return dict(db.execute("SELECT path, etag FROM files"))
+
+
+def index_files(files: Iterable[Tuple[Path, str, int]]) -> None:
+    """Save (snapshot path, etag, size) of all files found in the cache."""
+    with batch() as db:
+        db.executemany(
+            "INSERT OR IGNORE INTO files VALUES (?, ?, ?)",
+            [(_rel(path), etag, size) for path, etag, size in files],
+        )
+        db.execute("INSERT OR REPLACE INTO meta VALUES (?, '1')", (FILES_INDEXED,))
+
+
+def remove_files(snapshot_paths: Iterable[Path]) -> None:
+    """Forget snapshot files removed from the cache."""
+    with batch() as db:
+        db.executemany(
+            "DELETE FROM files WHERE path = ?",
+            [(_rel(path),) for path in snapshot_paths],
+        )
+
+
+def save_file_list(
+    repo_id: str,
+    revision: str,
+    files: List[str],
+    saved_at: float,
+) -> None:
+    """Save the file list of a revision, unless it is saved already."""
+    with batch() as db:
+        db.execute(
+            "INSERT OR IGNORE INTO file_lists VALUES (?, ?, ?, ?)",
+            (repo_id, revision, json.dumps(files), saved_at),
+        )
+
+
+def load_file_list(repo_id: str, revision: str) -> List[str] | None:
+    """Load the file list of a revision, None if not saved."""
+    db = _connect()
+    row = db.execute(
+        "SELECT files FROM file_lists WHERE repo_id = ? AND revision = ?",
+        (repo_id, revision),
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def list_file_lists() -> List[Tuple[str, str, float]]:
+    """List (repo id, revision, saved at) of all saved file lists."""
+    rows = _connect().execute("SELECT repo_id, revision, saved_at FROM file_lists")
+    return list(rows)
+
+
+def remove_file_lists(repo_id: str, revisions: Iterable[str] | None = None) -> None:
+    """Remove file lists of revisions of a repo, or of all of them."""
+    with batch() as db:
+        if revisions is None:
+            db.execute("DELETE FROM file_lists WHERE repo_id = ?", (repo_id,))
+            return
+        db.executemany(
+            "DELETE FROM file_lists WHERE repo_id = ? AND revision = ?",
+            [(repo_id, revision) for revision in revisions],
+        )
+
+
+def add_accesses(accesses: Dict[str, Tuple[float, int]]) -> None:
+    """Add (last access, hits) counted since the last call to the stats."""
+    with batch() as db:
+        db.executemany(
+            "INSERT OR IGNORE INTO access VALUES (?, 0, 0)",
+            [(etag,) for etag in accesses],
+        )
+        db.executemany(
+            "UPDATE access SET last_access = max(last_access, ?), hits = hits + ? "
+            "WHERE etag = ?",
+            [(last, hits, etag) for etag, (last, hits) in accesses.items()],
+        )
+
+
+def load_accesses() -> Dict[str, Tuple[float, int]]:
+    """Load (last access, hits) of all blobs."""
+    rows = _connect().execute("SELECT etag, last_access, hits FROM access")
+    return {etag: (last, hits) for etag, last, hits in rows}
+
+
+def remove_accesses(etags: Iterable[str]) -> None:
+    """Drop the stats of blobs removed from the cache."""
+    with batch() as db:
+        db.executemany("DELETE FROM access WHERE etag = ?", [(e,) for e in etags])
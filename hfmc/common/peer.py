@@ -2,6 +2,15 @@
 
 from dataclasses import dataclass, field
 
+EWMA_ALPHA = 0.3
+
+
+def ewma(average: float, sample: float, alpha: float = EWMA_ALPHA) -> float:
+    """Update an exponentially weighted moving average, 0 means no samples."""
+    if not average:
+        return sample
+    return alpha * sample + (1 - alpha) * average
+
 
 @dataclass(order=True, unsafe_hash=True)
 class Peer:
@@ -11,3 +20,11 @@ class Peer:
     port: int = field(hash=True)
     alive: bool = field(compare=False, default=False)
     epoch: int = field(compare=False, default=0)
+    # epoch and version of the inventory filter told in the last ping
+    inventory: str = field(compare=False, default="")
+    # moving averages of ping round trip in sec and download speed in B/s,
+    # 0 if not measured yet
+    rtt: float = field(compare=False, default=0.0)
+    throughput: float = field(compare=False, default=0.0)
+    # number of files the peer is uploading, told in the last ping
+    uploads: int = field(compare=False, default=0)
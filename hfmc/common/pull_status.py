@@ -0,0 +1,24 @@
+"""Progress of a daemon pulling a model from its parent in a distribution."""
+
+from dataclasses import dataclass, field
+
+PULL_RUNNING = "running"
+PULL_DONE = "done"
+PULL_FAILED = "failed"
+
+
+@dataclass
+class PullStatus:
+    """How far a daemon is in pulling a repo revision."""
+
+    state: str = field()
+    nb_files: int = field()
+    nb_done: int = field()
+    # bytes received, of the files done and of the file being received
+    received: int = field()
+    error: str = field(default="")
+
+    @property
+    def finished(self) -> bool:
+        """Whether the pull is over, done or failed."""
+        return self.state != PULL_RUNNING
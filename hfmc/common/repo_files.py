@@ -1,41 +1,38 @@
 """Handling repo file list."""
 
-import json
 import logging
-from pathlib import Path
-from typing import List, Optional
+import sqlite3
+import time
+from typing import Iterable, List, Optional
 
-from hfmc.common.context import HfmcContext
+from hfmc.common import metadata_store
 
 RepoFileList = List[str]
 
 logger = logging.getLogger(__name__)
 
 
-def _file_list_local_file(
-    repo_id: str,
-    revision: str,
-) -> Path:
-    return HfmcContext.get_repo_files_dir() / repo_id / revision / "files.json"
-
-
 def load_file_list(
     repo_id: str,
     revision: str,
 ) -> Optional[RepoFileList]:
-    """Load repo file list from local config."""
-    path = _file_list_local_file(repo_id, revision)
-    if not path.exists():
-        return None
-    return json.loads(path.read_text())
+    """Load repo file list from the metadata store."""
+    return metadata_store.load_file_list(repo_id, revision)
 
 
 def save_file_list(repo_id: str, revision: str, files: RepoFileList) -> None:
-    """Save repo file list to local config."""
-    path = _file_list_local_file(repo_id, revision)
+    """Save repo file list to the metadata store."""
     try:
-        if not path.exists():
-            path.parent.mkdir(parents=True, exist_ok=True)
-            path.write_text(json.dumps(files))
-    except (ValueError, IOError, OSError) as e:
+        metadata_store.save_file_list(repo_id, revision, files, time.time())
+    except (ValueError, OSError, sqlite3.Error) as e:
         logger.debug("Error when saving file list.", exc_info=e)
+
+
+def remove_file_list(repo_id: str, revision: str) -> None:
+    """Remove the saved file list of a revision."""
+    metadata_store.remove_file_lists(repo_id, [revision])
+
+
+def remove_file_lists(repo_id: str, revisions: Optional[Iterable[str]] = None) -> None:
+    """Remove saved file lists of revisions of a repo, or of all of them."""
+    metadata_store.remove_file_lists(repo_id, revisions)
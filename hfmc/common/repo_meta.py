@@ -0,0 +1,22 @@
+"""Summary of a model repo held by a peer."""
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class RepoMeta:
+    """How much of a repo revision a peer has."""
+
+    commit_hash: str = field()
+    nb_files: int = field()
+    size: int = field()
+    # number of files in the repo, None if the peer doesn't know
+    nb_total: Optional[int] = field(default=None)
+
+    @property
+    def fraction(self) -> Optional[float]:
+        """Fraction of the repo files the peer has."""
+        if not self.nb_total:
+            return None
+        return min(self.nb_files / self.nb_total, 1.0)
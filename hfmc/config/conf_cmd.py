@@ -5,6 +5,7 @@ from argparse import Namespace
 
 from hfmc.config import config_manager
 from hfmc.config.hfmc_config import HfmcConfigOption
+from hfmc.utils.size import format_size
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +42,116 @@ def _configure_port(args: Namespace) -> None:
         logger.info("Reset HFMC port: %s", conf)
 
 
+def _configure_gossip(args: Namespace) -> None:
+    if args.conf_gossip_command == "set":
+        conf = config_manager.set_config(
+            HfmcConfigOption.GOSSIP,
+            args.switch == "on",
+            bool,
+        )
+        logger.info("Set HFMC gossip: %s", "on" if conf else "off")
+    elif args.conf_gossip_command == "get":
+        conf = config_manager.get_config(HfmcConfigOption.GOSSIP, bool)
+        logger.info("HFMC gossip: %s", "on" if conf else "off")
+    elif args.conf_gossip_command == "reset":
+        conf = config_manager.reset_config(HfmcConfigOption.GOSSIP, bool)
+        logger.info("Reset HFMC gossip: %s", "on" if conf else "off")
+
+
+def _configure_discovery(args: Namespace) -> None:
+    if args.conf_discovery_command == "set":
+        conf = config_manager.set_config(
+            HfmcConfigOption.DISCOVERY,
+            args.switch == "on",
+            bool,
+        )
+        logger.info("Set HFMC discovery: %s", "on" if conf else "off")
+    elif args.conf_discovery_command == "get":
+        conf = config_manager.get_config(HfmcConfigOption.DISCOVERY, bool)
+        logger.info("HFMC discovery: %s", "on" if conf else "off")
+    elif args.conf_discovery_command == "reset":
+        conf = config_manager.reset_config(HfmcConfigOption.DISCOVERY, bool)
+        logger.info("Reset HFMC discovery: %s", "on" if conf else "off")
+
+
+def _configure_proxy(args: Namespace) -> None:
+    if args.conf_proxy_command == "set":
+        conf = config_manager.set_config(
+            HfmcConfigOption.PROXY,
+            args.switch == "on",
+            bool,
+        )
+        logger.info("Set HFMC proxy: %s", "on" if conf else "off")
+    elif args.conf_proxy_command == "get":
+        conf = config_manager.get_config(HfmcConfigOption.PROXY, bool)
+        logger.info("HFMC proxy: %s", "on" if conf else "off")
+    elif args.conf_proxy_command == "reset":
+        conf = config_manager.reset_config(HfmcConfigOption.PROXY, bool)
+        logger.info("Reset HFMC proxy: %s", "on" if conf else "off")
+
+
+def _capacity_str(capacity: int) -> str:
+    return format_size(capacity) if capacity else "unlimited"
+
+
+def _configure_capacity(args: Namespace) -> None:
+    if args.conf_capacity_command == "set":
+        conf = config_manager.set_config(
+            HfmcConfigOption.CAPACITY,
+            args.size,
+            int,
+        )
+        logger.info("Set HFMC cache capacity: %s", _capacity_str(conf))
+    elif args.conf_capacity_command == "get":
+        conf = config_manager.get_config(HfmcConfigOption.CAPACITY, int)
+        logger.info("HFMC cache capacity: %s", _capacity_str(conf))
+    elif args.conf_capacity_command == "reset":
+        conf = config_manager.reset_config(HfmcConfigOption.CAPACITY, int)
+        logger.info("Reset HFMC cache capacity: %s", _capacity_str(conf))
+
+
+def _configure_eviction(args: Namespace) -> None:
+    if args.conf_eviction_command == "set":
+        conf = config_manager.set_config(
+            HfmcConfigOption.EVICTION,
+            args.policy,
+            str,
+        )
+        logger.info("Set HFMC eviction policy: %s", conf)
+    elif args.conf_eviction_command == "get":
+        conf = config_manager.get_config(HfmcConfigOption.EVICTION, str)
+        logger.info("HFMC eviction policy: %s", conf)
+    elif args.conf_eviction_command == "reset":
+        conf = config_manager.reset_config(HfmcConfigOption.EVICTION, str)
+        logger.info("Reset HFMC eviction policy: %s", conf)
+
+
+def _configure_watermark(args: Namespace) -> None:
+    if args.conf_watermark_command == "set":
+        if not 0 < args.low <= args.high <= 1:
+            logger.error("Watermarks must be fractions with 0 < LOW <= HIGH <= 1.")
+            return
+        high = config_manager.set_config(
+            HfmcConfigOption.HIGH_WATERMARK,
+            args.high,
+            float,
+        )
+        low = config_manager.set_config(
+            HfmcConfigOption.LOW_WATERMARK,
+            args.low,
+            float,
+        )
+        logger.info("Set HFMC watermarks: high %s, low %s", high, low)
+    elif args.conf_watermark_command == "get":
+        high = config_manager.get_config(HfmcConfigOption.HIGH_WATERMARK, float)
+        low = config_manager.get_config(HfmcConfigOption.LOW_WATERMARK, float)
+        logger.info("HFMC watermarks: high %s, low %s", high, low)
+    elif args.conf_watermark_command == "reset":
+        high = config_manager.reset_config(HfmcConfigOption.HIGH_WATERMARK, float)
+        low = config_manager.reset_config(HfmcConfigOption.LOW_WATERMARK, float)
+        logger.info("Reset HFMC watermarks: high %s, low %s", high, low)
+
+
 def _show_config() -> None:
     content = config_manager.get_config_yaml()
     logger.info(content)
@@ -52,6 +163,18 @@ async def exec_cmd(args: Namespace) -> None:
         _configure_cache(args)
     elif args.conf_command == "port":
         _configure_port(args)
+    elif args.conf_command == "gossip":
+        _configure_gossip(args)
+    elif args.conf_command == "discovery":
+        _configure_discovery(args)
+    elif args.conf_command == "proxy":
+        _configure_proxy(args)
+    elif args.conf_command == "capacity":
+        _configure_capacity(args)
+    elif args.conf_command == "eviction":
+        _configure_eviction(args)
+    elif args.conf_command == "watermark":
+        _configure_watermark(args)
     elif args.conf_command == "show":
         _show_config()
     else:
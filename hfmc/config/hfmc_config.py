@@ -4,7 +4,7 @@ from __future__ import annotations
 
 from enum import Enum
 from pathlib import Path
-from typing import List
+from typing import List, Literal
 
 from pydantic import BaseModel, Field
 
@@ -14,6 +14,8 @@ CONFIG_FILE = CONFIG_DIR / "config.yaml"
 DEFAULT_CACHE_DIR = Path.home() / ".cache" / "hfmc"
 DEFAULT_DAEMON_PORT = 9090
 
+EVICTION_POLICIES = ("lru", "lfu")
+
 
 class Peer(BaseModel):
     """Peer definition for HFMC."""
@@ -46,6 +48,14 @@ class HfmcConfigOption(str, Enum):
     CACHE: str = "cache_dir"
     PORT: str = "daemon_port"
     PEERS: str = "peers"
+    GOSSIP: str = "gossip"
+    DISCOVERY: str = "discovery"
+    PROXY: str = "proxy"
+    CAPACITY: str = "capacity"
+    EVICTION: str = "eviction"
+    HIGH_WATERMARK: str = "high_watermark"
+    LOW_WATERMARK: str = "low_watermark"
+    PINS: str = "pins"
 
 
 class HfmcConfig(BaseModel):
@@ -65,3 +75,48 @@ class HfmcConfig(BaseModel):
         description="Port for the daemon",
         default=DEFAULT_DAEMON_PORT,
     )
+
+    gossip: bool = Field(
+        description="Learn peers from the configured ones by gossip",
+        default=False,
+    )
+
+    discovery: bool = Field(
+        description="Discover peers on the LAN by multicast",
+        default=False,
+    )
+
+    proxy: bool = Field(
+        description="Fetch files missing in the cache for requesters",
+        default=False,
+    )
+
+    capacity: int = Field(
+        description="Bytes the cache may use before files are evicted, 0 for no limit",
+        default=0,
+        ge=0,
+    )
+
+    eviction: Literal["lru", "lfu"] = Field(
+        description="Evict least recently or least frequently used files first",
+        default="lru",
+    )
+
+    high_watermark: float = Field(
+        description="Fraction of the capacity used that starts an eviction",
+        default=0.95,
+        gt=0,
+        le=1,
+    )
+
+    low_watermark: float = Field(
+        description="Fraction of the capacity used that an eviction stops at",
+        default=0.85,
+        gt=0,
+        le=1,
+    )
+
+    pins: List[str] = Field(
+        description="Repos never evicted, as repo_id or repo_id@revision",
+        default_factory=list,
+    )
@@ -0,0 +1,242 @@
+"""Discovery of daemons on the LAN by UDP multicast.
+
+Every daemon joins the multicast group {DISCOVERY_GROUP} and announces
+its port there. Daemons heard from are added to the peers to probe, and
+dropped if they are not heard again for {PEER_TTL_MULT} announce
+intervals, or at once if they say goodbye when stopping.
+
+Announces are rate limited so discovery stays cheap on large segments.
+The announce interval grows with the number of daemons, to keep the
+total rate of announces on the segment under {MAX_GROUP_RATE} per sec.
+A new daemon is answered after a random backoff, spread like announces,
+and the answer is dropped if another daemon is heard first, so a new
+daemon gets a few answers and finds the others by their announces. A
+daemon answers at most once every {MIN_INTERVAL_SEC} seconds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import socket
+import struct
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from hfmc.common.peer import Peer
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_GROUP = "239.255.72.77"
+DISCOVERY_PORT = 48787
+
+# version of the announce format
+ANNOUNCE_VERSION = 1
+
+
+class LanDiscovery(asyncio.DatagramProtocol):
+    """Announce this daemon and listen to the others on the LAN."""
+
+    _port: int
+    _on_change: Callable[[List[Peer]], None]
+    _group: str
+    _group_port: int
+    _id: str
+    _transport: asyncio.DatagramTransport | None
+    _peers: Dict[Peer, Peer]
+    # peer -> monotonic time it was last heard
+    _last_seen: Dict[Peer, float]
+    _last_announce: float
+    _announce_soon: asyncio.TimerHandle | None
+    # new peers waiting for the answer
+    _unanswered: Set[Peer]
+    _task: asyncio.Task[None] | None
+
+    ANNOUNCE_SEC = 30.0
+    MIN_INTERVAL_SEC = 5.0
+    ANSWER_BACKOFF_SEC = 1.0
+    MAX_GROUP_RATE = 10.0
+    PEER_TTL_MULT = 3
+    JITTER = 0.2
+
+    def __init__(
+        self,
+        port: int,
+        on_change: Callable[[List[Peer]], None],
+        group: str = DISCOVERY_GROUP,
+        group_port: int = DISCOVERY_PORT,
+    ) -> None:
+        """Init LanDiscovery of the daemon on port.
+
+        on_change is called with all discovered peers when they change.
+        """
+        self._port = port
+        self._on_change = on_change
+        self._group = group
+        self._group_port = group_port
+        # tells own announces, looped back by the group, from others
+        self._id = uuid.uuid4().hex
+        self._transport = None
+        self._peers = {}
+        self._last_seen = {}
+        self._last_announce = -self.MIN_INTERVAL_SEC
+        self._announce_soon = None
+        self._unanswered = set()
+        self._task = None
+
+    def get_peers(self) -> List[Peer]:
+        """Get discovered peers."""
+        return list(self._peers.values())
+
+    def merge(self, peers: List[Peer]) -> List[Peer]:
+        """Add discovered peers to the configured ones."""
+        configured = set(peers)
+        return peers + [p for p in self._peers.values() if p not in configured]
+
+    def interval(self) -> float:
+        """Interval between announces of this daemon in sec."""
+        nb_daemons = len(self._peers) + 1
+        return max(self.ANNOUNCE_SEC, nb_daemons / self.MAX_GROUP_RATE)
+
+    def _jitter(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.JITTER, 1 + self.JITTER)  # noqa: S311
+
+    def _message(self, bye: bool = False) -> bytes:
+        data: Dict[str, Any] = {
+            "hfmc": ANNOUNCE_VERSION,
+            "id": self._id,
+            "port": self._port,
+        }
+        if bye:
+            data["bye"] = True
+        return json.dumps(data).encode()
+
+    def announce(self, bye: bool = False) -> None:
+        """Send an announce to the group."""
+        if self._transport is None:
+            return
+        self._last_announce = time.monotonic()
+        try:
+            self._transport.sendto(self._message(bye), (self._group, self._group_port))
+        except OSError as e:
+            logger.debug("Failed to announce: %s", e)
+
+    def _answer(self, peer: Peer) -> None:
+        """Announce to a new daemon after a random backoff."""
+        self._unanswered.add(peer)
+        if self._announce_soon is not None or self._transport is None:
+            return
+        # spread answers of all daemons like their announces
+        window = max(self.ANSWER_BACKOFF_SEC, len(self._peers) / self.MAX_GROUP_RATE)
+        backoff = random.uniform(0, window)  # noqa: S311
+        rate_limit = self._last_announce + self.MIN_INTERVAL_SEC - time.monotonic()
+
+        def _announce() -> None:
+            self._announce_soon = None
+            self._unanswered = set()
+            self.announce()
+
+        loop = asyncio.get_running_loop()
+        self._announce_soon = loop.call_later(max(backoff, rate_limit), _announce)
+
+    def _suppress_answer(self) -> None:
+        """Drop the answer, another daemon is heard by the new ones."""
+        if self._announce_soon is not None:
+            self._announce_soon.cancel()
+            self._announce_soon = None
+        self._unanswered = set()
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Save the transport of the socket."""
+        self._transport = transport  # type: ignore[assignment]
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Handle an announce of a daemon."""
+        try:
+            msg = json.loads(data)
+            if msg["hfmc"] != ANNOUNCE_VERSION or msg["id"] == self._id:
+                return
+            peer = Peer(ip=addr[0], port=int(msg["port"]))
+        except (KeyError, TypeError, ValueError):
+            logger.debug("Bad announce from %s", addr)
+            return
+
+        if msg.get("bye"):
+            self._last_seen.pop(peer, None)
+            self._unanswered.discard(peer)
+            if self._peers.pop(peer, None):
+                self._on_change(self.get_peers())
+            return
+
+        self._last_seen[peer] = time.monotonic()
+        if peer not in self._peers:
+            logger.debug("Discovered peer %s", peer)
+            self._peers[peer] = peer
+            self._on_change(self.get_peers())
+            self._answer(peer)  # let the new daemon know this one
+        elif self._unanswered and peer not in self._unanswered:
+            self._suppress_answer()
+
+    def error_received(self, exc: Exception) -> None:
+        """Log errors of the socket."""
+        logger.debug("Discovery error: %s", exc)
+
+    def expire(self) -> None:
+        """Drop peers which are not heard for a few intervals."""
+        ttl = self.PEER_TTL_MULT * self.interval()
+        now = time.monotonic()
+        expired = [p for p, seen in self._last_seen.items() if now - seen > ttl]
+        for peer in expired:
+            logger.debug("Peer %s is not heard anymore", peer)
+            del self._last_seen[peer]
+            del self._peers[peer]
+            self._unanswered.discard(peer)
+        if expired:
+            self._on_change(self.get_peers())
+
+    def _socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            # more daemons on a host share the group port
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(("", self._group_port))
+        mreq = struct.pack(
+            "4s4s",
+            socket.inet_aton(self._group),
+            socket.inet_aton("0.0.0.0"),  # noqa: S104
+        )
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        # stay on the local segment
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        sock.setblocking(False)
+        return sock
+
+    async def start(self) -> None:
+        """Join the group and announce periodically until stopped."""
+        self._task = asyncio.current_task()  # type: ignore[assignment]
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, sock=self._socket())
+
+        try:
+            while True:
+                self.announce()
+                await asyncio.sleep(self._jitter(self.interval()))
+                self.expire()
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Say goodbye to the group and leave it."""
+        self._suppress_answer()
+        if self._transport is not None:
+            self.announce(bye=True)
+            self._transport.close()
+            self._transport = None
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._task = None
@@ -0,0 +1,224 @@
+"""Pull jobs of a model distributed to many daemons.
+
+`hfmc model distribute` arranges the target daemons in a chain or a
+k-ary tree rooted at the daemon having the model, and asks every daemon
+to pull the model from its parent. Files being received are relayed to
+peers at once, so every daemon forwards the bytes downstream while it
+receives them, and the total time stays close to a single transfer
+whatever the number of daemons.
+
+A job pulls the files one by one in the given order, the same on every
+daemon, so a parent is receiving the file its children ask for. A file
+the parent doesn't have yet is asked again every {RETRY_SEC} seconds,
+and the job fails if nothing is received for {WAIT_SEC} seconds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, List, Set
+
+import aiohttp
+
+from hfmc.client import cache_controller, file_download
+from hfmc.client import http_request as request
+from hfmc.client.http_request import PEER_HEADERS
+from hfmc.common import hf_cache
+from hfmc.common.context import HfmcContext
+from hfmc.common.pull_status import (
+    PULL_DONE,
+    PULL_FAILED,
+    PULL_RUNNING,
+    PullStatus,
+)
+from hfmc.common.repo_files import save_file_list
+
+if TYPE_CHECKING:
+    from hfmc.common.peer import Peer
+
+logger = logging.getLogger(__name__)
+
+# "{repo_id}@{commit_hash}" -> job
+_jobs: Dict[str, PullJob] = {}
+_tasks: Set[asyncio.Task[None]] = set()  # keep strong references
+
+
+class PullJob(file_download.DownloadProgress):
+    """A daemon pulling files of a revision from its parent."""
+
+    repo_id: str
+    commit_hash: str
+    files: List[str]
+    source: Peer
+    ref: str | None
+    state: str
+    error: str
+    nb_done: int
+    _done_size: int
+    _current: int
+    _last_change: float
+    # files whose sizes are reserved in the cache
+    _reserved: Set[str]
+
+    RETRY_SEC = 1.0
+    WAIT_SEC = 300.0
+
+    def __init__(  # noqa: PLR0913
+        self,
+        repo_id: str,
+        commit_hash: str,
+        files: List[str],
+        source: Peer,
+        ref: str | None = None,
+    ) -> None:
+        """Init PullJob of files of a commit from the source daemon.
+
+        If ref is given, it points to the commit once all files are pulled.
+        """
+        self.repo_id = repo_id
+        self.commit_hash = commit_hash
+        self.files = files
+        self.source = source
+        self.ref = ref
+        self.state = PULL_RUNNING
+        self.error = ""
+        self.nb_done = 0
+        self._done_size = 0
+        self._current = 0
+        self._last_change = time.monotonic()
+        self._reserved = set()
+
+    def start(self, partial: hf_cache.PartialFile, offset: int) -> None:
+        """Let peers find the file being received."""
+        self._current = offset
+        self._last_change = time.monotonic()
+        HfmcContext.get_cache_index().refresh_repo(self.repo_id)
+
+    def update(self, nb_bytes: int) -> None:
+        """Count bytes received."""
+        self._current += nb_bytes
+        self._last_change = time.monotonic()
+
+    def status(self) -> PullStatus:
+        """Get the progress of the job."""
+        return PullStatus(
+            state=self.state,
+            nb_files=len(self.files),
+            nb_done=self.nb_done,
+            received=self._done_size + self._current,
+            error=self.error,
+        )
+
+    async def _pull_file(self, file_name: str) -> bool:
+        endpoint = f"http://{self.source.ip}:{self.source.port}"
+        index = HfmcContext.get_cache_index()
+        self._last_change = time.monotonic()
+
+        while index.get_file(self.repo_id, self.commit_hash, file_name) is None:
+            try:
+                ok = await file_download.download_file(
+                    endpoint,
+                    self.repo_id,
+                    file_name,
+                    self.commit_hash,
+                    PEER_HEADERS,
+                    progress=self,
+                )
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                OSError,
+                ValueError,
+            ) as e:
+                logger.debug("Failed to pull %s from %s: %s", file_name, endpoint, e)
+                ok = False
+            self._current = 0
+            if ok:
+                index.refresh_repo(self.repo_id)
+                break
+            # the parent may not be receiving it yet
+            if time.monotonic() - self._last_change > self.WAIT_SEC:
+                return False
+            await asyncio.sleep(self.RETRY_SEC)
+
+        cached = index.get_file(self.repo_id, self.commit_hash, file_name)
+        self._done_size += cached.size if cached else 0
+        return True
+
+    async def _make_room(self, file_names: List[str]) -> None:
+        """Make room for the files, with their sizes told by the parent.
+
+        A parent pulling the revision too only tells the files it has or
+        is receiving, the others are reserved when they are pulled.
+        """
+        _, metas = await request.get_files_meta(
+            self.source,
+            self.repo_id,
+            self.commit_hash,
+            file_names,
+        )
+        index = HfmcContext.get_cache_index()
+        reserve = 0
+        for file_name, meta in (metas or {}).items():
+            self._reserved.add(file_name)
+            if index.get_file(self.repo_id, self.commit_hash, file_name) is None:
+                reserve += meta.size or 0
+
+        evicted = await asyncio.get_running_loop().run_in_executor(
+            None,
+            cache_controller.make_room,
+            reserve,
+            [_job_key(self.repo_id, self.commit_hash)],
+        )
+        for repo_id in evicted.repo_ids if evicted else []:
+            index.refresh_repo(repo_id)
+
+    async def run(self) -> None:
+        """Pull all files in order."""
+        save_file_list(self.repo_id, self.commit_hash, self.files)
+        await self._make_room(self.files)
+        try:
+            for i, file_name in enumerate(self.files):
+                if file_name not in self._reserved:
+                    await self._make_room(
+                        [f for f in self.files[i:] if f not in self._reserved],
+                    )
+                if not await self._pull_file(file_name):
+                    self.error = f"Nothing of {file_name} is received from parent"
+                    logger.info("Failed to pull %s of %s", file_name, self.repo_id)
+                    return
+                self.nb_done += 1
+
+            if self.ref:
+                hf_cache.save_ref(self.repo_id, self.ref, self.commit_hash)
+                HfmcContext.get_cache_index().refresh_repo(self.repo_id)
+            self.state = PULL_DONE
+            logger.info("Pulled %s from %s", self.repo_id, self.source)
+        finally:
+            if self.state != PULL_DONE:
+                self.state = PULL_FAILED
+
+
+def _job_key(repo_id: str, commit_hash: str) -> str:
+    return f"{repo_id}@{commit_hash}"
+
+
+def start_job(job: PullJob) -> PullJob:
+    """Start a job, or return the same one running."""
+    key = _job_key(job.repo_id, job.commit_hash)
+    running = _jobs.get(key)
+    if running is not None and running.state == PULL_RUNNING:
+        return running
+
+    _jobs[key] = job
+    task = asyncio.create_task(job.run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+def get_job(repo_id: str, commit_hash: str) -> PullJob | None:
+    """Get the last job pulling a commit."""
+    return _jobs.get(_job_key(repo_id, commit_hash))
@@ -6,7 +6,9 @@ from aiohttp import web
 from aiohttp.web_runner import GracefulExit
 
 from hfmc.common.context import HfmcContext
+from hfmc.common.peer import Peer
 from hfmc.config import config_manager
+from hfmc.daemon.inventory import etag_key, file_key, is_searchable
 
 
 async def alive_peers(_: web.Request) -> web.Response:
@@ -15,17 +17,70 @@ async def alive_peers(_: web.Request) -> web.Response:
     return web.json_response([asdict(peer) for peer in alives])
 
 
+async def peer_throughput(request: web.Request) -> web.Response:
+    """Record the speed of a download from a peer."""
+    try:
+        data = await request.json()
+        peer = Peer(ip=data["ip"], port=int(data["port"]))
+        throughput = float(data["throughput"])
+    except (KeyError, TypeError, ValueError):
+        return web.Response(status=400)
+    HfmcContext.get_peer_prober().report_throughput(peer, throughput)
+    return web.Response()
+
+
+async def peers_with_file(request: web.Request) -> web.Response:
+    """Find alive peers which probably have a file, by their inventories."""
+    user = request.match_info["user"]
+    model = request.match_info["model"]
+    revision = request.match_info["revision"]
+    file_name = request.query.get("file_name")
+    if not file_name:
+        return web.Response(status=400)
+
+    prober = HfmcContext.get_peer_prober()
+    alives = prober.get_alives()
+    if is_searchable(revision):
+        keys = [file_key(f"{user}/{model}", revision, file_name)]
+        inventories = prober.get_inventories()
+        alives = [p for p in alives if inventories.might_have(p, keys)]
+    return web.json_response([asdict(peer) for peer in alives])
+
+
+async def peers_with_blob(request: web.Request) -> web.Response:
+    """Find alive peers which probably have a file content, in any repo."""
+    keys = [etag_key(request.match_info["etag"])]
+    prober = HfmcContext.get_peer_prober()
+    inventories = prober.get_inventories()
+    alives = [p for p in prober.get_alives() if inventories.might_have(p, keys)]
+    return web.json_response([asdict(peer) for peer in alives])
+
+
 async def peers_changed(_: web.Request) -> web.Response:
     """Update peers."""
     config = config_manager.load_config()
     new_peers = HfmcContext.update_peers(config, HfmcContext.get_peers())
+    lan_discovery = HfmcContext.get_lan_discovery()
+    if lan_discovery is not None:
+        new_peers = lan_discovery.merge(new_peers)
     HfmcContext.get_peer_prober().update_peers(new_peers)
     return web.Response()
 
 
+async def cache_changed(request: web.Request) -> web.Response:
+    """Rescan a repo which is added or removed."""
+    user = request.match_info["user"]
+    model = request.match_info["model"]
+    HfmcContext.get_cache_index().refresh_repo(f"{user}/{model}")
+    return web.Response()
+
+
 async def stop_daemon(request: web.Request) -> None:
     """Stop the daemon."""
     HfmcContext.get_peer_prober().stop_probe()
+    lan_discovery = HfmcContext.get_lan_discovery()
+    if lan_discovery is not None:
+        lan_discovery.stop()  # tell peers on the LAN to drop this daemon
 
     resp = web.Response()
     await resp.prepare(request)
@@ -0,0 +1,56 @@
+"""Handle requests of a model distribution."""
+
+from __future__ import annotations
+
+from dataclasses import asdict
+from typing import Tuple
+
+from aiohttp import web
+
+from hfmc.common.context import HfmcContext
+from hfmc.common.peer import Peer
+from hfmc.daemon import distribution
+from hfmc.daemon.distribution import PullJob
+
+
+def _get_repo_info(request: web.Request) -> Tuple[str, str]:
+    user = request.match_info["user"]
+    model = request.match_info["model"]
+    revision = request.match_info["revision"]
+    return f"{user}/{model}", revision
+
+
+async def start_pull(request: web.Request) -> web.Response:
+    """Start pulling a commit from the parent daemon.
+
+    The body has the files to pull in order, the ref to point to the
+    commit, and the parent. The parent ip defaults to the sender, which
+    is the daemon having the model. Only an alive peer of this daemon is
+    accepted as the parent, so it can't be told to fetch from any host.
+    """
+    repo_id, commit_hash = _get_repo_info(request)
+    try:
+        data = await request.json()
+        files = [str(f) for f in data["files"]]
+        source = data["source"]
+        ip = source.get("ip") or request.remote
+        parent = Peer(ip=str(ip), port=int(source["port"]))
+        ref = data.get("ref")
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return web.Response(status=400)
+    if parent not in HfmcContext.get_peer_prober().get_alives():
+        return web.Response(status=403)
+
+    job = distribution.start_job(
+        PullJob(repo_id, commit_hash, files, parent, str(ref) if ref else None),
+    )
+    return web.json_response(asdict(job.status()))
+
+
+async def pull_status(request: web.Request) -> web.Response:
+    """Get the progress of pulling a commit."""
+    repo_id, commit_hash = _get_repo_info(request)
+    job = distribution.get_job(repo_id, commit_hash)
+    if job is None:
+        return web.Response(status=404)
+    return web.json_response(asdict(job.status()))
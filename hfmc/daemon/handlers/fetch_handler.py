@@ -2,21 +2,32 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import os
 import re
-from typing import TYPE_CHECKING, Tuple
+import uuid
+from typing import IO, Awaitable, Callable, List, Tuple
 
-import aiofiles
 from aiohttp import web
 
-from hfmc.common import hf_wrapper, repo_files
-from hfmc.common.etag import load_etag
-
-if TYPE_CHECKING:
-    from pathlib import Path
+from hfmc.common import access_stats, hf_wrapper, repo_files
+from hfmc.common.api_settings import HEADER_NO_PROXY
+from hfmc.common.cache_index import CachedFile
+from hfmc.common.context import HfmcContext
+from hfmc.common.file_meta import FileMeta
+from hfmc.daemon import proxy, relay
+from hfmc.daemon.inflight import InflightFile
 
 logger = logging.getLogger(__name__)
 
+_nb_uploads = 0  # files being sent
+
+
+def nb_uploads() -> int:
+    """Get the number of files being uploaded to peers."""
+    return _nb_uploads
+
 
 def _get_file_info(request: web.Request) -> tuple[str, str, str]:
     user = request.match_info["user"]
@@ -32,115 +43,447 @@ async def download_model(_: web.Request) -> web.Response:
     raise NotImplementedError
 
 
-byte_range_re = re.compile(r"bytes=(\d+)-(\d+)?$")
+byte_range_re = re.compile(r"^(\d*)-(\d*)$")
+
+ByteRange = Tuple[int, int]  # first and last byte positions, inclusive
+
+# send count bytes of a file from offset to the response
+SliceSender = Callable[[web.StreamResponse, int, int], Awaitable[None]]
+
+
+def _coalesce_byte_ranges(ranges: List[ByteRange]) -> List[ByteRange]:
+    """Merge overlapping or adjacent ranges so no byte is sent twice."""
+    merged: List[ByteRange] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
 
+def _parse_byte_ranges(
+    byte_range: str,
+    file_size: int,
+) -> List[ByteRange] | None:
+    """Parse a Range header as described in RFC 7233.
 
-def _get_byte_range(
+    Return None if the header is malformed and should be ignored, or
+    the satisfiable ranges of the file. The list is empty when none of
+    the ranges is satisfiable.
+    """
+    unit, _, specs = byte_range.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges: List[ByteRange] = []
+    for spec in specs.split(","):
+        m = byte_range_re.match(spec.strip())
+        if not m or m.groups() == ("", ""):
+            logger.debug("Invalid byte range: Range=%s", byte_range)
+            return None
+
+        first, last = m.groups()
+
+        if not first:
+            # suffix range: the last N bytes of the file
+            suffix = int(last)
+            if suffix > 0 and file_size > 0:
+                ranges.append((max(file_size - suffix, 0), file_size - 1))
+            continue
+
+        start = int(first)
+        if last and int(last) < start:
+            logger.debug("Invalid byte range: Range=%s", byte_range)
+            return None
+        end = min(int(last), file_size - 1) if last else file_size - 1
+        if start < file_size:
+            ranges.append((start, end))
+
+    return _coalesce_byte_ranges(ranges)
+
+
+def _get_byte_ranges(
     request: web.Request,
-) -> tuple[int | None, int | None] | None:
+    file_size: int,
+) -> List[ByteRange] | None:
     byte_range = request.headers.get("Range")
 
     if not byte_range or byte_range.strip() == "":
-        return None, None
+        return None
+
+    return _parse_byte_ranges(byte_range, file_size)
+
 
-    m = byte_range_re.match(byte_range)
-    err_msg = "Invalid byte range: Range=%s"
+def _read_at(f: IO[bytes], offset: int, size: int) -> bytes:
+    f.seek(offset)
+    return f.read(size)
 
-    if not m:
-        logger.error(err_msg, byte_range)
-        raise ValueError
 
-    first, last = [int(x) if x else None for x in m.groups()]
+async def _file_sender(
+    writer: web.StreamResponse,
+    f: IO[bytes],
+    offset: int,
+    count: int,
+) -> None:
+    loop = asyncio.get_running_loop()
+    buf_size = 2**18  # 256 KB buffer size
+    end = offset + count
+
+    while offset < end:
+        buf = await loop.run_in_executor(
+            None,
+            _read_at,
+            f,
+            offset,
+            min(buf_size, end - offset),
+        )
+        if not buf:
+            break
+        await writer.write(buf)
+        offset += len(buf)
+
+
+async def _sendfile(
+    request: web.Request,
+    writer: web.StreamResponse,
+    f: IO[bytes],
+    offset: int,
+    count: int,
+) -> None:
+    """Send a slice of file with zero-copy sendfile.
 
-    if first is not None and last is not None and last < first:
-        logger.error(err_msg, byte_range)
-        raise ValueError
+    Bytes go straight from the page cache to the socket without being
+    copied through userspace. If the transport cannot do sendfile (i.e.
+    SSL, or the event loop doesn't support it), fall back to _file_sender.
+    """
+    transport = request.transport
+    if transport is None:
+        raise ConnectionResetError
 
-    return first, last
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.sendfile(transport, f, offset, count, fallback=False)
+    except (asyncio.SendfileNotAvailableError, NotImplementedError):
+        logger.debug("sendfile is not available, fallback to file sender")
+        await _file_sender(writer, f, offset, count)
 
 
-async def _file_sender(
+async def _send_inflight(  # noqa: PLR0913
+    request: web.Request,
     writer: web.StreamResponse,
-    file_path: Path,
-    file_start: int | None,
-    file_end: int | None,
+    inflight: InflightFile,
+    f: IO[bytes],
+    offset: int,
+    count: int,
 ) -> None:
-    async with aiofiles.open(file_path, "rb") as f:
-        if file_start is not None:
-            await f.seek(file_start)
+    """Send a slice of a file being downloaded, as its bytes arrive."""
+    end = offset + count
+    while offset < end:
+        available = await inflight.wait_for(offset)
+        size = min(available, end) - offset
+        await _sendfile(request, writer, f, offset, size)
+        offset += size
+
+
+def _content_range(first: int, last: int, file_size: int) -> str:
+    return f"bytes {first}-{last}/{file_size}"
+
+
+def _multipart_heads(
+    ranges: List[ByteRange],
+    file_size: int,
+    boundary: str,
+) -> List[bytes]:
+    """Build the delimiter and headers in front of each body part."""
+    return [
+        (
+            f"--{boundary}\r\n"
+            "Content-Type: application/octet-stream\r\n"
+            f"Content-Range: {_content_range(first, last, file_size)}\r\n"
+            "\r\n"
+        ).encode()
+        for first, last in ranges
+    ]
+
+
+async def _send_file_ranges(
+    request: web.Request,
+    headers: dict[str, str],
+    file_size: int,
+    ranges: List[ByteRange] | None,
+    send: SliceSender,
+) -> web.StreamResponse:
+    """Send the whole file, a single range, or multipart/byteranges."""
+    response = web.StreamResponse(headers=headers)
+    # a fixed content length is required by sendfile, chunked encoding
+    # would interleave chunk headers with file bytes
+    if ranges is None:
+        response.content_length = file_size
+        await response.prepare(request)
+        if file_size > 0:
+            await send(response, 0, file_size)
+
+    elif len(ranges) == 1:
+        first, last = ranges[0]
+        response.set_status(206)
+        response.headers["Content-Range"] = _content_range(first, last, file_size)
+        response.content_length = last - first + 1
+        await response.prepare(request)
+        await send(response, first, last - first + 1)
+
+    else:
+        boundary = uuid.uuid4().hex
+        heads = _multipart_heads(ranges, file_size, boundary)
+        tail = f"--{boundary}--\r\n".encode()
+        response.set_status(206)
+        response.headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        response.content_length = (
+            sum(len(h) for h in heads)
+            + sum(last - first + 1 + 2 for first, last in ranges)
+            + len(tail)
+        )
+        await response.prepare(request)
+        for head, (first, last) in zip(heads, ranges):
+            await response.write(head)
+            await send(response, first, last - first + 1)
+            await response.write(b"\r\n")
+        await response.write(tail)
+
+    await response.write_eof()
+    return response
+
+
+def _proxy_enabled(request: web.Request) -> bool:
+    return HfmcContext.get_proxy() and HEADER_NO_PROXY not in request.headers
 
-        buf_size = 2**18  # 256 KB buffer size
 
-        while True:
-            to_read = min(
-                buf_size,
-                file_end + 1 - await f.tell() if file_end else buf_size,
-            )
+def _token(request: web.Request) -> str | None:
+    """Get the hub token the requester sent."""
+    auth = request.headers.get("Authorization", "")
+    scheme, _, token = auth.partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return token.strip() or None
 
-            buf = await f.read(to_read)
 
-            if not buf:
-                break
+async def _send_file(  # noqa: PLR0913
+    request: web.Request,
+    file_name: str,
+    etag: str,
+    commit_hash: str,
+    file_size: int,
+    send: SliceSender,
+) -> web.StreamResponse:
+    ranges = _get_byte_ranges(request, file_size)
+    if ranges is not None and not ranges:
+        return web.Response(
+            status=416,
+            headers={"Content-Range": f"bytes */{file_size}"},
+        )
+
+    headers = {
+        "Content-disposition": f"attachment; filename={file_name}",
+        "Accept-Ranges": "bytes",
+        # clients take metadata from the download itself, no HEAD needed
+        "ETag": etag,
+        hf_wrapper.COMMIT_HASH_HEADER: commit_hash,
+    }
+
+    global _nb_uploads  # noqa: PLW0603
+    _nb_uploads += 1
+    try:
+        return await _send_file_ranges(request, headers, file_size, ranges, send)
+    finally:
+        _nb_uploads -= 1
+
+
+async def _download_inflight(
+    request: web.Request,
+    inflight: InflightFile,
+) -> web.StreamResponse:
+    """Send a file being fetched into the cache."""
+    try:
+        # the incomplete file exists once a byte is written
+        await inflight.wait_for(0)
+    except OSError:
+        return web.Response(status=404)
+
+    with inflight.open() as f:
 
-            await writer.write(buf)
+        async def send(writer: web.StreamResponse, offset: int, count: int) -> None:
+            await _send_inflight(request, writer, inflight, f, offset, count)
 
-        await writer.write_eof()
+        return await _send_file(
+            request,
+            inflight.file_name,
+            inflight.etag,
+            inflight.commit_hash,
+            inflight.size,
+            send,
+        )
 
 
 async def download_file(
     request: web.Request,
 ) -> web.StreamResponse:
-    """Download file."""
-    br = _get_byte_range(request)
-    if br is None:
-        return web.Response(status=400)
+    """Download file.
 
-    file_start, file_end = br
+    A file being downloaded is sent as it arrives. In proxy mode a missing
+    file is fetched first.
+    """
     repo_id, file_name, revision = _get_file_info(request)
 
-    file_info = hf_wrapper.get_file_info(repo_id, revision, file_name)
+    index = HfmcContext.get_cache_index()
+    file_info = index.get_file(repo_id, revision, file_name)
+    if not file_info:
+        inflight = relay.get_inflight(repo_id, file_name, revision)
+        if inflight is not None:
+            return await _download_inflight(request, inflight)
+    if not file_info and _proxy_enabled(request):
+        inflight = await proxy.fetch(repo_id, file_name, revision, _token(request))
+        if inflight is not None:
+            return await _download_inflight(request, inflight)
+        # the file may be linked to a blob in the cache
+        file_info = index.get_file(repo_id, revision, file_name)
     if not file_info:
         return web.Response(status=404)
+    return await _download_cached(request, file_info)
 
-    file_path = file_info.file_path
-    if not file_path.exists():
+
+async def _download_cached(
+    request: web.Request,
+    file_info: CachedFile,
+) -> web.StreamResponse:
+    """Send a file in the cache."""
+    try:
+        f = file_info.file_path.open("rb")
+    except OSError:
+        # i.e. evicted meanwhile
         return web.Response(status=404)
+    if file_info.etag:
+        # swarm downloads and resumes fetch a file in ranges, one hit is
+        # counted per transfer, for the range from the first byte
+        ranges = _get_byte_ranges(request, file_info.size)
+        first = ranges[0][0] if ranges else 0
+        access_stats.record_access(file_info.etag, hit=first == 0)
+
+    with f:
+
+        async def send(writer: web.StreamResponse, offset: int, count: int) -> None:
+            await _sendfile(request, writer, f, offset, count)
+
+        return await _send_file(
+            request,
+            file_info.file_name,
+            file_info.etag or "",
+            file_info.commit_hash,
+            os.fstat(f.fileno()).st_size,
+            send,
+        )
+
+
+async def download_blob(request: web.Request) -> web.StreamResponse:
+    """Download a file by its etag, whatever repo it is cached for.
+
+    Forks of a repo, and revisions where a file is unchanged, share the
+    content. The commit hash sent is the one of the file found.
+    """
+    etag = request.match_info["etag"]
+    index = HfmcContext.get_cache_index()
+    file_info = index.get_blob(etag)
+    if file_info:
+        return await _download_cached(request, file_info)
+
+    partial = index.get_blob_partial(etag)
+    if partial:
+        inflight = relay.get_inflight(
+            partial.repo_id,
+            partial.file_name,
+            partial.commit_hash,
+        )
+        if inflight is not None:
+            return await _download_inflight(request, inflight)
+    return web.Response(status=404)
+
+
+async def search_model(request: web.Request) -> web.Response:
+    """Summarize how much of a repo revision is cached."""
+    repo_id, revision = _get_repo_info(request)
 
-    headers = {"Content-disposition": f"attachment; filename={file_name}"}
-    response = web.StreamResponse(headers=headers)
-    await response.prepare(request)
-    await _file_sender(response, file_path, file_start, file_end)
-    return response
+    index = HfmcContext.get_cache_index()
+    commit_hash = index.resolve_revision(repo_id, revision)
+    if not commit_hash:
+        return web.Response(status=404)
 
+    cached = index.get_revision_files(repo_id, commit_hash)
+    files = repo_files.load_file_list(repo_id, commit_hash)
+    if files is None and commit_hash != revision:
+        files = repo_files.load_file_list(repo_id, revision)
+    if files is not None:
+        # only count files of the repo, not the extra ones
+        names = set(files)
+        cached = [f for f in cached if f.file_name in names]
+
+    return web.json_response(
+        {
+            "commit_hash": commit_hash,
+            "nb_files": len(cached),
+            "size": sum(f.size for f in cached),
+            "nb_total": len(files) if files is not None else None,
+        },
+    )
 
-async def search_model(_: web.Request) -> web.Response:
-    """Search model."""
-    raise NotImplementedError
+
+def _meta_response(request: web.Request, meta: FileMeta) -> web.Response:
+    return web.Response(
+        headers={
+            "ETag": meta.etag or "",
+            hf_wrapper.COMMIT_HASH_HEADER: meta.commit_hash or "",
+            "Content-Length": str(meta.size),
+            "Accept-Ranges": "bytes",
+            "Location": str(request.url),
+        },
+    )
 
 
 async def search_file(
     request: web.Request,
 ) -> web.Response:
-    """Search file."""
+    """Search file, files being downloaded are found as well."""
     repo_id, file_name, revision = _get_file_info(request)
 
-    rev_info = hf_wrapper.get_revision_info(repo_id, revision)
-    if not rev_info:
+    index = HfmcContext.get_cache_index()
+    file_info = index.get_file(repo_id, revision, file_name)
+    if file_info:
+        return _meta_response(
+            request,
+            FileMeta(file_info.size, file_info.etag, file_info.commit_hash),
+        )
+
+    meta = relay.get_file_meta(repo_id, file_name, revision)
+    if meta is None and _proxy_enabled(request):
+        meta = await proxy.get_file_meta(repo_id, file_name, revision, _token(request))
+    if meta is None:
         return web.Response(status=404)
-
-    file_info = hf_wrapper.get_file_info(repo_id, revision, file_name)
-    if not file_info:
+    return _meta_response(request, meta)
+
+
+async def search_blob(request: web.Request) -> web.Response:
+    """Search a file by its etag, files being downloaded are found as well."""
+    etag = request.match_info["etag"]
+    index = HfmcContext.get_cache_index()
+    file_info = index.get_blob(etag)
+    if file_info:
+        return _meta_response(
+            request,
+            FileMeta(file_info.size, etag, file_info.commit_hash),
+        )
+
+    partial = index.get_blob_partial(etag)
+    if partial is None:
         return web.Response(status=404)
-
-    etag = load_etag(repo_id, file_name, revision)
-    return web.Response(
-        headers={
-            "ETag": etag or "",
-            hf_wrapper.COMMIT_HASH_HEADER: rev_info.commit_hash,
-            "Content-Length": str(file_info.size_on_disk),
-            "Location": str(request.url),
-        },
-    )
+    return _meta_response(request, FileMeta(partial.size, etag, partial.commit_hash))
 
 
 def _get_repo_info(request: web.Request) -> Tuple[str, str]:
@@ -158,3 +501,40 @@ async def get_repo_file_list(request: web.Request) -> web.Response:
     if not files:
         return web.Response(status=404)
     return web.json_response(files)
+
+
+async def get_files_meta(request: web.Request) -> web.Response:
+    """Get sizes and etags of files of a revision in one request.
+
+    The body is a JSON list of file names, all cached files of the
+    revision are returned if the body is empty. Files being downloaded
+    are included, they are relayed as they arrive.
+    """
+    repo_id, revision = _get_repo_info(request)
+
+    file_names: List[str] | None = None
+    if request.can_read_body:
+        try:
+            file_names = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(file_names, list):
+            return web.Response(status=400)
+
+    index = HfmcContext.get_cache_index()
+    commit_hash = index.resolve_revision(repo_id, revision)
+    if not commit_hash:
+        return web.Response(status=404)
+
+    metas = {
+        p.file_name: {"size": p.size, "etag": p.etag}
+        for p in index.get_revision_partials(repo_id, commit_hash)
+    }
+    metas.update(
+        (f.file_name, {"size": f.size, "etag": f.etag})
+        for f in index.get_revision_files(repo_id, commit_hash)
+    )
+    if file_names is not None:
+        metas = {name: metas[name] for name in file_names if name in metas}
+
+    return web.json_response({"commit_hash": commit_hash, "files": metas})
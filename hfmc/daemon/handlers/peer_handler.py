@@ -1,8 +1,81 @@
 """Handle requets related to peers."""
 
+from __future__ import annotations
+
+from typing import Any, Dict
+
 from aiohttp import web
 
+from hfmc.common.api_settings import HEADER_INVENTORY, HEADER_UPLOADS
+from hfmc.common.context import HfmcContext
+from hfmc.common.peer import Peer
+from hfmc.daemon.handlers.fetch_handler import nb_uploads
+from hfmc.daemon.membership import SwimProber
+
+
+def _state_headers() -> Dict[str, str]:
+    return {
+        HEADER_INVENTORY: HfmcContext.get_inventory().tag,
+        HEADER_UPLOADS: str(nb_uploads()),
+    }
+
 
 async def pong(_: web.Request) -> web.Response:
-    """Handle pings from peers."""
-    return web.Response()
+    """Handle pings from peers, tell them the state of this daemon."""
+    return web.Response(headers=_state_headers())
+
+
+async def get_inventory(request: web.Request) -> web.Response:
+    """Export the inventory filter, or its changes since a version."""
+    epoch = request.query.get("epoch")
+    try:
+        since = int(request.query["since"]) if "since" in request.query else None
+    except ValueError:
+        return web.Response(status=400)
+    return web.json_response(HfmcContext.get_inventory().export(epoch, since))
+
+
+def _swim_prober() -> SwimProber | None:
+    prober = HfmcContext.get_peer_prober()
+    return prober if isinstance(prober, SwimProber) else None
+
+
+def _sender(request: web.Request, data: Any) -> tuple[Peer, str]:
+    """Get the sender of a gossip message, and the local ip it reached."""
+    transport = request.transport
+    sockname = transport.get_extra_info("sockname") if transport else None
+    local_ip = sockname[0] if sockname else "127.0.0.1"
+    return Peer(ip=request.remote or "", port=int(data["port"])), local_ip
+
+
+async def gossip(request: web.Request) -> web.Response:
+    """Handle gossip messages of members, reply with the updates to gossip."""
+    prober = _swim_prober()
+    if prober is None:
+        return web.Response(status=404)
+    try:
+        data = await request.json()
+        sender, local_ip = _sender(request, data)
+        reply = prober.handle_gossip(sender, data, local_ip)
+    except (KeyError, TypeError, ValueError):
+        return web.Response(status=400)
+    return web.json_response(reply, headers=_state_headers())
+
+
+async def ping_req(request: web.Request) -> web.Response:
+    """Probe a member for the sender, which can't reach it directly."""
+    prober = _swim_prober()
+    if prober is None:
+        return web.Response(status=404)
+    try:
+        data = await request.json()
+        target = Peer(ip=str(data["ip"]), port=int(data["port"]))
+        sender, local_ip = _sender(request, data["message"])
+        prober.handle_gossip(sender, data["message"], local_ip)
+    except (KeyError, TypeError, ValueError):
+        return web.Response(status=400)
+
+    reply = await prober.handle_ping_req(target)
+    if reply is None:
+        return web.Response(status=504)
+    return web.json_response(reply)
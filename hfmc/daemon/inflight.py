@@ -0,0 +1,156 @@
+"""Files being fetched into the cache, readable while they are written."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import IO, TYPE_CHECKING
+
+from hfmc.client.file_download import DownloadProgress
+from hfmc.common import hf_cache
+
+if TYPE_CHECKING:
+    from hfmc.common.hf_cache import PartialFile
+
+logger = logging.getLogger(__name__)
+
+
+class InflightFile(DownloadProgress):
+    """A file being downloaded into the cache.
+
+    Readers wait for the bytes they need instead of the whole file. The
+    last byte is held back until the download is verified and committed,
+    so a reader of a corrupted download never gets a complete file.
+
+    If the blob is written by another process, the incomplete file is
+    followed by polling its size every {POLL_SEC} seconds.
+    """
+
+    repo_id: str
+    file_name: str
+    revision: str
+    partial: PartialFile | None
+    _written: int
+    _done: bool
+    _ok: bool
+    _following: bool
+    _started: asyncio.Event
+    _changed: asyncio.Event
+
+    POLL_SEC = 0.1
+
+    def __init__(self, repo_id: str, file_name: str, revision: str) -> None:
+        """Init InflightFile of a file to download."""
+        self.repo_id = repo_id
+        self.file_name = file_name
+        self.revision = revision
+        self.partial = None
+        self._written = 0
+        self._done = False
+        self._ok = False
+        self._following = False
+        self._started = asyncio.Event()
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    @property
+    def size(self) -> int:
+        """Size of the file, 0 if not started."""
+        return self.partial.size if self.partial else 0
+
+    @property
+    def etag(self) -> str:
+        """Etag of the file, empty if not started."""
+        return self.partial.etag if self.partial else ""
+
+    @property
+    def commit_hash(self) -> str:
+        """Commit hash of the file, empty if not started."""
+        return self.partial.commit_hash if self.partial else ""
+
+    @property
+    def done(self) -> bool:
+        """Whether the download is over."""
+        return self._done
+
+    def available(self) -> int:
+        """Get the number of bytes which can be read."""
+        if self._done and self._ok:
+            return self.size
+        return min(self._written, self.size - 1)
+
+    def start(self, partial: PartialFile, offset: int) -> None:
+        """Start writing the incomplete file from offset."""
+        self.partial = partial
+        self._written = offset
+        self._following = False
+        self._started.set()
+        self._notify()
+
+    def follow(self, repo_id: str, etag: str, size: int, commit_hash: str) -> None:
+        """Wait for the blob written by another process or task."""
+        self.partial = hf_cache.PartialFile(
+            repo_id=repo_id,
+            etag=etag,
+            size=size,
+            file_name=self.file_name,
+            commit_hash=commit_hash,
+        )
+        self._following = True
+        self._started.set()
+        self._notify()
+
+    def _poll(self) -> None:
+        """Count the bytes written by another process."""
+        partial = hf_cache.load_partial(self.repo_id, self.etag)
+        # bytes of a file written out of order can't be read before the end
+        if partial and partial.sequential and partial.size == self.size:
+            self._written = max(self._written, partial.offset())
+
+    def update(self, nb_bytes: int) -> None:
+        """Append bytes to the incomplete file."""
+        self._written += nb_bytes
+        self._notify()
+
+    def finish(self, ok: bool) -> None:
+        """End the download, the file is committed if ok."""
+        self._done = True
+        self._ok = ok and self.partial is not None
+        self._started.set()
+        self._notify()
+
+    async def wait_started(self) -> bool:
+        """Wait until the metadata is known, return False if it never is."""
+        await self._started.wait()
+        return self.partial is not None and not (self._done and not self._ok)
+
+    async def wait_for(self, offset: int) -> int:
+        """Wait until the byte at offset can be read.
+
+        Return the number of bytes which can be read, raise OSError if the
+        download fails before.
+        """
+        while self.available() <= offset and not (self._done and self._ok):
+            if self._done:
+                raise OSError(f"Failed to download {self.file_name}")
+            if not self._following:
+                await self._changed.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.POLL_SEC)
+            except asyncio.TimeoutError:
+                self._poll()
+        return self.available()
+
+    def open(self) -> IO[bytes]:
+        """Open the file to read, wherever it is now."""
+        if self.partial is None:
+            raise FileNotFoundError(self.file_name)
+        try:
+            return self.partial.path.open("rb")
+        except FileNotFoundError:
+            # committed, the incomplete file is moved to the blob
+            return hf_cache.get_blob_path(self.repo_id, self.etag).open("rb")
@@ -0,0 +1,257 @@
+"""Inventory digests of the model cache exchanged between daemons.
+
+Every daemon keeps a Bloom filter of the files it holds. The keys are
+"{repo_id}@{revision}/{file_name}", for the commit hash and for every
+ref pointing to it, and "etag:{etag}" for the content of every file.
+Files being downloaded are included, since they are relayed to peers.
+
+The filter is versioned. A daemon tells its version in the responses to
+pings, and peers fetch the bits set since the version they have when it
+changes. Which peers probably have a file is then answered locally.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+import re
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Set, Tuple
+
+from hfmc.common.bloom import BloomFilter
+
+if TYPE_CHECKING:
+    from hfmc.common.cache_index import CachedRepo, CacheIndex
+    from hfmc.common.peer import Peer
+
+logger = logging.getLogger(__name__)
+
+MIN_CAPACITY = 4096
+FP_RATE = 0.01
+
+short_commit_re = re.compile(r"^[0-9a-f]{1,39}$")
+
+
+def file_key(repo_id: str, revision: str, file_name: str) -> str:
+    """Get the key of a file in a revision."""
+    return f"{repo_id}@{revision}/{file_name}"
+
+
+def etag_key(etag: str) -> str:
+    """Get the key of a file content."""
+    return f"etag:{etag}"
+
+
+def is_searchable(revision: str) -> bool:
+    """Check if files of the revision can be found by key.
+
+    Keys hold full commit hashes, a short one is never found.
+    """
+    return not short_commit_re.match(revision)
+
+
+def _repo_keys(repo: CachedRepo) -> Set[str]:
+    commits = set(repo.commits) | {commit for commit, _ in repo.partials}
+    revisions: Dict[str, List[str]] = {commit: [commit] for commit in commits}
+    for ref, commit in repo.refs.items():
+        revisions.setdefault(commit, []).append(ref)
+
+    files: List[Tuple[str, str, str | None]] = [
+        (f.commit_hash, f.file_name, f.etag) for f in repo.files.values()
+    ]
+    files.extend((p.commit_hash, p.file_name, p.etag) for p in repo.partials.values())
+
+    keys: Set[str] = set()
+    for commit, file_name, etag in files:
+        keys.update(file_key(repo.repo_id, rev, file_name) for rev in revisions[commit])
+        if etag:
+            keys.add(etag_key(etag))
+    return keys
+
+
+class Inventory:
+    """Versioned Bloom filter of the files in the local cache."""
+
+    _index: CacheIndex
+    _epoch: str
+    _version: int
+    _base_version: int
+    _bloom: BloomFilter
+    _capacity: int
+    _nb_keys: int
+    _repo_keys: Dict[str, Set[str]]
+    # version -> bit positions set in that version
+    _deltas: Deque[Tuple[int, List[int]]]
+
+    MAX_DELTAS = 64
+
+    def __init__(self, index: CacheIndex) -> None:
+        """Init Inventory of the files in the cache index."""
+        self._index = index
+        # a new epoch tells peers to drop the filter of a restarted daemon
+        self._epoch = uuid.uuid4().hex
+        self._version = 0
+        self._base_version = 0
+        self._capacity = MIN_CAPACITY
+        self._bloom = BloomFilter.for_capacity(self._capacity, FP_RATE)
+        self._nb_keys = 0
+        self._repo_keys = {}
+        self._deltas = deque(maxlen=self.MAX_DELTAS)
+        index.add_listener(self.update_repo)
+
+    @property
+    def tag(self) -> str:
+        """Epoch and version of the filter."""
+        return f"{self._epoch}:{self._version}"
+
+    def build(self) -> None:
+        """Build the filter from all repos in the index."""
+        self._repo_keys = {r.repo_id: _repo_keys(r) for r in self._index.get_repos()}
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        keys = set().union(*self._repo_keys.values())
+        # leave room for files added later
+        self._capacity = max(2 * len(keys), MIN_CAPACITY)
+        self._bloom = BloomFilter.for_capacity(self._capacity, FP_RATE)
+        for key in keys:
+            self._bloom.add(key)
+        self._nb_keys = len(keys)
+        self._version += 1
+        self._base_version = self._version
+        self._deltas.clear()
+
+    def update_repo(self, repo_id: str) -> None:
+        """Update the filter after a repo is rescanned."""
+        repo = self._index.get_repo(repo_id)
+        new_keys = _repo_keys(repo) if repo else set()
+        old_keys = self._repo_keys.get(repo_id, set())
+        self._repo_keys[repo_id] = new_keys
+        if new_keys == old_keys:
+            return
+
+        added = new_keys - old_keys
+        removed = old_keys - new_keys
+        if removed or self._nb_keys + len(added) > self._capacity:
+            # keys can't be removed from the filter, and a full filter has
+            # too many false positives
+            self._rebuild()
+            return
+
+        positions: List[int] = []
+        for key in added:
+            positions.extend(self._bloom.add(key))
+        self._nb_keys += len(added)
+        self._version += 1
+        self._deltas.append((self._version, positions))
+
+    def export(self, epoch: str | None = None, since: int | None = None) -> Any:
+        """Export the filter, or the bits set since a version if possible."""
+        data: Dict[str, Any] = {
+            "epoch": self._epoch,
+            "version": self._version,
+            "nb_bits": self._bloom.nb_bits,
+            "nb_hashes": self._bloom.nb_hashes,
+        }
+
+        oldest = self._deltas[0][0] if self._deltas else self._version + 1
+        if (
+            epoch == self._epoch
+            and since is not None
+            and self._base_version <= since <= self._version
+            and oldest <= since + 1
+        ):
+            data["delta"] = [pos for v, d in self._deltas if v > since for pos in d]
+        else:
+            data["bits"] = base64.b64encode(self._bloom.to_bytes()).decode()
+        return data
+
+
+@dataclass
+class PeerDigest:
+    """Inventory filter of a peer."""
+
+    epoch: str = field()
+    version: int = field()
+    bloom: BloomFilter = field()
+
+    @property
+    def tag(self) -> str:
+        """Epoch and version of the filter."""
+        return f"{self.epoch}:{self.version}"
+
+
+class PeerInventories:
+    """Inventory filters fetched from peers."""
+
+    _digests: Dict[Peer, PeerDigest]
+    _syncs: Dict[Peer, asyncio.Task[None]]
+
+    def __init__(self) -> None:
+        """Init PeerInventories."""
+        self._digests = {}
+        self._syncs = {}
+
+    def apply(self, peer: Peer, data: Any) -> None:
+        """Apply a filter or a delta exported by a peer."""
+        digest = self._digests.get(peer)
+        if "delta" in data:
+            if digest is None or digest.epoch != data["epoch"]:
+                raise ValueError
+            digest.bloom.set_bits(data["delta"])
+            digest.version = data["version"]
+            return
+
+        bloom = BloomFilter(
+            data["nb_bits"],
+            data["nb_hashes"],
+            base64.b64decode(data["bits"]),
+        )
+        self._digests[peer] = PeerDigest(data["epoch"], data["version"], bloom)
+
+    def might_have(self, peer: Peer, keys: List[str]) -> bool:
+        """Check if the peer probably has any of the keys.
+
+        A peer with no filter yet might have anything.
+        """
+        digest = self._digests.get(peer)
+        if digest is None:
+            return True
+        return any(key in digest.bloom for key in keys)
+
+    def forget(self, peer: Peer) -> None:
+        """Drop the filter of a peer removed from the peer list."""
+        self._digests.pop(peer, None)
+        sync = self._syncs.pop(peer, None)
+        if sync:
+            sync.cancel()
+
+    def sync(self, peer: Peer) -> None:
+        """Fetch the changes of the peer filter if the pinged tag differs."""
+        digest = self._digests.get(peer)
+        if not peer.inventory or (digest and digest.tag == peer.inventory):
+            return
+        if peer in self._syncs:
+            return
+
+        task = asyncio.create_task(self._sync(peer, digest))
+        self._syncs[peer] = task
+        task.add_done_callback(lambda _: self._syncs.pop(peer, None))
+
+    async def _sync(self, peer: Peer, digest: PeerDigest | None) -> None:
+        # pylint: disable=import-outside-toplevel
+        from hfmc.client.http_request import get_inventory  # cyclic import
+
+        epoch = digest.epoch if digest else None
+        since = digest.version if digest else None
+        data = await get_inventory(peer, epoch, since)
+        if data is None:
+            return
+        try:
+            self.apply(peer, data)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.debug("Bad inventory from %s: %s", peer, e)
+            self._digests.pop(peer, None)
@@ -0,0 +1,485 @@
+"""Gossip membership of daemons, in the way of SWIM.
+
+Instead of probing every configured peer, a daemon probes one member per
+protocol period, so the probe load of a daemon stays constant however
+many daemons there are. The peers in the config are only seeds to join.
+
+A probe is a gossip message carrying a few recent membership updates,
+and the reply carries the updates of the probed member. Updates about
+members joining, leaving, being suspected or found dead spread this way
+to all daemons in O(log n) periods.
+
+A member which doesn't answer a probe is probed indirectly through
+{INDIRECT_PROBES} other members. If none of them reaches it, it is
+suspected, and taken as dead if it doesn't refute the suspicion within
+{SUSPECT_SEC} seconds. A member refutes a suspicion by gossiping itself
+alive with a higher incarnation number.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+from hfmc.common.peer import Peer, ewma
+from hfmc.daemon.prober import PeerProber
+
+logger = logging.getLogger(__name__)
+
+ALIVE = "alive"
+SUSPECT = "suspect"
+DEAD = "dead"
+STATES = (ALIVE, SUSPECT, DEAD)
+
+# updates piggybacked on a message
+MAX_UPDATES = 16
+# an update is sent {RETRANSMIT_MULT} * log2(n + 1) times
+RETRANSMIT_MULT = 3
+
+# gossip message to a member, reply of the member or None if it is down
+GossipFunc = Callable[[Peer, Dict[str, Any]], Awaitable[Any]]
+# gossip message to a member sent through a helper member
+PingReqFunc = Callable[[Peer, Peer, Dict[str, Any]], Awaitable[Any]]
+
+
+@dataclass
+class Member:
+    """A daemon known by gossip."""
+
+    peer: Peer = field()
+    state: str = field()
+    incarnation: int = field()
+    # monotonic time of the last state change
+    since: float = field()
+
+
+@dataclass
+class Update:
+    """A change of member state spread by gossip."""
+
+    ip: str = field()
+    port: int = field()
+    state: str = field()
+    incarnation: int = field()
+
+    @classmethod
+    def from_json(cls, data: Any) -> Update:
+        """Load an update from a message, raise ValueError if bad."""
+        try:
+            update = cls(
+                ip=str(data["ip"]),
+                port=int(data["port"]),
+                state=str(data["state"]),
+                incarnation=int(data["incarnation"]),
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError from e
+        if update.state not in STATES:
+            raise ValueError
+        return update
+
+    def to_json(self) -> Dict[str, Any]:
+        """Dump the update to a message."""
+        return {
+            "ip": self.ip,
+            "port": self.port,
+            "state": self.state,
+            "incarnation": self.incarnation,
+        }
+
+
+class Membership:
+    """Member list of a daemon, and the updates it has to gossip.
+
+    It only holds the state, the protocol is run by SwimProber.
+    """
+
+    _port: int
+    _self_ips: Set[str]
+    _incarnation: int
+    _members: Dict[Peer, Member]
+    # update -> times left to send it
+    _gossips: Dict[Peer, Tuple[Update, int]]
+
+    SUSPECT_SEC = 5.0
+    # dead members are remembered for a while, not to take them back in
+    # from stale gossip
+    DEAD_TTL_SEC = 60.0
+
+    def __init__(self, port: int, incarnation: int | None = None) -> None:
+        """Init Membership of the daemon listening on port."""
+        self._port = port
+        self._self_ips = {"127.0.0.1", "localhost"}
+        # a restarted daemon must win over what is said about its last run
+        self._incarnation = int(time.time()) if incarnation is None else incarnation
+        self._members = {}
+        self._gossips = {}
+
+    @property
+    def incarnation(self) -> int:
+        """Incarnation number of this daemon."""
+        return self._incarnation
+
+    def add_self_ip(self, ip: str) -> None:
+        """Record an address of this daemon, as seen by a peer."""
+        self._self_ips.add(ip)
+
+    def is_self(self, peer: Peer) -> bool:
+        """Check if the peer is this daemon."""
+        return peer.port == self._port and peer.ip in self._self_ips
+
+    def get(self, peer: Peer) -> Member | None:
+        """Get a member."""
+        return self._members.get(peer)
+
+    def members(self, *states: str) -> List[Member]:
+        """Get members in any of the states, or all of them."""
+        return [m for m in self._members.values() if not states or m.state in states]
+
+    def _gossip(self, member: Member) -> None:
+        update = Update(
+            member.peer.ip,
+            member.peer.port,
+            member.state,
+            member.incarnation,
+        )
+        n = len(self._members) + 1
+        times = RETRANSMIT_MULT * max(math.ceil(math.log2(n + 1)), 1)
+        self._gossips[member.peer] = (update, times)
+
+    def _set_state(self, member: Member, state: str, incarnation: int) -> None:
+        if state != member.state:
+            member.since = time.monotonic()
+            member.peer.alive = state == ALIVE
+        member.state = state
+        member.incarnation = incarnation
+        self._gossip(member)
+
+    def _refute(self, incarnation: int) -> None:
+        self._incarnation = max(self._incarnation, incarnation) + 1
+        # gossip a fresh alive of this daemon by every address known
+        n = len(self._members) + 1
+        times = RETRANSMIT_MULT * max(math.ceil(math.log2(n + 1)), 1)
+        for ip in self._self_ips - {"127.0.0.1", "localhost"}:
+            update = Update(ip, self._port, ALIVE, self._incarnation)
+            self._gossips[Peer(ip, self._port)] = (update, times)
+
+    def apply(self, update: Update) -> Member | None:
+        """Apply an update by the rules of SWIM.
+
+        Return the member if its state changed.
+        """
+        peer = Peer(update.ip, update.port)
+        if self.is_self(peer):
+            if update.state != ALIVE and update.incarnation >= self._incarnation:
+                self._refute(update.incarnation)
+            return None
+
+        member = self._members.get(peer)
+        if member is None:
+            if update.state == DEAD:
+                return None
+            member = Member(peer, update.state, update.incarnation, time.monotonic())
+            member.peer.alive = update.state == ALIVE
+            self._members[peer] = member
+            self._gossip(member)
+            return member
+
+        if update.state == ALIVE:
+            newer = update.incarnation > member.incarnation
+        elif update.state == SUSPECT:
+            newer = update.incarnation > member.incarnation or (
+                update.incarnation == member.incarnation and member.state == ALIVE
+            )
+        else:
+            newer = update.incarnation >= member.incarnation and member.state != DEAD
+        if not newer:
+            return None
+
+        self._set_state(member, update.state, update.incarnation)
+        return member
+
+    def alive(self, peer: Peer, incarnation: int) -> Member | None:
+        """Mark a member alive after it answered, return it if changed."""
+        return self.apply(Update(peer.ip, peer.port, ALIVE, incarnation))
+
+    def suspect(self, peer: Peer) -> Member | None:
+        """Suspect a member which didn't answer, return it if changed."""
+        member = self._members.get(peer)
+        if member is None or member.state != ALIVE:
+            return None
+        return self.apply(Update(peer.ip, peer.port, SUSPECT, member.incarnation))
+
+    def expire(self) -> List[Member]:
+        """Declare suspects dead after timeout and drop old dead members.
+
+        Return the members which are declared dead or dropped.
+        """
+        now = time.monotonic()
+        expired = []
+        for peer, member in list(self._members.items()):
+            if member.state == SUSPECT and now - member.since > self.SUSPECT_SEC:
+                self._set_state(member, DEAD, member.incarnation)
+                expired.append(member)
+            elif member.state == DEAD and now - member.since > self.DEAD_TTL_SEC:
+                del self._members[peer]
+                self._gossips.pop(peer, None)
+                expired.append(member)
+        return expired
+
+    def take_updates(self) -> List[Dict[str, Any]]:
+        """Get the updates to piggyback on a message.
+
+        Updates sent the fewest times go first, and an update is dropped
+        once it is sent enough times to have reached all members.
+        """
+        pending = sorted(self._gossips.items(), key=lambda kv: -kv[1][1])
+        updates = []
+        for peer, (update, times) in pending[:MAX_UPDATES]:
+            updates.append(update.to_json())
+            if times <= 1:
+                del self._gossips[peer]
+            else:
+                self._gossips[peer] = (update, times - 1)
+        return updates
+
+    def message(self) -> Dict[str, Any]:
+        """Build a gossip message of this daemon."""
+        return {
+            "port": self._port,
+            "incarnation": self._incarnation,
+            "updates": self.take_updates(),
+        }
+
+    def receive(self, sender: Peer, data: Any) -> List[Member]:
+        """Apply a gossip message of a member, return the changed members.
+
+        Raise ValueError if the message is bad.
+        """
+        try:
+            incarnation = int(data["incarnation"])
+            updates = [Update.from_json(u) for u in data["updates"]]
+        except (KeyError, TypeError) as e:
+            raise ValueError from e
+
+        changed = []
+        member = self.alive(sender, incarnation)
+        if member:
+            changed.append(member)
+        for update in updates:
+            member = self.apply(update)
+            if member:
+                changed.append(member)
+        return changed
+
+
+class SwimProber(PeerProber):
+    """Prober running the gossip membership protocol.
+
+    One member is probed every {PERIOD_SEC} seconds, in a round robin
+    over the shuffled member list. Seeds which are not alive members are
+    joined every {JOIN_SEC} seconds.
+    """
+
+    _membership: Membership
+    _gossip_func: GossipFunc | None
+    _ping_req_func: PingReqFunc | None
+    _round: List[Peer]
+    _last_join: float
+
+    PERIOD_SEC = 1.0
+    JOIN_SEC = 30.0
+    INDIRECT_PROBES = 3
+
+    def __init__(
+        self,
+        seeds: List[Peer],
+        port: int,
+        gossip: GossipFunc | None = None,
+        ping_req: PingReqFunc | None = None,
+    ) -> None:
+        """Init SwimProber of the daemon on port, joining by the seeds."""
+        super().__init__(seeds)
+        self._membership = Membership(port)
+        self._gossip_func = gossip
+        self._ping_req_func = ping_req
+        self._round = []
+        self._last_join = -math.inf
+
+    @property
+    def membership(self) -> Membership:
+        """Member list of the daemon."""
+        return self._membership
+
+    def get_alives(self) -> List[Peer]:
+        """Get live member list."""
+        return [m.peer for m in self._membership.members(ALIVE)]
+
+    def report_throughput(self, peer: Peer, throughput: float) -> None:
+        """Record the speed of a download from a member in B/s."""
+        member = self._membership.get(peer)
+        if member:
+            member.peer.throughput = ewma(member.peer.throughput, throughput)
+
+    def _on_changed(self, members: List[Member]) -> None:
+        for member in members:
+            if member.state == ALIVE:
+                logger.debug("Member %s is alive", member.peer)
+            else:
+                logger.debug("Member %s is %s", member.peer, member.state)
+                self._inventories.forget(member.peer)
+
+    def _on_reply(self, peer: Peer, reply: Any) -> bool:
+        """Apply the reply of a probed member, return if it is valid."""
+        try:
+            if "you" in reply:
+                self._membership.add_self_ip(str(reply["you"]))
+            changed = self._membership.receive(peer, reply)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.debug("Bad gossip from %s: %s", peer, e)
+            return False
+
+        self._on_changed(changed)
+        member = self._membership.get(peer)
+        if member and member.state == ALIVE:
+            # a direct reply tells the same state as a pong
+            if peer.inventory:
+                member.peer.inventory = peer.inventory
+                member.peer.uploads = peer.uploads
+            if peer.rtt:
+                member.peer.rtt = ewma(member.peer.rtt, peer.rtt)
+            self._inventories.sync(member.peer)
+        return True
+
+    def handle_gossip(self, sender: Peer, data: Any, local_ip: str) -> Any:
+        """Apply a gossip message received, return the reply.
+
+        Raise ValueError if the message is bad.
+        """
+        self._membership.add_self_ip(local_ip)
+        self._on_changed(self._membership.receive(sender, data))
+        reply = self._membership.message()
+        reply["you"] = sender.ip
+        return reply
+
+    async def handle_ping_req(self, target: Peer) -> Any:
+        """Probe a member for another one, return its reply or None."""
+        gossip, _ = self._resolve_funcs()
+        reply = await gossip(target, self._membership.message())
+        if reply is not None:
+            self._on_reply(target, reply)
+        return reply
+
+    def _resolve_funcs(self) -> Tuple[GossipFunc, PingReqFunc]:
+        if self._gossip_func is None or self._ping_req_func is None:
+            # pylint: disable=import-outside-toplevel
+            from hfmc.client.http_request import gossip, ping_req  # cyclic import
+
+            self._gossip_func = self._gossip_func or gossip
+            self._ping_req_func = self._ping_req_func or ping_req
+        return self._gossip_func, self._ping_req_func
+
+    def _next_target(self) -> Peer | None:
+        if not self._round:
+            self._round = [m.peer for m in self._membership.members(ALIVE, SUSPECT)]
+            random.shuffle(self._round)
+        while self._round:
+            peer = self._round.pop()
+            member = self._membership.get(peer)
+            if member and member.state != DEAD and peer not in self._inflight:
+                return member.peer
+        return None
+
+    async def _probe(self, target: Peer) -> Peer:
+        gossip, ping_req = self._resolve_funcs()
+        probe = Peer(target.ip, target.port)
+        reply = await gossip(probe, self._membership.message())
+        if reply is not None and self._on_reply(probe, reply):
+            return target
+
+        helpers = [m.peer for m in self._membership.members(ALIVE) if m.peer != target]
+        helpers = random.sample(helpers, min(self.INDIRECT_PROBES, len(helpers)))
+        if helpers:
+            message = self._membership.message()
+            replies = await asyncio.gather(
+                *(ping_req(h, probe, message) for h in helpers),
+            )
+            for reply in replies:
+                if reply is not None and self._on_reply(probe, reply):
+                    return target
+
+        member = self._membership.suspect(target)
+        if member:
+            self._on_changed([member])
+        return target
+
+    async def _join(self, seed: Peer) -> Peer:
+        gossip, _ = self._resolve_funcs()
+        probe = Peer(seed.ip, seed.port)
+        reply = await gossip(probe, self._membership.message())
+        if reply is not None:
+            self._on_reply(probe, reply)
+        return seed
+
+    def _start(self, peer: Peer, coro: Awaitable[Peer]) -> None:
+        task = asyncio.ensure_future(coro)
+        self._inflight[peer] = task
+        task.add_done_callback(functools.partial(self._task_cb, peer))
+
+    def _task_cb(self, peer: Peer, task: asyncio.Future) -> None:
+        if self._inflight.get(peer) is task:
+            del self._inflight[peer]
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("gossip error", exc_info=task.exception())
+
+    def _do_update_peers(self) -> None:
+        if self._updates is not None:
+            self._peers = list(self._updates)
+            self._updates = None
+            self._last_join = -math.inf  # join new seeds now
+
+    def _join_seeds(self) -> None:
+        now = time.monotonic()
+        if now - self._last_join < self._jitter(self.JOIN_SEC):
+            return
+        self._last_join = now
+        for seed in self._peers:
+            member = self._membership.get(seed)
+            if self._membership.is_self(seed) or seed in self._inflight:
+                continue
+            if member is None or member.state != ALIVE:
+                self._start(seed, self._join(seed))
+
+    async def start_probe(self) -> None:
+        """Run the protocol, one probe per period."""
+        if self._probing:
+            return
+
+        self._probing = True
+        self._wakeup = asyncio.Event()
+        if not self._peers:
+            logger.debug("No seeds configured to join")
+
+        while self._probing:
+            self._wakeup.clear()
+            self._do_update_peers()
+            self._on_changed(self._membership.expire())
+            self._join_seeds()
+
+            target = self._next_target()
+            if target is not None:
+                self._start(target, self._probe(target))
+
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=self._jitter(self.PERIOD_SEC),
+                )
+            except asyncio.TimeoutError:
+                pass
@@ -3,114 +3,252 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import heapq
 import logging
-from typing import TYPE_CHECKING, List
+import random
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Dict, List, Tuple
+
+from hfmc.common.peer import ewma
+from hfmc.daemon.inventory import PeerInventories
 
 if TYPE_CHECKING:
     from hfmc.common.peer import Peer
 
 logger = logging.getLogger(__name__)
 
+PingFunc = Callable[["Peer"], Coroutine[Any, Any, "Peer"]]
+
+
+def _keep_state(old: Peer, new: Peer) -> None:
+    """Copy the state of a peer to the same one of a new peer list."""
+    new.alive = old.alive
+    new.epoch = old.epoch
+    new.inventory = old.inventory
+    new.rtt = old.rtt
+    new.throughput = old.throughput
+    new.uploads = old.uploads
+
 
 class PeerProber:
-    """Prober for the liveness of other peers."""
+    """Prober for the liveness of other peers.
+
+    Every peer has its own due time. Alive peers are probed every
+    {ALIVE_INTERVAL_SEC} seconds. A failed probe is retried after
+    {RETRY_SEC} seconds, and a peer is taken as dead after {MAX_MISSES}
+    failures in a row. Dead peers are probed with an exponential backoff
+    up to {MAX_BACKOFF_SEC} seconds. All intervals are jittered, so
+    peers don't probe each other in lockstep.
+
+    Due peers are probed concurrently, at most {MAX_PROBES} at a time, so
+    the time to notice a peer going down or up is bounded by the
+    intervals, not by the number of peers.
+    """
 
     _peers: List[Peer]
     _actives: set
     _updates: set | None
-    _probe_heap: List[tuple[int, Peer]]
+    _probe_heap: List[Tuple[float, int, Peer]]
+    _misses: Dict[Peer, int]
+    _inflight: Dict[Peer, asyncio.Task[Peer]]
+    _wakeup: asyncio.Event | None
+    _seq: int
     _probing: bool
     _probe_task: asyncio.Task[None] | None
-
-    INTERVAL_SEC = 3
-
-    def __init__(self, peers: List[Peer]) -> None:
-        """Init PeerProber."""
+    _inventories: PeerInventories
+    _ping: PingFunc | None
+
+    MAX_PROBES = 32
+    ALIVE_INTERVAL_SEC = 10.0
+    RETRY_SEC = 1.0
+    MAX_MISSES = 2
+    MAX_BACKOFF_SEC = 60.0
+    JITTER = 0.2
+
+    def __init__(self, peers: List[Peer], ping: PingFunc | None = None) -> None:
+        """Init PeerProber, ping is the function sending a probe."""
         self._peers = peers
         self._actives = set()
         self._updates = None
         self._probe_heap = []
+        self._misses = {}
+        self._inflight = {}
+        self._wakeup = None
+        self._seq = 0
         self._probing = False
         self._probe_task = None
+        self._inventories = PeerInventories()
+        self._ping = ping
 
     def get_alives(self) -> List[Peer]:
         """Get live peer list."""
         return list(self._actives)
 
+    def report_throughput(self, peer: Peer, throughput: float) -> None:
+        """Record the speed of a download from a peer in B/s."""
+        for p in self._peers:
+            if p == peer:
+                p.throughput = ewma(p.throughput, throughput)
+                return
+
+    def get_inventories(self) -> PeerInventories:
+        """Get inventory filters fetched from peers."""
+        return self._inventories
+
     def update_peers(self, peers: List[Peer]) -> None:
         """Accept a new list of peers to probe."""
         self._updates = set(peers)
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _jitter(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.JITTER, 1 + self.JITTER)  # noqa: S311
+
+    def _schedule(self, peer: Peer, delay: float) -> None:
+        due = asyncio.get_running_loop().time() + delay
+        self._seq += 1  # keeps peers out of comparison
+        heapq.heappush(self._probe_heap, (due, self._seq, peer))
+
+    def _next_delay(self, peer: Peer) -> float:
+        misses = self._misses.get(peer, 0)
+        if misses == 0:
+            return self._jitter(self.ALIVE_INTERVAL_SEC)
+        if misses < self.MAX_MISSES:
+            return self._jitter(self.RETRY_SEC)
+        backoff = self.RETRY_SEC * 2 ** (misses - self.MAX_MISSES + 1)
+        return self._jitter(min(backoff, self.MAX_BACKOFF_SEC))
 
     def _reset_peer_heap(self) -> None:
         self._probe_heap = []
         for peer in self._peers:
-            heapq.heappush(self._probe_heap, (peer.epoch, peer))
+            if peer not in self._inflight:
+                # spread the first probes over a short time
+                self._schedule(peer, random.uniform(0, self.RETRY_SEC))  # noqa: S311
 
     def _do_update_peers(self) -> None:
         if self._updates is not None:
             peers_removed = set(self._peers) - self._updates
             self._actives = self._actives - peers_removed
-
+            for peer in peers_removed:
+                self._inventories.forget(peer)
+                self._misses.pop(peer, None)
+                probe = self._inflight.pop(peer, None)
+                if probe:
+                    probe.cancel()
+
+            known = {p: p for p in self._peers}
             self._peers = list(self._updates)
             self._updates = None
+            for peer in self._peers:
+                if peer in known:  # peer match by ip and port
+                    _keep_state(known[peer], peer)
+            current = {p: p for p in self._peers}
+            self._actives = {current[p] for p in self._actives}
 
             self._reset_peer_heap()
 
+    def _on_probed(self, probed: Peer) -> None:
+        peer = next((p for p in self._peers if p == probed), None)
+        if peer is None:
+            return
+        if peer is not probed:
+            # probe started before the peer list was updated
+            _keep_state(probed, peer)
+
+        if peer.alive:
+            self._misses.pop(peer, None)
+            self._actives.discard(peer)  # replace with the updated peer
+            self._actives.add(peer)
+            # fetch the inventory if it changed since last ping
+            self._inventories.sync(peer)
+        else:
+            misses = self._misses.get(peer, 0) + 1
+            self._misses[peer] = misses
+            if misses >= self.MAX_MISSES:
+                self._actives.discard(peer)
+
+        self._schedule(peer, self._next_delay(peer))
+
+    def _probe_cb(self, peer: Peer, task: asyncio.Task[Peer]) -> None:
+        if self._inflight.get(peer) is task:
+            del self._inflight[peer]
+        if self._wakeup:
+            self._wakeup.set()  # a probe slot is free
+
+        if task.cancelled():
+            logger.debug("probing is canceled")
+            return
+        if task.exception() is not None:
+            logger.debug("probe error", exc_info=task.exception())
+            peer.alive = False
+        else:
+            peer = task.result()
+        self._on_probed(peer)
+
+    def _start_due_probes(self, ping: PingFunc) -> float | None:
+        """Start probes of due peers, return the delay to the next one."""
+        loop = asyncio.get_running_loop()
+        peers = set(self._peers)
+        while self._probe_heap and len(self._inflight) < self.MAX_PROBES:
+            due, _, peer = self._probe_heap[0]
+            if due > loop.time():
+                return due - loop.time()
+            heapq.heappop(self._probe_heap)
+            if peer not in peers or peer in self._inflight:
+                continue
+
+            probe = asyncio.create_task(ping(peer))
+            self._inflight[peer] = probe
+            probe.add_done_callback(functools.partial(self._probe_cb, peer))
+
+        # no peer is due, or wait for a free slot
+        return None
+
     async def start_probe(self) -> None:
         """Start probing peers for liveness.
 
-        This function uses asyncio to probe peers for liveness.
-        It will wake up every {INTERVAL_SEC} seconds, pop a peer
-        from the heap, and then send a ping request to the peer.
-        The peer is taken out of the heap until we get a response from
-        the peer or the ping request times out.
-        After that, the peer is put back into the heap.
+        The loop sleeps until the next peer is due, a probe finishes or
+        the peer list changes, then starts probes of all due peers.
         """
-        # pylint: disable=import-outside-toplevel
-        from hfmc.client.http_request import ping  # resolve cyclic import
+        if self._ping is None:
+            # pylint: disable=import-outside-toplevel
+            from hfmc.client.http_request import ping  # resolve cyclic import
+
+            self._ping = ping
 
         if self._probing:
             return
 
         self._probing = True
+        self._wakeup = asyncio.Event()
         self._reset_peer_heap()
 
         if not self._probe_heap:
             logger.debug("No peers configured to probe")
 
-        def probe_cb(task: asyncio.Task[Peer]) -> None:
-            try:
-                peer = task.result()
-
-                if peer in self._peers:
-                    heapq.heappush(self._probe_heap, (peer.epoch, peer))
-
-                if peer.alive and peer in self._peers:
-                    self._actives.add(peer)
-                else:
-                    self._actives.discard(peer)
-            except asyncio.exceptions.CancelledError:
-                logger.debug("probing is canceled")
-
         while self._probing:
-            await asyncio.sleep(self.INTERVAL_SEC)
-
+            self._wakeup.clear()
             self._do_update_peers()
+            delay = self._start_due_probes(self._ping)
 
-            if self._probe_heap:
-                _, peer = heapq.heappop(self._probe_heap)
-                probe = asyncio.create_task(ping(peer))
-                probe.add_done_callback(probe_cb)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
 
     def set_probe_task(self, task: asyncio.Task[None]) -> None:
         """Save the coroutine task of probing to avoid gc."""
         self._probe_task = task
 
     def stop_probe(self) -> None:
-        """Stop probing."""
-        # TODO: cancel running probe tasks  # noqa: FIX002, TD002, TD003
+        """Stop probing and cancel running probes."""
         self._probing = False
+        for probe in self._inflight.values():
+            probe.cancel()
+        self._inflight = {}
+        if self._probe_task is not None:
+            self._probe_task.cancel()
         self._probe_heap = []
+        self._misses = {}
         self._actives = set()
         self._probe_task = None
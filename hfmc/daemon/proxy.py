@@ -0,0 +1,183 @@
+"""Pull-through proxy of the hub for files missing in the cache.
+
+In proxy mode, a request for a file the daemon doesn't have makes it
+fetch the file from a peer, or from the hub if no peer has it. The bytes
+are streamed to the requester while they are written into the cache, so
+later requests are served locally. Clients only need to set HF_ENDPOINT
+to the daemon.
+
+Requests of other daemons carry HEADER_NO_PROXY, and are never proxied.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, List, Set, Tuple
+
+import aiohttp
+from huggingface_hub.utils import build_hf_headers  # type: ignore[import-untyped]
+
+from hfmc.client import cache_controller, file_download
+from hfmc.client.http_request import PEER_HEADERS
+from hfmc.client.model_controller import SITE_ENDPOINTS, rank_peers
+from hfmc.common.context import HfmcContext
+from hfmc.common.file_meta import FileMeta
+from hfmc.daemon.inflight import InflightFile
+from hfmc.daemon.inventory import file_key, is_searchable
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_ENDPOINTS = SITE_ENDPOINTS
+# the size is unknown before the fetch, peers are ranked for a file this large
+RANK_SIZE = 100 * 10**6
+
+_inflights: Dict[str, InflightFile] = {}
+_fetches: Set[asyncio.Task[None]] = set()  # keep strong references
+
+Source = Tuple[str, Dict[str, str]]  # endpoint and headers
+
+
+def _sources(
+    repo_id: str,
+    file_name: str,
+    revision: str,
+    token: str | None,
+) -> List[Source]:
+    """Get peers which probably have the file, then the upstream sites."""
+    prober = HfmcContext.get_peer_prober()
+    peers = prober.get_alives()
+    if is_searchable(revision):
+        keys = [file_key(repo_id, revision, file_name)]
+        inventories = prober.get_inventories()
+        peers = [p for p in peers if inventories.might_have(p, keys)]
+    peers = rank_peers(peers, RANK_SIZE)
+
+    sources: List[Source] = [(f"http://{p.ip}:{p.port}", PEER_HEADERS) for p in peers]
+    headers = build_hf_headers(token=token)
+    sources.extend((endpoint, headers) for endpoint in UPSTREAM_ENDPOINTS)
+    return sources
+
+
+async def _make_room(repo_id: str, meta: FileMeta) -> None:
+    """Evict files to keep the cache under its capacity with the file."""
+    evicted = await asyncio.get_running_loop().run_in_executor(
+        None,
+        cache_controller.make_room,
+        meta.size or 0,
+        [f"{repo_id}@{meta.commit_hash}"],
+    )
+    index = HfmcContext.get_cache_index()
+    for evicted_id in evicted.repo_ids if evicted else []:
+        index.refresh_repo(evicted_id)
+
+
+async def _fetch(inflight: InflightFile, token: str | None) -> None:
+    repo_id, file_name, revision = (
+        inflight.repo_id,
+        inflight.file_name,
+        inflight.revision,
+    )
+    ok = False
+    try:
+        # the size is only known from the sources, ask them before the download
+        meta = await get_file_meta(repo_id, file_name, revision, token)
+        if meta is None:
+            return
+        await _make_room(repo_id, meta)
+        for endpoint, headers in _sources(repo_id, file_name, revision, token):
+            try:
+                ok = await file_download.download_file(
+                    endpoint,
+                    repo_id,
+                    file_name,
+                    revision,
+                    headers,
+                    progress=inflight,
+                )
+            except file_download.GatedRepoError:
+                logger.info("Access to %s is denied by %s", repo_id, endpoint)
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                OSError,
+                ValueError,
+            ) as e:
+                logger.debug("Failed to fetch %s from %s: %s", file_name, endpoint, e)
+            if ok:
+                logger.info("Fetched %s of %s from %s", file_name, repo_id, endpoint)
+                break
+    finally:
+        if ok:
+            # serve later requests from the cache
+            HfmcContext.get_cache_index().refresh_repo(repo_id)
+        _inflights.pop(file_key(repo_id, revision, file_name), None)
+        inflight.finish(ok)
+
+
+async def fetch(
+    repo_id: str,
+    file_name: str,
+    revision: str,
+    token: str | None = None,
+) -> InflightFile | None:
+    """Fetch a missing file into the cache, or join the fetch running.
+
+    Return the file to read as it is written, or None if it can't be
+    fetched or is linked to a blob already in the cache.
+    """
+    key = file_key(repo_id, revision, file_name)
+    inflight = _inflights.get(key)
+    if inflight is None:
+        inflight = InflightFile(repo_id, file_name, revision)
+        _inflights[key] = inflight
+        task = asyncio.create_task(_fetch(inflight, token))
+        _fetches.add(task)
+        task.add_done_callback(_fetches.discard)
+
+    if not await inflight.wait_started():
+        return None
+    return inflight
+
+
+def get_inflight(
+    repo_id: str,
+    file_name: str,
+    revision: str,
+) -> InflightFile | None:
+    """Get a file being fetched, if its metadata is known."""
+    inflight = _inflights.get(file_key(repo_id, revision, file_name))
+    if inflight is None or inflight.partial is None:
+        return None
+    return inflight
+
+
+async def get_file_meta(
+    repo_id: str,
+    file_name: str,
+    revision: str,
+    token: str | None = None,
+) -> FileMeta | None:
+    """Get metadata of a missing file from its sources."""
+    inflight = get_inflight(repo_id, file_name, revision)
+    if inflight is not None:
+        return FileMeta(inflight.size, inflight.etag, inflight.commit_hash)
+
+    for endpoint, headers in _sources(repo_id, file_name, revision, token):
+        try:
+            meta = await file_download.get_file_meta(
+                endpoint,
+                repo_id,
+                file_name,
+                revision,
+                headers,
+            )
+        except file_download.GatedRepoError:
+            logger.info("Access to %s is denied by %s", repo_id, endpoint)
+            continue
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+            logger.debug("Failed to get %s from %s: %s", file_name, endpoint, e)
+            continue
+        if meta is not None:
+            return meta
+    return None
@@ -0,0 +1,120 @@
+"""Relay of files being downloaded into the cache.
+
+A daemon receiving a large file looks like it has nothing until the file
+is complete. Instead, files being downloaded in order are advertised to
+peers, and the bytes received so far are served at once, so a model fans
+out across peers in a pipeline rather than hop by hop.
+
+The incomplete file may be written by the CLI, or by the proxy of this
+daemon. Its size is polled every {POLL_SEC} seconds, and readers wait for
+the bytes they need. The writer is considered gone if the file doesn't
+grow for {STALL_SEC} seconds and the lock of the blob is free.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Dict, Set, Tuple
+
+from filelock import Timeout
+
+from hfmc.common import hf_cache
+from hfmc.common.context import HfmcContext
+from hfmc.common.file_meta import FileMeta
+from hfmc.daemon import proxy
+from hfmc.daemon.inflight import InflightFile
+
+logger = logging.getLogger(__name__)
+
+POLL_SEC = 0.1
+STALL_SEC = 5.0
+
+# (repo id, etag) -> file relayed
+_relays: Dict[Tuple[str, str], InflightFile] = {}
+_watches: Set[asyncio.Task[None]] = set()  # keep strong references
+
+
+def _writer_gone(repo_id: str, etag: str) -> bool:
+    lock = hf_cache.blob_lock(repo_id, etag)
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        return False
+    lock.release()
+    return True
+
+
+async def _watch(inflight: InflightFile, offset: int) -> None:
+    """Follow the incomplete file until it is committed or abandoned."""
+    repo_id, etag, size = inflight.repo_id, inflight.etag, inflight.size
+    written = offset
+    last_change = time.monotonic()
+    ok = False
+    try:
+        while True:
+            await asyncio.sleep(POLL_SEC)
+            partial = hf_cache.load_partial(repo_id, etag)
+            if partial is None or not partial.sequential or partial.size != size:
+                # committed, or dropped by the writer
+                blob_path = hf_cache.get_blob_path(repo_id, etag)
+                ok = blob_path.exists() and blob_path.stat().st_size == size
+                return
+
+            offset = partial.offset()
+            if offset > written:
+                inflight.update(offset - written)
+                written = offset
+                last_change = time.monotonic()
+            elif time.monotonic() - last_change > STALL_SEC:
+                if _writer_gone(repo_id, etag):
+                    logger.debug("Writer of %s is gone", inflight.file_name)
+                    return
+                last_change = time.monotonic()
+    finally:
+        _relays.pop((repo_id, etag), None)
+        if ok:
+            HfmcContext.get_cache_index().refresh_repo(repo_id)
+        inflight.finish(ok)
+
+
+def get_inflight(
+    repo_id: str,
+    file_name: str,
+    revision: str,
+) -> InflightFile | None:
+    """Get a file being downloaded, to read as it is written."""
+    inflight = proxy.get_inflight(repo_id, file_name, revision)
+    if inflight is not None:
+        return inflight
+
+    index = HfmcContext.get_cache_index()
+    partial = index.get_partial(repo_id, revision, file_name)
+    if partial is None:
+        return None
+
+    key = (repo_id, partial.etag)
+    inflight = _relays.get(key)
+    if inflight is None:
+        inflight = InflightFile(repo_id, file_name, revision)
+        offset = partial.offset()
+        inflight.start(partial, offset)
+        _relays[key] = inflight
+        task = asyncio.create_task(_watch(inflight, offset))
+        _watches.add(task)
+        task.add_done_callback(_watches.discard)
+    return inflight
+
+
+def get_file_meta(repo_id: str, file_name: str, revision: str) -> FileMeta | None:
+    """Get metadata of a file being downloaded."""
+    inflight = proxy.get_inflight(repo_id, file_name, revision)
+    if inflight is not None:
+        return FileMeta(inflight.size, inflight.etag, inflight.commit_hash)
+
+    index = HfmcContext.get_cache_index()
+    partial = index.get_partial(repo_id, revision, file_name)
+    if partial is None:
+        return None
+    return FileMeta(partial.size, partial.etag, partial.commit_hash)
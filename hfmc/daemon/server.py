@@ -1,33 +1,61 @@
 """Daemon server."""
 
+from __future__ import annotations
+
 import asyncio
 import logging
 import sys
+from typing import List
 
 from aiohttp import web
 
-from hfmc.common.context import HfmcContext
 from hfmc.common.api_settings import (
+    API_DAEMON_CACHE_CHANGE,
+    API_DAEMON_PEER_THROUGHPUT,
     API_DAEMON_PEERS_ALIVE,
     API_DAEMON_PEERS_CHANGE,
+    API_DAEMON_PEERS_WITH_BLOB,
+    API_DAEMON_PEERS_WITH_FILE,
     API_DAEMON_RUNNING,
     API_DAEMON_STOP,
+    API_DISTRIBUTE_PULL,
+    API_FETCH_BLOB,
     API_FETCH_FILE_DAEMON,
+    API_FETCH_FILES_META,
     API_FETCH_REPO_FILE_LIST,
+    API_FETCH_REPO_META,
+    API_PEERS_GOSSIP,
+    API_PEERS_INVENTORY,
+    API_PEERS_PING_REQ,
     API_PEERS_PROBE,
 )
+from hfmc.common.cache_index import CacheIndex
+from hfmc.common.context import HfmcContext
+from hfmc.common.peer import Peer
+from hfmc.daemon.discovery import LanDiscovery
 from hfmc.daemon.handlers.daemon_handler import (
     alive_peers,
+    cache_changed,
     daemon_running,
+    peer_throughput,
     peers_changed,
+    peers_with_blob,
+    peers_with_file,
     stop_daemon,
 )
+from hfmc.daemon.handlers.distribute_handler import pull_status, start_pull
 from hfmc.daemon.handlers.fetch_handler import (
+    download_blob,
     download_file,
+    get_files_meta,
     get_repo_file_list,
+    search_blob,
     search_file,
+    search_model,
 )
-from hfmc.daemon.handlers.peer_handler import pong
+from hfmc.daemon.handlers.peer_handler import get_inventory, gossip, ping_req, pong
+from hfmc.daemon.inventory import Inventory
+from hfmc.daemon.membership import SwimProber
 from hfmc.daemon.prober import PeerProber
 
 logger = logging.getLogger(__name__)
@@ -35,23 +63,67 @@ logger = logging.getLogger(__name__)
 
 def _setup_router(app: web.Application) -> None:
     app.router.add_head(API_FETCH_FILE_DAEMON, search_file)
-    app.router.add_get(API_FETCH_FILE_DAEMON, download_file)
+    app.router.add_get(API_FETCH_FILE_DAEMON, download_file, allow_head=False)
     app.router.add_get(API_FETCH_REPO_FILE_LIST, get_repo_file_list)
+    app.router.add_post(API_FETCH_FILES_META, get_files_meta)
+    app.router.add_get(API_FETCH_REPO_META, search_model)
+    app.router.add_head(API_FETCH_BLOB, search_blob)
+    app.router.add_get(API_FETCH_BLOB, download_blob, allow_head=False)
 
     app.router.add_get(API_PEERS_PROBE, pong)
+    app.router.add_get(API_PEERS_INVENTORY, get_inventory)
+    app.router.add_post(API_PEERS_GOSSIP, gossip)
+    app.router.add_post(API_PEERS_PING_REQ, ping_req)
 
     app.router.add_get(API_DAEMON_PEERS_ALIVE, alive_peers)
     app.router.add_get(API_DAEMON_STOP, stop_daemon)
     app.router.add_get(API_DAEMON_RUNNING, daemon_running)
     app.router.add_get(API_DAEMON_PEERS_CHANGE, peers_changed)
+    app.router.add_get(API_DAEMON_CACHE_CHANGE, cache_changed)
+    app.router.add_get(API_DAEMON_PEERS_WITH_FILE, peers_with_file)
+    app.router.add_get(API_DAEMON_PEERS_WITH_BLOB, peers_with_blob)
+    app.router.add_post(API_DAEMON_PEER_THROUGHPUT, peer_throughput)
+
+    app.router.add_post(API_DISTRIBUTE_PULL, start_pull)
+    app.router.add_get(API_DISTRIBUTE_PULL, pull_status)
+
+
+def _start_discovery(prober: PeerProber) -> None:
+    def _on_change(_: List[Peer]) -> None:
+        prober.update_peers(lan_discovery.merge(HfmcContext.get_peers()))
+
+    lan_discovery = LanDiscovery(HfmcContext.get_port(), _on_change)
+    HfmcContext.set_lan_discovery(lan_discovery)
+    task = asyncio.create_task(lan_discovery.start())
+
+    def _done(t: asyncio.Task[None]) -> None:
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("LAN discovery stopped: %s", t.exception())
+
+    task.add_done_callback(_done)
 
 
 async def _start() -> None:
-    prober = PeerProber(HfmcContext.get_peers())
+    index = CacheIndex(HfmcContext.get_model_dir())
+    inventory = Inventory(index)
+    await asyncio.get_running_loop().run_in_executor(None, index.build)
+    inventory.build()
+    HfmcContext.set_cache_index(index)
+    HfmcContext.set_inventory(inventory)
+
+    prober: PeerProber
+    if HfmcContext.get_gossip():
+        # configured peers are only seeds, others are learned by gossip
+        prober = SwimProber(HfmcContext.get_peers(), HfmcContext.get_port())
+    else:
+        prober = PeerProber(HfmcContext.get_peers())
     HfmcContext.set_peer_prober(prober)
     task = asyncio.create_task(prober.start_probe())  # probe in background
     prober.set_probe_task(task)  # keep strong reference to task
 
+    if HfmcContext.get_discovery():
+        _start_discovery(prober)
+
     app = web.Application()
     _setup_router(app)
 
@@ -4,7 +4,14 @@ import asyncio
 import logging
 from argparse import Namespace
 
-from hfmc.client import model_cmd, peer_cmd, uninstall_cmd
+from hfmc.client import (
+    cache_cmd,
+    http_request,
+    model_cmd,
+    peer_cmd,
+    uninstall_cmd,
+)
+from hfmc.common import access_stats
 from hfmc.common.context import HfmcContext
 from hfmc.config import conf_cmd, config_manager
 from hfmc.daemon import daemon_cmd
@@ -21,6 +28,8 @@ async def _exec_cmd(args: Namespace) -> None:
         exec_cmd = peer_cmd.exec_cmd
     elif args.command == "model":
         exec_cmd = model_cmd.exec_cmd
+    elif args.command == "cache":
+        exec_cmd = cache_cmd.exec_cmd
     elif args.command == "conf":
         exec_cmd = conf_cmd.exec_cmd
     elif args.command == "auth":
@@ -40,7 +49,11 @@ async def _async_main() -> None:
     args = arg_parser()
     logging_utils.setup_logging(args)
 
-    await _exec_cmd(args)
+    try:
+        await _exec_cmd(args)
+    finally:
+        await http_request.close_session()
+        access_stats.flush()
 
 
 def main() -> None:
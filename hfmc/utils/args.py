@@ -6,7 +6,11 @@ import argparse
 import logging
 from argparse import Namespace
 
+from hfmc.client.download_scheduler import DEFAULT_ENDPOINT_JOBS, DEFAULT_JOBS
+from hfmc.client.model_controller import DEFAULT_FANOUT
 from hfmc.common.context import HfmcContext
+from hfmc.config.hfmc_config import EVICTION_POLICIES
+from hfmc.utils.size import parse_size
 
 
 def is_detached_daemon(args: Namespace) -> bool:
@@ -75,6 +79,12 @@ def arg_parser() -> Namespace:  # noqa: PLR0915
     model_add_parser.add_argument("-r", "--repo", required=True)
     model_add_parser.add_argument("-f", "--file")
     model_add_parser.add_argument("-v", "--revision", default="main")
+    model_add_parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS)
+    model_add_parser.add_argument(
+        "--endpoint-jobs",
+        type=int,
+        default=DEFAULT_ENDPOINT_JOBS,
+    )
     # hfmc model rm ...
     model_rm_parser = model_subparsers.add_parser("rm")
     model_rm_parser.add_argument("-r", "--repo", required=True)
@@ -85,6 +95,43 @@ def arg_parser() -> Namespace:  # noqa: PLR0915
     model_search_parser.add_argument("-r", "--repo", required=True)
     model_search_parser.add_argument("-f", "--file")
     model_search_parser.add_argument("-v", "--revision", default="main")
+    # hfmc model distribute ...
+    model_distribute_parser = model_subparsers.add_parser("distribute")
+    model_distribute_parser.add_argument("-r", "--repo", required=True)
+    model_distribute_parser.add_argument("-v", "--revision", default="main")
+    model_distribute_parser.add_argument("--to", default="all")
+    model_distribute_parser.add_argument(
+        "--topology",
+        choices=["tree", "chain"],
+        default="tree",
+    )
+    model_distribute_parser.add_argument(
+        "--fanout",
+        type=int,
+        default=DEFAULT_FANOUT,
+    )
+
+    # hfmc cache ...
+    cache_parser = subparsers.add_parser("cache")
+    cache_subparsers = cache_parser.add_subparsers(
+        dest="cache_command",
+        required=True,
+    )
+    # hfmc cache dedup
+    cache_subparsers.add_parser("dedup")
+    # hfmc cache evict
+    cache_evict_parser = cache_subparsers.add_parser("evict")
+    cache_evict_parser.add_argument("--to", type=parse_size)
+    # hfmc cache pin / unpin
+    cache_pin_parser = cache_subparsers.add_parser("pin")
+    cache_pin_parser.add_argument("-r", "--repo", required=True)
+    cache_pin_parser.add_argument("-v", "--revision")
+    cache_unpin_parser = cache_subparsers.add_parser("unpin")
+    cache_unpin_parser.add_argument("-r", "--repo", required=True)
+    cache_unpin_parser.add_argument("-v", "--revision")
+    # hfmc cache gc
+    cache_gc_parser = cache_subparsers.add_parser("gc")
+    cache_gc_parser.add_argument("--dry-run", action="store_true")
 
     # hfmc conf ...
     conf_parser = subparsers.add_parser("conf")
@@ -112,6 +159,67 @@ def arg_parser() -> Namespace:  # noqa: PLR0915
     conf_port_set_subparser.add_argument("port", type=int)
     conf_port_subparsers.add_parser("get")
     conf_port_subparsers.add_parser("reset")
+    # hfmc conf gossip ...
+    conf_gossip_parser = conf_subparsers.add_parser("gossip")
+    conf_gossip_subparsers = conf_gossip_parser.add_subparsers(
+        dest="conf_gossip_command",
+        required=True,
+    )
+    conf_gossip_set_subparser = conf_gossip_subparsers.add_parser("set")
+    conf_gossip_set_subparser.add_argument("switch", choices=["on", "off"])
+    conf_gossip_subparsers.add_parser("get")
+    conf_gossip_subparsers.add_parser("reset")
+    # hfmc conf discovery ...
+    conf_discovery_parser = conf_subparsers.add_parser("discovery")
+    conf_discovery_subparsers = conf_discovery_parser.add_subparsers(
+        dest="conf_discovery_command",
+        required=True,
+    )
+    conf_discovery_set_subparser = conf_discovery_subparsers.add_parser("set")
+    conf_discovery_set_subparser.add_argument("switch", choices=["on", "off"])
+    conf_discovery_subparsers.add_parser("get")
+    conf_discovery_subparsers.add_parser("reset")
+    # hfmc conf proxy ...
+    conf_proxy_parser = conf_subparsers.add_parser("proxy")
+    conf_proxy_subparsers = conf_proxy_parser.add_subparsers(
+        dest="conf_proxy_command",
+        required=True,
+    )
+    conf_proxy_set_subparser = conf_proxy_subparsers.add_parser("set")
+    conf_proxy_set_subparser.add_argument("switch", choices=["on", "off"])
+    conf_proxy_subparsers.add_parser("get")
+    conf_proxy_subparsers.add_parser("reset")
+    # hfmc conf capacity ...
+    conf_capacity_parser = conf_subparsers.add_parser("capacity")
+    conf_capacity_subparsers = conf_capacity_parser.add_subparsers(
+        dest="conf_capacity_command",
+        required=True,
+    )
+    conf_capacity_set_subparser = conf_capacity_subparsers.add_parser("set")
+    conf_capacity_set_subparser.add_argument("size", type=parse_size)
+    conf_capacity_subparsers.add_parser("get")
+    conf_capacity_subparsers.add_parser("reset")
+    # hfmc conf eviction ...
+    conf_eviction_parser = conf_subparsers.add_parser("eviction")
+    conf_eviction_subparsers = conf_eviction_parser.add_subparsers(
+        dest="conf_eviction_command",
+        required=True,
+    )
+    conf_eviction_set_subparser = conf_eviction_subparsers.add_parser("set")
+    conf_eviction_set_subparser.add_argument("policy", choices=EVICTION_POLICIES)
+    conf_eviction_subparsers.add_parser("get")
+    conf_eviction_subparsers.add_parser("reset")
+    # hfmc conf watermark ...
+    conf_watermark_parser = conf_subparsers.add_parser("watermark")
+    conf_watermark_subparsers = conf_watermark_parser.add_subparsers(
+        dest="conf_watermark_command",
+        required=True,
+    )
+    conf_watermark_set_subparser = conf_watermark_subparsers.add_parser("set")
+    conf_watermark_set_subparser.add_argument("high", type=float)
+    conf_watermark_set_subparser.add_argument("low", type=float)
+    conf_watermark_subparsers.add_parser("get")
+    conf_watermark_subparsers.add_parser("reset")
     # hfmc conf show
     conf_subparsers.add_parser("show")
 
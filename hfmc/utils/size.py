@@ -0,0 +1,21 @@
+"""Utils for sizes in bytes."""
+
+_UNITS = ["", "K", "M", "G", "T", "P"]
+
+
+def format_size(size: float) -> str:
+    """Format size in bytes into a human readable string."""
+    for unit in _UNITS[:-1]:
+        if abs(size) < 1000.0:  # noqa: PLR2004
+            return f"{size:.1f}{unit}B"
+        size /= 1000.0
+    return f"{size:.1f}PB"
+
+
+def parse_size(size: str) -> int:
+    """Parse a size like 500G or 4TB into bytes, the inverse of format_size."""
+    value = size.strip().upper()
+    if value.endswith("B"):
+        value = value[:-1]
+    unit = value[-1:] if value[-1:] in _UNITS else ""
+    return int(float(value[: len(value) - len(unit)]) * 1000 ** _UNITS.index(unit))
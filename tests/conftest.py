@@ -0,0 +1,108 @@
+"""Shared fixtures for HFMC tests."""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from aiohttp import web
+from pytest import fixture
+
+from hfmc.common.cache_index import CacheIndex
+from hfmc.common.context import HfmcContext
+from hfmc.config.hfmc_config import HfmcConfig
+from hfmc.daemon.prober import PeerProber
+from hfmc.daemon.server import _setup_router
+
+if TYPE_CHECKING:
+    import py
+
+REPO = "user/model"
+COMMIT = "c" * 40
+FILE = "model.bin"
+CONTENT = bytes(range(256)) * 16
+ETAG = "e" * 64
+
+
+@dataclass
+class FakeCache:
+    """A model cache laid out like huggingface_hub does."""
+
+    cache_dir: Path
+    repo_path: Path
+
+    def add_file(
+        self,
+        file_name: str,
+        content: bytes,
+        etag: str,
+        commit: str = COMMIT,
+    ) -> Path:
+        """Add a blob and a snapshot symlink pointing to it."""
+        blob = self.repo_path / "blobs" / etag
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        blob.write_bytes(content)
+
+        snapshot_file = self.repo_path / "snapshots" / commit / file_name
+        snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        os.symlink(os.path.relpath(blob, snapshot_file.parent), snapshot_file)
+        return snapshot_file
+
+    def add_ref(self, ref: str, commit: str = COMMIT) -> None:
+        """Point a ref to a commit."""
+        ref_path = self.repo_path / "refs" / ref
+        ref_path.parent.mkdir(parents=True, exist_ok=True)
+        ref_path.write_text(commit)
+
+
+@fixture()
+def fake_cache(tmpdir: py.path.local) -> FakeCache:
+    """Init HfmcContext with a cache holding one file of one repo."""
+    conf = HfmcConfig(cache_dir=str(tmpdir))
+    HfmcContext.init_with_config(conf)
+
+    repo_folder = "models--" + REPO.replace("/", "--")
+    cache = FakeCache(
+        cache_dir=Path(str(tmpdir)),
+        repo_path=HfmcContext.get_model_dir() / repo_folder,
+    )
+    cache.add_file(FILE, CONTENT, ETAG)
+    cache.add_ref("main")
+    return cache
+
+
+def _make_daemon_app() -> web.Application:
+    index = CacheIndex(HfmcContext.get_model_dir())
+    index.build()
+    HfmcContext.set_cache_index(index)
+    HfmcContext.set_peer_prober(PeerProber([]))
+
+    app = web.Application()
+    _setup_router(app)
+    return app
+
+
+@fixture()
+def daemon_app() -> Callable[[], web.Application]:
+    """Get a factory of daemon apps serving the cache of the context."""
+    return _make_daemon_app
+
+
+@fixture()
+def client_cache(tmp_path: Path) -> Callable[[], Path]:
+    """Get a function switching to an empty client cache.
+
+    The cache index of the context is kept, so daemon apps keep serving
+    the cache they were created with.
+    """
+
+    def _switch() -> Path:
+        index = HfmcContext.get_cache_index()
+        cache_dir = tmp_path / "client"
+        HfmcContext.init_with_config(HfmcConfig(cache_dir=str(cache_dir)))
+        HfmcContext.set_cache_index(index)
+        return cache_dir
+
+    return _switch
@@ -0,0 +1,57 @@
+"""Test deduplicating blobs of the cache."""
+
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING
+
+from hfmc.client import cache_controller
+from hfmc.common import blob_store, hf_cache
+from tests.conftest import COMMIT, CONTENT, ETAG, FILE, REPO, FakeCache
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+def _add_fork(fake_cache: FakeCache, repo_id: str) -> Path:
+    fork = FakeCache(fake_cache.cache_dir, hf_cache.get_repo_path(repo_id))
+    return fork.add_file(FILE, CONTENT, ETAG)
+
+
+def test_dedup(fake_cache: FakeCache) -> None:
+    """Test copies of a blob across repos become links to one file."""
+    forks = [_add_fork(fake_cache, f"fork/model-{i}") for i in range(2)]
+    orphan = blob_store.get_store_path(SHA256)
+    orphan.write_bytes(CONTENT)
+
+    result = cache_controller.dedup()
+    assert result.nb_blobs == 1
+    assert result.nb_linked == len(forks)
+    assert result.freed == len(CONTENT) * len(forks)
+    assert result.nb_pruned == 1
+    assert not orphan.exists()
+
+    stored = blob_store.get_store_path(ETAG)
+    assert stored.stat().st_nlink == len(forks) + 2  # noqa: PLR2004
+    for snapshot in [hf_cache.get_snapshot_path(REPO, COMMIT, FILE), *forks]:
+        assert blob_store.is_same_file(snapshot, stored)
+        assert snapshot.read_bytes() == CONTENT
+
+    assert cache_controller.dedup() == cache_controller.DedupResult()
+
+
+def test_link_stored_blob(fake_cache: FakeCache) -> None:
+    """Test a committed blob is stored and linked into another repo."""
+    tmp_path = fake_cache.cache_dir / "download"
+    tmp_path.write_bytes(CONTENT)
+    hf_cache.commit_file(REPO, "lfs.bin", "main", COMMIT, SHA256, tmp_path)
+    assert blob_store.get_store_path(SHA256).exists()
+
+    fork = "fork/model"
+    assert not hf_cache.ensure_blob(fork, ETAG)
+    assert hf_cache.ensure_blob(fork, SHA256)
+    snapshot = hf_cache.commit_file(fork, "lfs.bin", "main", "f" * 40, SHA256)
+    original = hf_cache.get_snapshot_path(REPO, COMMIT, "lfs.bin")
+    assert blob_store.is_same_file(snapshot, original)
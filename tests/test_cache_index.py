@@ -0,0 +1,121 @@
+"""Test the in-memory cache index."""
+
+from __future__ import annotations
+
+import asyncio
+import shutil
+
+import pytest
+
+from hfmc.common.cache_index import CacheIndex, repo_folder_name
+from hfmc.common.context import HfmcContext
+from tests.conftest import COMMIT, CONTENT, ETAG, FILE, REPO, FakeCache
+
+
+def _index() -> CacheIndex:
+    index = CacheIndex(HfmcContext.get_model_dir())
+    index.build()
+    return index
+
+
+def test_get_file(fake_cache: FakeCache) -> None:
+    """Test looking up files by ref, commit and short commit."""
+    index = _index()
+
+    for rev in ["main", COMMIT, COMMIT[:8]]:
+        f = index.get_file(REPO, rev, FILE)
+        assert f is not None
+        assert f.commit_hash == COMMIT
+        assert f.size == len(CONTENT)
+        assert f.etag == ETAG
+        assert f.blob_path == fake_cache.repo_path / "blobs" / ETAG
+
+    assert index.get_file(REPO, "dev", FILE) is None
+    assert index.get_file(REPO, "main", "missing") is None
+    assert index.get_file("user/missing", "main", FILE) is None
+
+
+def test_nested_files(fake_cache: FakeCache) -> None:
+    """Test files in sub directories of a snapshot."""
+    fake_cache.add_file("onnx/model.onnx", b"onnx", "f" * 64)
+    index = _index()
+
+    f = index.get_file(REPO, "main", "onnx/model.onnx")
+    assert f is not None
+    assert f.size == len(b"onnx")
+    assert {f.file_name for f in index.get_revision_files(REPO, "main")} == {
+        FILE,
+        "onnx/model.onnx",
+    }
+
+
+def test_refresh_repo(fake_cache: FakeCache) -> None:
+    """Test refreshing index after files are added and removed."""
+    index = _index()
+    assert index.get_file(REPO, "main", "new.bin") is None
+
+    fake_cache.add_file("new.bin", b"new", "1" * 64)
+    index.refresh_repo(REPO)
+    assert index.get_file(REPO, "main", "new.bin") is not None
+
+    (fake_cache.repo_path / "snapshots" / COMMIT / "new.bin").unlink()
+    index.refresh_repo(REPO)
+    assert index.get_file(REPO, "main", "new.bin") is None
+
+
+def test_rescan_on_miss(fake_cache: FakeCache) -> None:
+    """Test missing files are rescanned but not too often."""
+    index = _index()
+    index.RESCAN_SEC = 0
+    fake_cache.add_file("new.bin", b"new", "1" * 64)
+    assert index.get_file(REPO, "main", "new.bin") is not None
+
+    index.RESCAN_SEC = 3600
+    fake_cache.add_file("newer.bin", b"newer", "2" * 64)
+    assert index.get_file(REPO, "main", "newer.bin") is None
+
+
+def test_get_blob(fake_cache: FakeCache) -> None:
+    """Test files are found by etag in any repo after rescans."""
+    fork = FakeCache(
+        cache_dir=fake_cache.cache_dir,
+        repo_path=HfmcContext.get_model_dir() / repo_folder_name("user/fork"),
+    )
+    fork.add_file(FILE, CONTENT, ETAG)
+    index = _index()
+    assert index.get_blob("0" * 64) is None
+
+    cached = index.get_blob(ETAG)
+    assert cached is not None
+    other = "user/fork" if cached.repo_id == REPO else REPO
+    shutil.rmtree(HfmcContext.get_model_dir() / repo_folder_name(cached.repo_id))
+    index.refresh_repo(cached.repo_id)
+    cached = index.get_blob(ETAG)
+    assert cached is not None
+    assert cached.repo_id == other
+
+
+def test_misses_expire(fake_cache: FakeCache) -> None:
+    """Test misses of unknown repos don't pile up."""
+    assert fake_cache.repo_path.exists()
+    index = _index()
+    index.RESCAN_SEC = 0
+    for i in range(100):
+        assert index.get_file(f"user/missing{i}", "main", FILE) is None
+    assert len(index._misses) == 1
+
+
+@pytest.mark.asyncio()
+async def test_rescan_in_executor(fake_cache: FakeCache) -> None:
+    """Test a miss on the event loop rescans the repo in an executor."""
+    index = _index()
+    index.RESCAN_SEC = 0
+    fake_cache.add_file("new.bin", b"new", "1" * 64)
+    assert index.get_file(REPO, "main", "new.bin") is None
+
+    index.RESCAN_SEC = 3600
+    for _ in range(100):
+        if index.get_file(REPO, "main", "new.bin") is not None:
+            break
+        await asyncio.sleep(0.01)
+    assert index.get_file(REPO, "main", "new.bin") is not None
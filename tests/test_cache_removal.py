@@ -0,0 +1,65 @@
+"""Test removing files of the cache in bulk."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from hfmc.client.model_controller import file_rm, repo_rm
+from hfmc.common import blob_store, hf_cache
+from hfmc.common.repo_files import load_file_list, save_file_list
+from tests.conftest import COMMIT, CONTENT, ETAG, FILE, REPO
+
+if TYPE_CHECKING:
+    from tests.conftest import FakeCache
+
+OTHER_COMMIT = "d" * 40
+ONLY, SHARED = "a" * 64, "b" * 64
+
+
+def _fill(fake_cache: FakeCache) -> None:
+    """Cache 2 revisions sharing a blob, each with a blob of its own."""
+    fake_cache.add_file("only.bin", CONTENT, ONLY)
+    fake_cache.add_file("shared.bin", CONTENT, SHARED)
+    fake_cache.add_file("shared.bin", CONTENT, SHARED, OTHER_COMMIT)
+    fake_cache.add_file("other.bin", CONTENT, ETAG, OTHER_COMMIT)
+    fake_cache.add_ref("stable", OTHER_COMMIT)
+    blob_store.store_blob(hf_cache.get_blob_path(REPO, ONLY), ONLY)
+    save_file_list(REPO, COMMIT, [FILE, "only.bin", "shared.bin"])
+    save_file_list(REPO, "main", [FILE, "only.bin", "shared.bin"])
+    save_file_list(REPO, OTHER_COMMIT, ["shared.bin", "other.bin"])
+
+
+def test_rm_revision(fake_cache: FakeCache) -> None:
+    """Test blobs still linked by another revision are kept."""
+    _fill(fake_cache)
+
+    assert repo_rm(REPO, "main")
+    repo_path = hf_cache.get_repo_path(REPO)
+    assert not (repo_path / "snapshots" / COMMIT).exists()
+    assert not (repo_path / "refs" / "main").exists()
+    assert (repo_path / "refs" / "stable").exists()
+    assert not hf_cache.get_blob_path(REPO, ONLY).exists()
+    assert not blob_store.get_store_path(ONLY).exists()
+    # ETAG is linked by FILE of COMMIT and other.bin of OTHER_COMMIT
+    assert hf_cache.get_blob_path(REPO, ETAG).exists()
+    snapshot = hf_cache.get_snapshot_path(REPO, OTHER_COMMIT, "shared.bin")
+    assert snapshot.read_bytes() == CONTENT
+    assert load_file_list(REPO, COMMIT) is None
+    assert load_file_list(REPO, "main") is None
+    assert load_file_list(REPO, OTHER_COMMIT) is not None
+
+    assert repo_rm(REPO, None)
+    assert not repo_path.exists()
+    assert load_file_list(REPO, OTHER_COMMIT) is None
+    assert repo_rm(REPO, None)
+
+
+def test_file_rm(fake_cache: FakeCache) -> None:
+    """Test a file is removed, and its blob once no snapshot links to it."""
+    _fill(fake_cache)
+
+    assert file_rm(REPO, "shared.bin", "main")
+    assert hf_cache.get_blob_path(REPO, SHARED).exists()
+    assert file_rm(REPO, "shared.bin", "stable")
+    assert not hf_cache.get_blob_path(REPO, SHARED).exists()
+    assert not file_rm(REPO, "shared.bin", "stable")
@@ -26,6 +26,14 @@ def test_init() -> None:
         "cache_dir": str(DEFAULT_CACHE_DIR),
         "peers": [],
         "daemon_port": DEFAULT_DAEMON_PORT,
+        "gossip": False,
+        "discovery": False,
+        "proxy": False,
+        "capacity": 0,
+        "eviction": "lru",
+        "high_watermark": 0.95,
+        "low_watermark": 0.85,
+        "pins": [],
     }
 
 
@@ -35,6 +43,14 @@ def test_save_and_load() -> None:
         "cache_dir": "custom_cache_dir",
         "peers": [{"ip": "127.0.0.1", "port": 8080}],
         "daemon_port": 8080,
+        "gossip": False,
+        "discovery": False,
+        "proxy": False,
+        "capacity": 0,
+        "eviction": "lru",
+        "high_watermark": 0.95,
+        "low_watermark": 0.85,
+        "pins": [],
     }
 
     peers = [Peer(ip=p["ip"], port=p["port"]) for p in custom["peers"]]
@@ -41,6 +41,18 @@ def test_log_dir(test_config: HfmcConfig) -> None:
     assert str(context.log_dir) == "test_cache_dir/logs"
 
 
+def test_store_dir(test_config: HfmcConfig) -> None:
+    """Test store dir."""
+    context = HfmcContext.init_with_config(test_config)
+    assert str(context.store_dir) == "test_cache_dir/store"
+
+
+def test_metadata_path(test_config: HfmcConfig) -> None:
+    """Test metadata store path."""
+    context = HfmcContext.init_with_config(test_config)
+    assert str(context.metadata_path) == "test_cache_dir/metadata.db"
+
+
 def test_get_peers(test_config: HfmcConfig) -> None:
     """Test get peers."""
     context = HfmcContext.init_with_config(test_config)
@@ -2,7 +2,7 @@
 
 import pytest
 
-from hfmc.client.http_request import ping
+from hfmc.client.http_request import _http_session, close_session, ping
 from hfmc.common.peer import Peer
 
 
@@ -11,3 +11,16 @@ async def test_peers_probe() -> None:
     """Test probe a live peer."""
     peer = Peer("127.0.0.2", 8080)
     await ping(peer)
+    await close_session()
+
+
+@pytest.mark.asyncio()
+async def test_shared_session() -> None:
+    """Test requests share one session until it is closed."""
+    sess = _http_session()
+    assert _http_session() is sess
+
+    await close_session()
+    assert sess.closed
+    assert _http_session() is not sess
+    await close_session()
@@ -0,0 +1,95 @@
+"""Test discovery of daemons on the LAN."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, List, Tuple
+
+import pytest
+
+from hfmc.common.peer import Peer
+from hfmc.daemon.discovery import ANNOUNCE_VERSION, LanDiscovery
+
+IP = "192.168.1.2"
+
+
+class FakeTransport:
+    """Record datagrams sent."""
+
+    def __init__(self) -> None:
+        """Init FakeTransport."""
+        self.sent: List[Tuple[Any, Tuple[str, int]]] = []
+
+    def sendto(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Send a datagram."""
+        self.sent.append((json.loads(data), addr))
+
+    def close(self) -> None:
+        """Close the transport."""
+
+
+def _announce(port: int, **kwargs: Any) -> bytes:
+    msg = {"hfmc": ANNOUNCE_VERSION, "id": f"id-{port}", "port": port, **kwargs}
+    return json.dumps(msg).encode()
+
+
+@pytest.mark.asyncio()
+async def test_discover_peers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test peers are added when heard, and dropped on bye or timeout."""
+    monkeypatch.setattr(LanDiscovery, "MIN_INTERVAL_SEC", 0.05)
+    monkeypatch.setattr(LanDiscovery, "ANSWER_BACKOFF_SEC", 0.02)
+    changes: List[List[Peer]] = []
+    discovery = LanDiscovery(8000, changes.append)
+    transport = FakeTransport()
+    discovery.connection_made(transport)  # type: ignore[arg-type]
+
+    # own announces are looped back by the group
+    discovery.announce()
+    discovery.datagram_received(discovery._message(), (IP, 48787))
+    discovery.datagram_received(b"garbage", (IP, 48787))
+    assert not changes
+
+    discovery.datagram_received(_announce(9000), (IP, 48787))
+    discovery.datagram_received(_announce(9001), (IP, 48787))
+    discovery.datagram_received(_announce(9001), (IP, 48787))
+    assert changes[-1] == [Peer(IP, 9000), Peer(IP, 9001)]
+    assert len(changes) == 2
+
+    # new peers are answered by one announce only
+    await asyncio.sleep(0.1)
+    assert len(transport.sent) == 2
+    assert transport.sent[-1][0]["port"] == 8000
+
+    # no answer if another daemon is heard first
+    discovery.datagram_received(_announce(9002), (IP, 48787))
+    discovery.datagram_received(_announce(9000), (IP, 48787))
+    await asyncio.sleep(0.1)
+    assert len(transport.sent) == 2
+    discovery.datagram_received(_announce(9002, bye=True), (IP, 48787))
+
+    assert discovery.merge([Peer(IP, 9000), Peer("10.0.0.1", 8000)]) == [
+        Peer(IP, 9000),
+        Peer("10.0.0.1", 8000),
+        Peer(IP, 9001),
+    ]
+
+    discovery.datagram_received(_announce(9001, bye=True), (IP, 48787))
+    assert changes[-1] == [Peer(IP, 9000)]
+
+    monkeypatch.setattr(LanDiscovery, "ANNOUNCE_SEC", 0.0)
+    monkeypatch.setattr(LanDiscovery, "MAX_GROUP_RATE", 1e9)
+    discovery.expire()
+    assert changes[-1] == []
+
+    discovery.stop()
+    assert transport.sent[-1][0]["bye"]
+
+
+def test_announce_interval() -> None:
+    """Test announces slow down on large segments."""
+    discovery = LanDiscovery(8000, lambda _: None)
+    assert discovery.interval() == LanDiscovery.ANNOUNCE_SEC
+    for i in range(1000):
+        discovery.datagram_received(_announce(i), (IP, 48787))
+    assert discovery.interval() > LanDiscovery.ANNOUNCE_SEC
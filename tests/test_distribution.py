@@ -0,0 +1,163 @@
+"""Test distributing a model to many daemons."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from typing import TYPE_CHECKING, Callable, List
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from hfmc.client.http_request import close_session
+from hfmc.client.model_controller import plan_distribution
+from hfmc.common import hf_cache
+from hfmc.common.api_settings import API_DISTRIBUTE_PULL, API_FETCH_FILES_META
+from hfmc.common.context import HfmcContext
+from hfmc.common.peer import Peer
+from hfmc.common.pull_status import PULL_DONE, PULL_FAILED
+from hfmc.config.hfmc_config import HfmcConfig
+from hfmc.daemon import distribution
+from hfmc.daemon.distribution import PullJob
+from hfmc.daemon.prober import PeerProber
+from tests.conftest import COMMIT, CONTENT, REPO
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+async def _alive(peer: Peer) -> Peer:
+    peer.alive = True
+    return peer
+
+
+class FakeParent:
+    """Serve a file like a daemon, which doesn't have it at first."""
+
+    def __init__(self) -> None:
+        """Init FakeParent."""
+        self.nb_gets = 0
+
+    def app(self) -> web.Application:
+        """Build the app."""
+        app = web.Application()
+        app.router.add_get("/{user}/{model}/resolve/{revision}/{file}", self.get)
+        app.router.add_post(
+            API_FETCH_FILES_META.format(
+                user="{user}",
+                model="{model}",
+                revision="{revision}",
+            ),
+            self.files_meta,
+        )
+        return app
+
+    async def files_meta(self, request: web.Request) -> web.Response:
+        """Tell the size of the file."""
+        files = {"lfs.bin": {"size": len(CONTENT), "etag": SHA256}}
+        names = await request.json()
+        return web.json_response(
+            {
+                "commit_hash": COMMIT,
+                "files": {name: files[name] for name in names if name in files},
+            },
+        )
+
+    async def get(self, request: web.Request) -> web.Response:
+        """Send the file from the second request on."""
+        self.nb_gets += 1
+        if request.match_info["file"] != "lfs.bin" or self.nb_gets == 1:
+            return web.Response(status=404)
+        return web.Response(
+            body=CONTENT,
+            headers={"ETag": f'"{SHA256}"', "X-Repo-Commit": COMMIT},
+        )
+
+
+def test_plan_distribution() -> None:
+    """Test targets are arranged in a tree or a chain."""
+    targets = [Peer("127.0.0.1", 9000 + i) for i in range(7)]
+
+    parents = plan_distribution(targets, 2)
+    assert [parents[t] for t in targets] == [
+        None,
+        None,
+        targets[0],
+        targets[0],
+        targets[1],
+        targets[1],
+        targets[2],
+    ]
+
+    parents = plan_distribution(targets, 1)
+    assert [parents[t] for t in targets] == [None, *targets[:-1]]
+
+
+@pytest.mark.asyncio()
+async def test_pull(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test a daemon pulls files from its parent and reports progress."""
+    monkeypatch.setattr(PullJob, "RETRY_SEC", 0.01)
+    monkeypatch.setattr(PullJob, "WAIT_SEC", 0.2)
+    monkeypatch.setattr(PeerProber, "RETRY_SEC", 0.01)
+    HfmcContext.init_with_config(HfmcConfig(cache_dir=str(tmp_path)))
+    parent = FakeParent()
+    reserves: List[int] = []
+    monkeypatch.setattr(
+        distribution.cache_controller,
+        "make_room",
+        lambda reserve, _: reserves.append(reserve),
+    )
+
+    async with TestServer(parent.app()) as parent_server, TestClient(
+        TestServer(daemon_app()),
+    ) as client:
+        user, model = REPO.split("/")
+        url = API_DISTRIBUTE_PULL.format(user=user, model=model, revision=COMMIT)
+        assert (await client.get(url)).status == 404
+
+        data = {
+            "files": ["lfs.bin"],
+            "source": {"port": parent_server.port},
+            "ref": "main",
+        }
+        # the parent must be an alive peer
+        assert (await client.post(url, json=data)).status == 403
+        prober = PeerProber([Peer("127.0.0.1", parent_server.port)], _alive)
+        HfmcContext.set_peer_prober(prober)
+        prober.set_probe_task(asyncio.create_task(prober.start_probe()))
+        while not prober.get_alives():
+            await asyncio.sleep(0.01)
+
+        resp = await client.post(url, json=data)
+        assert resp.status == 200
+        while (status := await (await client.get(url)).json())["state"] == "running":
+            await asyncio.sleep(0.01)
+
+        assert status["state"] == PULL_DONE
+        assert status["nb_done"] == 1
+        assert status["received"] == len(CONTENT)
+        assert reserves == [len(CONTENT)]
+        assert parent.nb_gets == 2
+        snapshot = hf_cache.get_snapshot_path(REPO, COMMIT, "lfs.bin")
+        assert snapshot.read_bytes() == CONTENT
+        assert (hf_cache.get_repo_path(REPO) / "refs" / "main").read_text() == COMMIT
+
+        # a file the parent never gets fails the job
+        url = API_DISTRIBUTE_PULL.format(user=user, model=model, revision="0" * 40)
+        data["files"] = ["missing.bin"]
+        await client.post(url, json=data)
+        while (status := await (await client.get(url)).json())["state"] == "running":
+            await asyncio.sleep(0.01)
+        assert status["state"] == PULL_FAILED
+        assert status["error"]
+
+        assert (await client.post(url, json={"files": []})).status == 400
+        prober.stop_probe()
+        await close_session()
@@ -0,0 +1,74 @@
+"""Test scheduling concurrent downloads."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from hfmc.client.download_scheduler import (
+    DownloadScheduler,
+    DownloadTask,
+    EndpointLimiter,
+)
+from hfmc.common.file_meta import FileMeta
+
+
+def _task(name: str, size: int) -> DownloadTask:
+    return DownloadTask(file_name=name, meta=FileMeta(size=size))
+
+
+@pytest.mark.asyncio()
+async def test_largest_first_and_bounded() -> None:
+    """Test large files start first and concurrency is bounded."""
+    started: List[str] = []
+    running = 0
+    max_running = 0
+
+    async def download(task: DownloadTask) -> bool:
+        nonlocal running, max_running
+        started.append(task.file_name)
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return task.file_name != "fail"
+
+    tasks = [_task("s", 1), _task("l", 100), _task("fail", 0), _task("m", 10)]
+    scheduler = DownloadScheduler(jobs=2)
+
+    assert not await scheduler.run(tasks, download)
+    assert started == ["l", "m", "s", "fail"]
+    assert max_running == 2  # noqa: PLR2004
+
+
+@pytest.mark.asyncio()
+async def test_endpoint_limiter() -> None:
+    """Test downloads from one endpoint are limited."""
+    limiter = EndpointLimiter(1)
+    running: Dict[str, int] = {"a": 0, "b": 0}
+    max_running: Dict[str, int] = {"a": 0, "b": 0}
+
+    async def download(endpoint: str) -> None:
+        async with limiter.slot(endpoint):
+            running[endpoint] += 1
+            max_running[endpoint] = max(max_running[endpoint], running[endpoint])
+            await asyncio.sleep(0.01)
+            running[endpoint] -= 1
+
+    await asyncio.gather(*[download(e) for e in ["a", "a", "b", "b", "a"]])
+    assert max_running == {"a": 1, "b": 1}
+
+
+@pytest.mark.asyncio()
+async def test_pick_free_endpoint() -> None:
+    """Test a busy endpoint is skipped for the next one with a free slot."""
+    limiter = EndpointLimiter(1)
+    assert limiter.pick(["a", "b"]) == "a"
+    async with limiter.slot("a"):
+        assert limiter.pick(["a", "b"]) == "b"
+        async with limiter.slot("b"):
+            # all busy, wait for the best one
+            assert limiter.pick(["a", "b"]) == "a"
+    assert limiter.pick(["a", "b"]) == "a"
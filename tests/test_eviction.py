@@ -0,0 +1,104 @@
+"""Test evicting blobs of the cache."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING
+
+import pytest
+
+from hfmc.common import access_stats, blob_store, hf_cache, metadata_store
+from hfmc.common.eviction import cache_usage, evict
+from tests.conftest import COMMIT, CONTENT, ETAG, FILE, REPO
+
+if TYPE_CHECKING:
+    from tests.conftest import FakeCache
+
+SIZE = len(CONTENT)
+OLD, NEW = "a" * 64, "b" * 64
+OTHER_COMMIT = "d" * 40
+
+
+def _fill(fake_cache: FakeCache) -> None:
+    """Cache 3 blobs, ETAG is shared by 2 revisions and linked in the store."""
+    fake_cache.add_file(FILE, CONTENT, ETAG, OTHER_COMMIT)
+    fake_cache.add_file("old.bin", CONTENT, OLD)
+    fake_cache.add_file("new.bin", CONTENT, NEW)
+    blob_store.store_blob(hf_cache.get_blob_path(REPO, ETAG), ETAG)
+    access_stats.record_access(ETAG)
+    access_stats.record_access(ETAG)
+    access_stats.record_access(NEW)
+    access_stats.flush()
+
+
+def test_access_stats(fake_cache: FakeCache) -> None:
+    """Test accesses are counted across flushes."""
+    _fill(fake_cache)
+    access_stats.record_access(NEW)
+    stats = access_stats.load_stats()
+    assert stats[ETAG].hits == 2  # noqa: PLR2004
+    assert stats[NEW].hits == 2  # noqa: PLR2004
+    assert stats[NEW].last_access >= stats[ETAG].last_access
+    assert OLD not in stats
+
+    access_stats.forget([NEW])
+    assert NEW not in access_stats.load_stats()
+
+
+@pytest.mark.asyncio()
+async def test_flush_in_executor(
+    fake_cache: FakeCache,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test accesses recorded in the daemon are written by another thread."""
+    assert fake_cache.repo_path.exists()
+    access_stats.forget([NEW])
+    monkeypatch.setattr(access_stats, "FLUSH_SEC", 0.0)
+    access_stats.record_access(NEW)
+    assert not access_stats._pending
+    for _ in range(100):
+        if NEW in metadata_store.load_accesses():
+            break
+        await asyncio.sleep(0.01)
+    assert metadata_store.load_accesses()[NEW][1] == 1
+
+
+def test_evict_lru(fake_cache: FakeCache) -> None:
+    """Test the least recently used blob goes first, with all its links."""
+    _fill(fake_cache)
+    # refs take a few bytes
+    usage = cache_usage()
+    assert 3 * SIZE <= usage < 4 * SIZE
+
+    result = evict(usage - SIZE, "lru", [])
+    assert result.nb_blobs == 1
+    assert result.freed == SIZE
+    assert result.usage == usage - SIZE
+    assert not hf_cache.get_blob_path(REPO, OLD).exists()
+    assert hf_cache.get_blob_path(REPO, ETAG).exists()
+
+    # the shared blob is freed with the snapshots of both revisions
+    result = evict(usage - 2 * SIZE, "lru", [])
+    assert result.freed == SIZE
+    assert not hf_cache.get_snapshot_path(REPO, COMMIT, FILE).exists()
+    assert not hf_cache.get_snapshot_path(REPO, OTHER_COMMIT, FILE).exists()
+    assert not (hf_cache.get_repo_path(REPO) / "snapshots" / OTHER_COMMIT).exists()
+    assert not blob_store.get_store_path(ETAG).exists()
+    assert hf_cache.get_blob_path(REPO, NEW).exists()
+    assert cache_usage() == usage - 2 * SIZE
+    assert ETAG not in access_stats.load_stats()
+
+
+def test_evict_lfu_pinned(fake_cache: FakeCache) -> None:
+    """Test the least frequently used blob goes first, unless pinned."""
+    _fill(fake_cache)
+    fake_cache.add_ref("stable", OTHER_COMMIT)
+
+    result = evict(0, "lfu", [f"{REPO}@stable"])
+    assert result.nb_blobs == 2  # noqa: PLR2004
+    assert result.repo_ids == {REPO}
+    assert not hf_cache.get_blob_path(REPO, OLD).exists()
+    assert not hf_cache.get_blob_path(REPO, NEW).exists()
+    assert hf_cache.get_snapshot_path(REPO, COMMIT, FILE).read_bytes() == CONTENT
+
+    assert evict(0, "lfu", [REPO]).nb_blobs == 0
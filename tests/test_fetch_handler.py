@@ -0,0 +1,252 @@
+"""Test serving model files from daemon."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable
+
+import pytest
+from aiohttp import MultipartReader, web
+from aiohttp.test_utils import TestClient, TestServer
+
+from hfmc.common import access_stats
+from hfmc.common.repo_files import save_file_list
+from tests.conftest import COMMIT, CONTENT, ETAG, FILE, REPO
+
+if TYPE_CHECKING:
+    from tests.conftest import FakeCache
+
+URL = f"/{REPO}/resolve/{COMMIT}/{FILE}"
+
+
+async def _get(
+    app: web.Application,
+    headers: dict[str, str] | None = None,
+) -> tuple[int, dict, bytes]:
+    async with TestClient(TestServer(app)) as client:
+        resp = await client.get(URL, headers=headers)
+        return resp.status, dict(resp.headers), await resp.read()
+
+
+async def _get_parts(
+    app: web.Application,
+    headers: dict[str, str],
+) -> list[tuple[str, bytes]]:
+    async with TestClient(TestServer(app)) as client:
+        resp = await client.get(URL, headers=headers)
+        assert resp.status == 206
+        parts = []
+        reader = MultipartReader.from_response(resp)
+        while True:
+            part = await reader.next()
+            if part is None:
+                return parts
+            parts.append((part.headers["Content-Range"], await part.read()))
+
+
+@pytest.mark.asyncio()
+async def test_search_file(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test looking up a file by ref."""
+    assert fake_cache.repo_path.exists()
+
+    async with TestClient(TestServer(daemon_app())) as client:
+        resp = await client.head(f"/{REPO}/resolve/main/{FILE}")
+        assert resp.status == 200
+        assert resp.headers["ETag"] == ETAG
+        assert resp.headers["X-Repo-Commit"] == COMMIT
+        assert resp.headers["Content-Length"] == str(len(CONTENT))
+
+        resp = await client.head(f"/{REPO}/resolve/main/missing.bin")
+        assert resp.status == 404
+
+
+@pytest.mark.asyncio()
+async def test_download_whole_file(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test downloading a whole file."""
+    assert fake_cache.repo_path.exists()
+
+    status, headers, body = await _get(daemon_app())
+
+    assert status == 200
+    assert headers["Content-Length"] == str(len(CONTENT))
+    assert headers["Accept-Ranges"] == "bytes"
+    assert body == CONTENT
+
+
+@pytest.mark.asyncio()
+async def test_download_byte_range(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test downloading a slice of file."""
+    assert fake_cache.repo_path.exists()
+
+    size = len(CONTENT)
+
+    status, headers, body = await _get(daemon_app(), {"Range": "bytes=10-19"})
+    assert status == 206
+    assert headers["Content-Range"] == f"bytes 10-19/{size}"
+    assert headers["Content-Length"] == "10"
+    assert body == CONTENT[10:20]
+
+    _, headers, body = await _get(daemon_app(), {"Range": "bytes=0-0"})
+    assert headers["Content-Range"] == f"bytes 0-0/{size}"
+    assert body == CONTENT[:1]
+
+    _, headers, body = await _get(daemon_app(), {"Range": "bytes=4000-"})
+    assert headers["Content-Range"] == f"bytes 4000-{size - 1}/{size}"
+    assert body == CONTENT[4000:]
+
+    _, headers, body = await _get(daemon_app(), {"Range": "bytes=4000-99999"})
+    assert headers["Content-Range"] == f"bytes 4000-{size - 1}/{size}"
+    assert body == CONTENT[4000:]
+
+
+@pytest.mark.asyncio()
+async def test_count_hit_per_transfer(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test a file fetched in ranges counts as one hit."""
+    assert fake_cache.repo_path.exists()
+    app = daemon_app()
+    # accesses of other tests may be pending
+    access_stats.forget([ETAG])
+    for first in range(0, len(CONTENT), 1024):
+        headers = {"Range": f"bytes={first}-{first + 1023}"}
+        assert (await _get(app, headers))[0] == 206
+    assert access_stats.load_stats()[ETAG].hits == 1
+
+    await _get(app)
+    assert access_stats.load_stats()[ETAG].hits == 2  # noqa: PLR2004
+
+
+@pytest.mark.asyncio()
+async def test_download_suffix_range(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test downloading the last bytes of file."""
+    assert fake_cache.repo_path.exists()
+    size = len(CONTENT)
+
+    status, headers, body = await _get(daemon_app(), {"Range": "bytes=-100"})
+    assert status == 206
+    assert headers["Content-Range"] == f"bytes {size - 100}-{size - 1}/{size}"
+    assert body == CONTENT[-100:]
+
+    _, _, body = await _get(daemon_app(), {"Range": f"bytes=-{size * 2}"})
+    assert body == CONTENT
+
+
+@pytest.mark.asyncio()
+async def test_download_unsatisfiable_range(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test ranges out of the file."""
+    assert fake_cache.repo_path.exists()
+    size = len(CONTENT)
+
+    status, headers, _ = await _get(daemon_app(), {"Range": f"bytes={size}-"})
+    assert status == 416
+    assert headers["Content-Range"] == f"bytes */{size}"
+
+    status, _, _ = await _get(daemon_app(), {"Range": "bytes=-0"})
+    assert status == 416
+
+
+@pytest.mark.asyncio()
+async def test_download_invalid_range(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test malformed ranges are ignored."""
+    assert fake_cache.repo_path.exists()
+
+    for byte_range in ["bytes=9-1", "bytes=a-b", "items=0-1", "bytes=-"]:
+        status, _, body = await _get(daemon_app(), {"Range": byte_range})
+        assert status == 200
+        assert body == CONTENT
+
+
+@pytest.mark.asyncio()
+async def test_download_multiple_ranges(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test downloading multipart/byteranges."""
+    assert fake_cache.repo_path.exists()
+    size = len(CONTENT)
+
+    parts = await _get_parts(daemon_app(), {"Range": "bytes=0-9, 100-109, -5"})
+    assert parts == [
+        (f"bytes 0-9/{size}", CONTENT[0:10]),
+        (f"bytes 100-109/{size}", CONTENT[100:110]),
+        (f"bytes {size - 5}-{size - 1}/{size}", CONTENT[-5:]),
+    ]
+
+    # overlapping ranges are coalesced
+    status, headers, body = await _get(daemon_app(), {"Range": "bytes=0-9,5-19"})
+    assert status == 206
+    assert headers["Content-Range"] == f"bytes 0-19/{size}"
+    assert body == CONTENT[:20]
+
+
+@pytest.mark.asyncio()
+async def test_get_files_meta(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test getting metadata of several files in one request."""
+    fake_cache.add_file("config.json", b"{}", "f" * 40)
+    url = f"/hfmc_api/fetch/files_meta/{REPO}/main"
+
+    async with TestClient(TestServer(daemon_app())) as client:
+        resp = await client.post(url, json=[FILE, "missing.bin"])
+        assert resp.status == 200
+        assert await resp.json() == {
+            "commit_hash": COMMIT,
+            "files": {FILE: {"size": len(CONTENT), "etag": ETAG}},
+        }
+
+        resp = await client.post(url)
+        assert resp.status == 200
+        assert set((await resp.json())["files"]) == {FILE, "config.json"}
+
+        resp = await client.post(url, data="not json")
+        assert resp.status == 400
+
+        resp = await client.post(f"/hfmc_api/fetch/files_meta/{REPO}/dev")
+        assert resp.status == 404
+
+
+@pytest.mark.asyncio()
+async def test_search_model(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test summarizing how much of a repo is cached."""
+    url = f"/hfmc_api/fetch/repo_meta/{REPO}/main"
+
+    async with TestClient(TestServer(daemon_app())) as client:
+        resp = await client.get(url)
+        assert resp.status == 200
+        assert await resp.json() == {
+            "commit_hash": COMMIT,
+            "nb_files": 1,
+            "size": len(CONTENT),
+            "nb_total": None,
+        }
+
+        save_file_list(REPO, COMMIT, [FILE, "config.json"])
+        resp = await client.get(url)
+        assert (await resp.json())["nb_total"] == 2
+
+        resp = await client.get(f"/hfmc_api/fetch/repo_meta/{REPO}/dev")
+        assert resp.status == 404
@@ -0,0 +1,240 @@
+"""Test downloading a file from a peer into the cache."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from typing import TYPE_CHECKING, Any, Callable, Dict
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from hfmc.client import file_download
+from hfmc.client.file_download import download_file
+from hfmc.client.http_request import close_session, normalize_etag
+from hfmc.common import blob_store, hf_cache
+from hfmc.common.api_settings import API_FETCH_BLOB
+from tests.conftest import COMMIT, CONTENT, REPO
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from tests.conftest import FakeCache
+
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.mark.asyncio()
+async def test_download_file(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+    client_cache: Callable[[], Path],
+) -> None:
+    """Test a file is saved with the etag and commit from the response."""
+    fake_cache.add_file("lfs.bin", CONTENT, SHA256)
+    fake_cache.add_file("broken.bin", CONTENT, "0" * 64)
+
+    async with TestServer(daemon_app()) as server:
+        client_cache()
+        endpoint = f"http://127.0.0.1:{server.port}"
+
+        assert await download_file(endpoint, REPO, "lfs.bin", "main")
+        assert not await download_file(endpoint, REPO, "broken.bin", "main")
+        assert not await download_file(endpoint, REPO, "missing.bin", "main")
+        await close_session()
+
+    snapshot = hf_cache.get_snapshot_path(REPO, COMMIT, "lfs.bin")
+    assert snapshot.is_symlink()
+    assert snapshot.resolve() == hf_cache.get_blob_path(REPO, SHA256)
+    assert snapshot.read_bytes() == CONTENT
+    assert (hf_cache.get_repo_path(REPO) / "refs" / "main").read_text() == COMMIT
+
+    broken = hf_cache.get_incomplete_path(REPO, "0" * 64)
+    assert not broken.exists()
+    assert not hf_cache.get_blob_path(REPO, "0" * 64).exists()
+
+
+@pytest.mark.asyncio()
+async def test_resume_download(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+    client_cache: Callable[[], Path],
+) -> None:
+    """Test an incomplete file is resumed only if it has the same etag."""
+    fake_cache.add_file("lfs.bin", CONTENT, SHA256)
+
+    async with TestServer(daemon_app()) as server:
+        client_cache()
+        endpoint = f"http://127.0.0.1:{server.port}"
+
+        partial = hf_cache.PartialFile(REPO, SHA256, len(CONTENT), "lfs.bin", COMMIT)
+        partial.path.parent.mkdir(parents=True)
+        hf_cache.save_partial(partial)
+
+        # a corrupted prefix is resumed, fails verification and is dropped
+        partial.path.write_bytes(b"\0" * 1000)
+        assert not await download_file(endpoint, REPO, "lfs.bin", "main")
+        assert hf_cache.find_partial(REPO, "lfs.bin") is None
+
+        # an incomplete file of another etag is dropped, not resumed
+        stale = hf_cache.PartialFile(REPO, "0" * 64, len(CONTENT), "lfs.bin", COMMIT)
+        hf_cache.save_partial(stale)
+        stale.path.write_bytes(CONTENT[:1000])
+        assert await download_file(endpoint, REPO, "lfs.bin", "main")
+        assert not stale.path.exists()
+        hf_cache.get_blob_path(REPO, SHA256).unlink()
+        blob_store.get_store_path(SHA256).unlink()
+
+        hf_cache.save_partial(partial)
+        partial.path.write_bytes(CONTENT[:1000])
+        assert await download_file(endpoint, REPO, "lfs.bin", "main", etag=SHA256)
+        await close_session()
+
+    assert hf_cache.get_blob_path(REPO, SHA256).read_bytes() == CONTENT
+    assert hf_cache.load_partial(REPO, SHA256) is None
+    assert not partial.path.exists()
+
+
+@pytest.mark.asyncio()
+async def test_wait_blob_lock(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+    client_cache: Callable[[], Path],
+) -> None:
+    """Test a blob being downloaded by another process is not downloaded again."""
+    fake_cache.add_file("lfs.bin", CONTENT, SHA256)
+
+    async with TestServer(daemon_app()) as server:
+        client_cache()
+        endpoint = f"http://127.0.0.1:{server.port}"
+
+        lock = hf_cache.blob_lock(REPO, SHA256)
+        lock.acquire()
+        task = asyncio.create_task(download_file(endpoint, REPO, "lfs.bin", "main"))
+        await asyncio.sleep(0.3)
+        assert not task.done()
+
+        # the other process commits the blob for another revision
+        blob_path = hf_cache.get_blob_path(REPO, SHA256)
+        blob_path.parent.mkdir(parents=True)
+        blob_path.write_bytes(CONTENT)
+        hf_cache.commit_file(REPO, "lfs.bin", "other", COMMIT, SHA256)
+        lock.release()
+        assert await task
+        await close_session()
+
+    assert (hf_cache.get_repo_path(REPO) / "refs" / "main").read_text() == COMMIT
+    assert hf_cache.load_partial(REPO, SHA256) is None
+
+
+@pytest.mark.asyncio()
+async def test_wait_blob_lock_before_request(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+    client_cache: Callable[[], Path],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test no request is sent for a known blob until its lock is free."""
+    fake_cache.add_file("lfs.bin", CONTENT, SHA256)
+    urls = []
+    get_stream = file_download.request.get_stream
+
+    def _get_stream(url: str, headers: Dict[str, str]) -> Any:
+        urls.append(url)
+        return get_stream(url, headers)
+
+    monkeypatch.setattr(file_download.request, "get_stream", _get_stream)
+    monkeypatch.setattr(file_download, "LOCK_STALL_SEC", 0.3)
+
+    async with TestServer(daemon_app()) as server:
+        client_cache()
+        endpoint = f"http://127.0.0.1:{server.port}"
+
+        lock = hf_cache.blob_lock(REPO, SHA256)
+        lock.acquire()
+        # the holder makes no progress
+        assert not await download_file(
+            endpoint,
+            REPO,
+            "lfs.bin",
+            "main",
+            etag=SHA256,
+            commit_hash=COMMIT,
+        )
+
+        task = asyncio.create_task(
+            download_file(
+                endpoint,
+                REPO,
+                "lfs.bin",
+                "main",
+                etag=SHA256,
+                commit_hash=COMMIT,
+            ),
+        )
+        await asyncio.sleep(0.1)
+        blob_path = hf_cache.get_blob_path(REPO, SHA256)
+        blob_path.parent.mkdir(parents=True)
+        blob_path.write_bytes(CONTENT)
+        lock.release()
+        assert await task
+        await close_session()
+
+    assert not urls
+    snapshot = hf_cache.get_snapshot_path(REPO, COMMIT, "lfs.bin")
+    assert snapshot.read_bytes() == CONTENT
+
+
+@pytest.mark.asyncio()
+async def test_download_blob(
+    fake_cache: FakeCache,
+    daemon_app: Callable[[], web.Application],
+    client_cache: Callable[[], Path],
+) -> None:
+    """Test a file is found by its content and saved for another repo."""
+    fake_cache.add_file("lfs.bin", CONTENT, SHA256)
+    fork, fork_commit = "fork/model", "f" * 40
+
+    async with TestClient(TestServer(daemon_app())) as client:
+        url = API_FETCH_BLOB.format(etag=SHA256)
+        resp = await client.head(url)
+        assert resp.status == 200
+        assert resp.headers["Content-Length"] == str(len(CONTENT))
+        assert await (await client.get(url)).read() == CONTENT
+        assert (await client.head(API_FETCH_BLOB.format(etag="0" * 64))).status == 404
+
+        client_cache()
+        endpoint = f"http://127.0.0.1:{client.port}"
+
+        assert await download_file(
+            endpoint,
+            fork,
+            "weights.bin",
+            "main",
+            etag=SHA256,
+            commit_hash=fork_commit,
+        )
+        assert not await download_file(
+            endpoint,
+            fork,
+            "other.bin",
+            "main",
+            etag="0" * 64,
+            commit_hash=fork_commit,
+        )
+        await close_session()
+
+    snapshot = hf_cache.get_snapshot_path(fork, fork_commit, "weights.bin")
+    assert snapshot.resolve() == hf_cache.get_blob_path(fork, SHA256)
+    assert snapshot.read_bytes() == CONTENT
+    assert (hf_cache.get_repo_path(fork) / "refs" / "main").read_text() == fork_commit
+
+
+def test_normalize_etag() -> None:
+    """Test only the weak prefix and the quotes are removed from an etag."""
+    assert normalize_etag('"abc"') == "abc"
+    assert normalize_etag('W/"abc"') == "abc"
+    assert normalize_etag('W/"W/abc"') == "W/abc"
+    assert normalize_etag("") is None
+    assert normalize_etag('W/""') is None
@@ -0,0 +1,121 @@
+"""Test collecting files of the cache nothing uses."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from typing import TYPE_CHECKING
+
+from hfmc.client import cache_controller
+from hfmc.client.model_controller import file_rm
+from hfmc.common import blob_store, hf_cache, metadata_store
+from hfmc.common.context import HfmcContext
+from hfmc.common.repo_files import load_file_list, save_file_list
+from tests.conftest import COMMIT, CONTENT, ETAG, FILE, REPO
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from tests.conftest import FakeCache
+
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+OLD = time.time() - 30 * 24 * 3600
+
+
+def _write_old(path: Path, content: bytes) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    os.utime(path, (OLD, OLD))
+    return path
+
+
+def test_index_files(fake_cache: FakeCache) -> None:
+    """Test the cache is indexed once, then files are saved on add and rm."""
+    assert metadata_store.load_files() is None
+    snapshot = f"{fake_cache.repo_path.name}/snapshots/{COMMIT}"
+    # files added by huggingface_hub are found by gc
+    cache_controller.gc()
+    assert metadata_store.load_files() == {f"{snapshot}/{FILE}": ETAG}
+    fake_cache.add_file("hf.bin", b"hf", "f" * 64)
+    cache_controller.gc()
+    files = metadata_store.load_files()
+    assert files is not None
+    assert files[f"{snapshot}/hf.bin"] == "f" * 64
+
+    tmp_path = fake_cache.cache_dir / "download"
+    tmp_path.write_bytes(CONTENT)
+    hf_cache.commit_file(REPO, "lfs.bin", "main", COMMIT, SHA256, tmp_path)
+    files = metadata_store.load_files()
+    assert files is not None
+    assert files[f"{snapshot}/lfs.bin"] == SHA256
+
+    assert file_rm(REPO, FILE, "main")
+    assert file_rm(REPO, "hf.bin", "main")
+    assert metadata_store.load_files() == {f"{snapshot}/lfs.bin": SHA256}
+
+
+def test_gc_keeps_files_added_by_hf(fake_cache: FakeCache) -> None:
+    """Test blobs linked after the cache is indexed are not orphans."""
+    cache_controller.gc()
+    assert metadata_store.load_files() is not None
+
+    # huggingface_hub adds a file, its blob is older than the grace time
+    blob = fake_cache.add_file("hf.bin", CONTENT, SHA256).resolve()
+    two_hours_ago = time.time() - 2 * 3600
+    os.utime(blob, (two_hours_ago, two_hours_ago))
+    assert cache_controller.gc() == cache_controller.GcReport()
+    assert blob.exists()
+
+
+def test_gc_keeps_locked_blob(fake_cache: FakeCache) -> None:
+    """Test a blob is not removed while its lock is held, i.e. being linked."""
+    blob = _write_old(fake_cache.repo_path / "blobs" / SHA256, CONTENT)
+    lock = hf_cache.blob_lock(REPO, SHA256)
+    with lock:
+        report = cache_controller.gc()
+    assert [o.path for o in report.orphans] == [blob]
+    assert blob.exists()
+
+    cache_controller.gc()
+    assert not blob.exists()
+
+
+def test_gc(fake_cache: FakeCache) -> None:
+    """Test a dry run reports orphans, and gc removes them only."""
+    blobs_dir = fake_cache.repo_path / "blobs"
+    orphan_blob = _write_old(blobs_dir / SHA256, CONTENT)
+    blob_store.store_blob(orphan_blob, SHA256)
+    young_blob = blobs_dir / ("a" * 64)
+    young_blob.write_bytes(CONTENT)
+    incomplete = _write_old(blobs_dir / ("b" * 64 + ".incomplete"), b"x")
+    sidecar = _write_old(incomplete.with_name(incomplete.name + ".json"), b"{}")
+    stored = _write_old(blob_store.get_store_path("c" * 64), CONTENT)
+    gone = fake_cache.repo_path / "snapshots" / COMMIT / "gone.bin"
+    metadata_store.save_file(gone, "d" * 64, 1)
+    save_file_list(REPO, COMMIT, [FILE])
+    metadata_store.save_file_list(REPO, "gone", [FILE], OLD)
+
+    report = cache_controller.gc(dry_run=True)
+    found = {(o.kind, o.path) for o in report.orphans}
+    assert found == {
+        (cache_controller.ORPHAN_BLOB, orphan_blob),
+        (cache_controller.ORPHAN_INCOMPLETE, incomplete),
+        (cache_controller.ORPHAN_STORED, stored),
+    }
+    gone_rel = gone.relative_to(HfmcContext.get_model_dir()).as_posix()
+    assert report.stale_files == [gone_rel]
+    assert report.stale_file_lists == [(REPO, "gone")]
+    # the orphan blob is freed along with its store link
+    assert report.reclaimable == 2 * len(CONTENT) + 1
+    assert all(path.exists() for _, path in found)
+
+    assert cache_controller.gc() == report
+    assert not any(path.exists() for _, path in found)
+    assert not sidecar.exists()
+    assert not blob_store.get_store_path(SHA256).exists()
+    assert young_blob.exists()
+    assert hf_cache.get_blob_path(REPO, ETAG).exists()
+    assert load_file_list(REPO, COMMIT) is not None
+    assert load_file_list(REPO, "gone") is None
+    assert cache_controller.gc(dry_run=True) == cache_controller.GcReport()
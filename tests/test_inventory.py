@@ -0,0 +1,90 @@
+"""Test inventory filters exchanged between daemons."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from hfmc.common.bloom import BloomFilter
+from hfmc.common.cache_index import CacheIndex
+from hfmc.common.context import HfmcContext
+from hfmc.common.peer import Peer
+from hfmc.daemon.inventory import (
+    Inventory,
+    PeerInventories,
+    etag_key,
+    file_key,
+    is_searchable,
+)
+from tests.conftest import COMMIT, CONTENT, ETAG, FILE, REPO
+
+if TYPE_CHECKING:
+    from tests.conftest import FakeCache
+
+PEER = Peer("127.0.0.2", 8080)
+
+
+def _inventory() -> tuple[CacheIndex, Inventory]:
+    index = CacheIndex(HfmcContext.get_model_dir())
+    inventory = Inventory(index)
+    index.build()
+    inventory.build()
+    return index, inventory
+
+
+def test_bloom_filter() -> None:
+    """Test added keys are found and the bits can be copied."""
+    bloom = BloomFilter.for_capacity(1000)
+    keys = [f"key-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300  # about 1%
+
+    copy = BloomFilter(bloom.nb_bits, bloom.nb_hashes, bloom.to_bytes())
+    assert all(key in copy for key in keys)
+
+
+def test_inventory_keys(fake_cache: FakeCache) -> None:
+    """Test files are found by ref, commit hash and etag."""
+    _, inventory = _inventory()
+    inventories = PeerInventories()
+    inventories.apply(PEER, inventory.export())
+
+    assert inventories.might_have(PEER, [file_key(REPO, "main", FILE)])
+    assert inventories.might_have(PEER, [file_key(REPO, COMMIT, FILE)])
+    assert inventories.might_have(PEER, [etag_key(ETAG)])
+    assert not inventories.might_have(PEER, [file_key(REPO, "main", "other")])
+    assert inventories.might_have(Peer("127.0.0.3", 8080), ["unknown peer"])
+
+    assert is_searchable("main")
+    assert is_searchable(COMMIT)
+    assert not is_searchable(COMMIT[:8])
+
+
+def test_inventory_delta(fake_cache: FakeCache) -> None:
+    """Test peers apply deltas of added files and reload after removals."""
+    index, inventory = _inventory()
+    inventories = PeerInventories()
+    inventories.apply(PEER, inventory.export())
+    epoch, version = inventory.tag.split(":")
+
+    fake_cache.add_file("new.bin", CONTENT, "f" * 64)
+    index.refresh_repo(REPO)
+    delta = inventory.export(epoch, int(version))
+    assert "delta" in delta
+    assert "bits" not in delta
+    inventories.apply(PEER, delta)
+    assert inventories.might_have(PEER, [file_key(REPO, "main", "new.bin")])
+
+    # a stale epoch gets the whole filter
+    assert "bits" in inventory.export("stale", int(version))
+
+    (fake_cache.repo_path / "snapshots" / COMMIT / "new.bin").unlink()
+    index.refresh_repo(REPO)
+    full = inventory.export(epoch, delta["version"])
+    assert "bits" in full
+    inventories.apply(PEER, full)
+    assert not inventories.might_have(PEER, [file_key(REPO, "main", "new.bin")])
+    assert inventories.might_have(PEER, [file_key(REPO, "main", FILE)])
@@ -0,0 +1,138 @@
+"""Test gossip membership of daemons."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+from hfmc.common.peer import Peer
+from hfmc.daemon.membership import (
+    ALIVE,
+    DEAD,
+    SUSPECT,
+    Membership,
+    SwimProber,
+    Update,
+)
+
+IP = "127.0.0.2"
+
+
+def test_apply_updates() -> None:
+    """Test updates override each other by incarnation and state."""
+    membership = Membership(8000, incarnation=1)
+    peer = Peer(IP, 9000)
+
+    assert membership.apply(Update(IP, 9000, DEAD, 1)) is None
+    assert membership.apply(Update(IP, 9000, ALIVE, 1))
+    assert membership.apply(Update(IP, 9000, ALIVE, 1)) is None
+
+    assert membership.suspect(peer)
+    assert membership.get(peer).state == SUSPECT
+    # an alive of the same incarnation doesn't refute a suspicion
+    assert membership.apply(Update(IP, 9000, ALIVE, 1)) is None
+    assert membership.apply(Update(IP, 9000, ALIVE, 2))
+    assert membership.get(peer).state == ALIVE
+    assert peer in [m.peer for m in membership.members(ALIVE)]
+
+    assert membership.apply(Update(IP, 9000, SUSPECT, 1)) is None
+    assert membership.apply(Update(IP, 9000, DEAD, 2))
+    assert not membership.members(ALIVE)
+
+
+def test_refute_suspicion() -> None:
+    """Test a daemon refutes a suspicion about itself."""
+    membership = Membership(8000, incarnation=1)
+    membership.add_self_ip(IP)
+
+    assert membership.apply(Update(IP, 8000, SUSPECT, 1)) is None
+    assert membership.incarnation == 2
+    assert {"ip": IP, "port": 8000, "state": ALIVE, "incarnation": 2} in (
+        membership.take_updates()
+    )
+
+
+def test_updates_retransmitted() -> None:
+    """Test an update is piggybacked a limited number of times."""
+    membership = Membership(8000)
+    membership.apply(Update(IP, 9000, ALIVE, 1))
+
+    nb_sent = 0
+    while membership.take_updates():
+        nb_sent += 1
+    assert 1 < nb_sent < 10
+
+
+def test_bad_update() -> None:
+    """Test bad messages are rejected."""
+    membership = Membership(8000)
+    with pytest.raises(ValueError):  # noqa: PT011
+        Update.from_json({"ip": IP, "port": 9000, "state": "zombie"})
+    with pytest.raises(ValueError):  # noqa: PT011
+        membership.receive(Peer(IP, 9000), {"updates": []})
+
+
+class FakeNetwork:
+    """Route gossip between probers in memory, only for nodes up."""
+
+    def __init__(self) -> None:
+        """Init FakeNetwork."""
+        self.nodes: Dict[Peer, SwimProber] = {}
+        self.down: set = set()
+
+    def add(self, port: int, seeds: List[Peer]) -> SwimProber:
+        """Add a node to the network."""
+        prober = SwimProber(seeds, port, self.gossip, self.ping_req)
+        prober.membership.add_self_ip(IP)
+        self.nodes[Peer(IP, port)] = prober
+        return prober
+
+    async def gossip(self, target: Peer, message: Dict[str, Any]) -> Any:
+        """Send a gossip message."""
+        await asyncio.sleep(0)
+        node = self.nodes.get(target)
+        if node is None or target in self.down:
+            return None
+        sender = Peer(IP, message["port"])
+        if sender in self.down:
+            return None
+        return node.handle_gossip(sender, message, IP)
+
+    async def ping_req(self, helper: Peer, target: Peer, message: Any) -> Any:
+        """Send a gossip message through a helper."""
+        node = self.nodes.get(helper)
+        sender = Peer(IP, message["port"])
+        if node is None or helper in self.down or sender in self.down:
+            return None
+        node.handle_gossip(sender, message, IP)
+        return await node.handle_ping_req(target)
+
+
+@pytest.mark.asyncio()
+async def test_join_and_fail(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test members are learned from one seed and failures spread."""
+    monkeypatch.setattr(SwimProber, "PERIOD_SEC", 0.01)
+    monkeypatch.setattr(Membership, "SUSPECT_SEC", 0.05)
+
+    network = FakeNetwork()
+    seed = Peer(IP, 9000)
+    probers = [network.add(9000, [])]
+    probers += [network.add(9000 + i, [seed]) for i in range(1, 6)]
+    for prober in probers:
+        prober.set_probe_task(asyncio.create_task(prober.start_probe()))
+
+    await asyncio.sleep(0.5)
+    for port, prober in zip(range(9000, 9006), probers):
+        assert len(prober.get_alives()) == 5
+        assert Peer(IP, port) not in prober.get_alives()
+
+    network.down.add(Peer(IP, 9005))
+    await asyncio.sleep(0.5)
+    for prober in probers[:-1]:
+        assert len(prober.get_alives()) == 4
+        assert Peer(IP, 9005) not in prober.get_alives()
+
+    for prober in probers:
+        prober.stop_probe()
@@ -0,0 +1,79 @@
+"""Test the metadata store of the cache."""
+
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING
+
+from hfmc.common import hf_cache, metadata_store
+from hfmc.common.context import HfmcContext
+from hfmc.common.repo_files import load_file_list
+from tests.conftest import COMMIT, CONTENT, ETAG, FILE, REPO
+
+if TYPE_CHECKING:
+    import pytest
+
+    from tests.conftest import FakeCache
+
+
+def test_migrate(fake_cache: FakeCache) -> None:
+    """Test files of older versions are imported once, then removed."""
+    snapshot = f"{fake_cache.repo_path.name}/snapshots/{COMMIT}/{FILE}"
+    etag_path = HfmcContext.get_etag_dir() / snapshot
+    etag_path.parent.mkdir(parents=True)
+    etag_path.write_text(ETAG)
+    list_path = HfmcContext.get_repo_files_dir() / REPO / "main" / "files.json"
+    list_path.parent.mkdir(parents=True)
+    list_path.write_text(json.dumps([FILE]))
+
+    assert load_file_list(REPO, "main") == [FILE]
+    assert metadata_store.load_etags(fake_cache.repo_path.name) == {snapshot: ETAG}
+    # not indexed, files added without HFMC are not known yet
+    assert metadata_store.load_files() is None
+    assert not HfmcContext.get_etag_dir().exists()
+    assert not HfmcContext.get_repo_files_dir().exists()
+
+
+def test_batch(fake_cache: FakeCache) -> None:
+    """Test writes in a batch are committed together, or not at all."""
+    snapshot_path = fake_cache.repo_path / "snapshots" / COMMIT / FILE
+    try:
+        with metadata_store.batch():
+            metadata_store.save_file(snapshot_path, ETAG, 1)
+            metadata_store.save_file_list(REPO, COMMIT, [FILE], 0.0)
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert metadata_store.load_etag(snapshot_path) is None
+    assert load_file_list(REPO, COMMIT) is None
+
+    with metadata_store.batch():
+        metadata_store.save_file(snapshot_path, ETAG, 1)
+        metadata_store.save_file_list(REPO, COMMIT, [FILE], 0.0)
+    assert metadata_store.load_etag(snapshot_path) == ETAG
+    assert load_file_list(REPO, COMMIT) == [FILE]
+
+
+def test_commit_file_without_symlinks(
+    fake_cache: FakeCache,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test the etag of a blob moved to the snapshot is saved."""
+
+    def _symlink(*_: object) -> None:
+        raise OSError
+
+    monkeypatch.setattr(hf_cache.os, "symlink", _symlink)
+    tmp_path = fake_cache.cache_dir / "download"
+    tmp_path.write_bytes(CONTENT)
+    snapshot_path = hf_cache.commit_file(
+        REPO,
+        "copy.bin",
+        "main",
+        COMMIT,
+        "f" * 64,
+        tmp_path,
+    )
+    assert not snapshot_path.is_symlink()
+    assert snapshot_path.read_bytes() == CONTENT
+    assert metadata_store.load_etag(snapshot_path) == "f" * 64
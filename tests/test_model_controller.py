@@ -0,0 +1,24 @@
+"""Test choosing where to download files from."""
+
+from hfmc.client.model_controller import SITE_ENDPOINTS, _gen_endpoints
+from hfmc.common.peer import Peer
+
+
+def test_gen_endpoints() -> None:
+    """Test peers are ranked by the expected time to download."""
+    near_busy = Peer("10.0.0.1", 9009, rtt=0.001, throughput=10**9, uploads=9)
+    near_idle = Peer("10.0.0.2", 9009, rtt=0.001, throughput=10**9)
+    far_idle = Peer("10.1.0.1", 9009, rtt=0.1, throughput=10**8)
+    unknown = Peer("10.1.0.2", 9009)
+
+    peers = [far_idle, near_busy, unknown, near_idle]
+    assert _gen_endpoints(peers, 10**9) == [
+        "http://10.0.0.2:9009",
+        "http://10.1.0.2:9009",
+        "http://10.0.0.1:9009",
+        "http://10.1.0.1:9009",
+        *SITE_ENDPOINTS,
+    ]
+
+    # latency matters for small files
+    assert _gen_endpoints([far_idle, near_busy], 1000)[0] == "http://10.0.0.1:9009"
@@ -0,0 +1,143 @@
+"""Test probing the liveness of peers."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import List, Set
+
+import pytest
+
+from hfmc.common.peer import Peer
+from hfmc.daemon.prober import PeerProber
+
+
+class FakePing:
+    """Ping peers without network, only peers in {alives} answer."""
+
+    def __init__(self, alives: Set[Peer], delay: float = 0.0) -> None:
+        """Init FakePing."""
+        self.alives = alives
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.cancelled = 0
+
+    async def __call__(self, peer: Peer) -> Peer:
+        """Ping a peer."""
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.running -= 1
+        peer.alive = peer in self.alives
+        return peer
+
+
+def _prober(
+    peers: List[Peer],
+    ping: FakePing,
+    monkeypatch: pytest.MonkeyPatch,
+) -> PeerProber:
+    monkeypatch.setattr(PeerProber, "MAX_PROBES", 4)
+    monkeypatch.setattr(PeerProber, "ALIVE_INTERVAL_SEC", 0.05)
+    monkeypatch.setattr(PeerProber, "RETRY_SEC", 0.01)
+    monkeypatch.setattr(PeerProber, "MAX_BACKOFF_SEC", 0.05)
+
+    prober = PeerProber(peers, ping)
+    prober.set_probe_task(asyncio.create_task(prober.start_probe()))
+    return prober
+
+
+@pytest.mark.asyncio()
+async def test_probe_concurrently(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test all peers are probed in parallel within the cap."""
+    peers = [Peer("127.0.0.1", 9000 + i) for i in range(20)]
+    ping = FakePing(set(peers), delay=0.02)
+    prober = _prober(peers, ping, monkeypatch)
+
+    await asyncio.sleep(0.3)
+    assert set(prober.get_alives()) == set(peers)
+    assert 1 < ping.max_running <= PeerProber.MAX_PROBES
+    prober.stop_probe()
+
+
+@pytest.mark.asyncio()
+async def test_probe_down_and_up(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test a peer leaves after consecutive misses and comes back."""
+    peers = [Peer("127.0.0.1", 9000), Peer("127.0.0.1", 9001)]
+    ping = FakePing(set(peers))
+    prober = _prober(peers, ping, monkeypatch)
+
+    await asyncio.sleep(0.1)
+    assert len(prober.get_alives()) == 2
+
+    ping.alives = {peers[0]}
+    await asyncio.sleep(0.2)
+    assert prober.get_alives() == [peers[0]]
+
+    ping.alives = set(peers)
+    await asyncio.sleep(0.2)
+    assert len(prober.get_alives()) == 2
+
+    prober.update_peers([peers[1]])
+    await asyncio.sleep(0.05)
+    assert prober.get_alives() == [peers[1]]
+    prober.stop_probe()
+
+
+@pytest.mark.asyncio()
+async def test_stop_probe(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test running probes are cancelled on stop."""
+    peers = [Peer("127.0.0.1", 9000 + i) for i in range(3)]
+    ping = FakePing(set(peers), delay=10)
+    prober = _prober(peers, ping, monkeypatch)
+
+    await asyncio.sleep(0.05)
+    assert ping.running == 3
+    prober.stop_probe()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert ping.running == 0
+    assert ping.cancelled == 3
+    assert not prober.get_alives()
+
+
+def test_report_throughput() -> None:
+    """Test download speeds are averaged per peer."""
+    peers = [Peer("127.0.0.1", 9000), Peer("127.0.0.1", 9001)]
+    prober = PeerProber(peers, FakePing(set(peers)))
+
+    prober.report_throughput(Peer("127.0.0.1", 9000), 100.0)
+    assert peers[0].throughput == 100.0
+    prober.report_throughput(Peer("127.0.0.1", 9000), 200.0)
+    assert 100.0 < peers[0].throughput < 200.0
+    assert peers[1].throughput == 0.0
+
+
+@pytest.mark.asyncio()
+async def test_update_peers_keeps_state(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test measures of a peer are kept when the peer list is updated."""
+    peers = [Peer("127.0.0.1", 9000), Peer("127.0.0.1", 9001)]
+    ping = FakePing(set(peers), delay=0.02)
+    prober = _prober(peers, ping, monkeypatch)
+    await asyncio.sleep(0.1)
+    prober.report_throughput(peers[0], 100.0)
+
+    new_peers = [Peer("127.0.0.1", 9000), Peer("127.0.0.1", 9001)]
+    ping.alives = set(new_peers)
+    prober.update_peers(new_peers)
+    await asyncio.sleep(0.01)
+    assert new_peers[0].throughput == 100.0
+    assert new_peers[0].alive
+    assert all(any(p is a for p in new_peers) for a in prober.get_alives())
+
+    await asyncio.sleep(0.1)
+    assert len(prober.get_alives()) == 2
+    prober.report_throughput(Peer("127.0.0.1", 9000), 200.0)
+    assert new_peers[0].throughput > 100.0
+    prober.stop_probe()
@@ -0,0 +1,174 @@
+"""Test fetching missing files through the daemon in proxy mode."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from typing import TYPE_CHECKING, Callable, Dict
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from hfmc.client.http_request import close_session
+from hfmc.common import blob_store, hf_cache
+from hfmc.common.api_settings import HEADER_NO_PROXY
+from hfmc.common.context import HfmcContext
+from hfmc.config import config_manager
+from hfmc.config.hfmc_config import HfmcConfig
+from hfmc.daemon import proxy
+from tests.conftest import COMMIT, CONTENT, REPO
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class FakeHub:
+    """Serve files slowly like the hub, and count the downloads."""
+
+    def __init__(self, etags: Dict[str, str]) -> None:
+        """Init FakeHub serving CONTENT under the etag of each file."""
+        self.etags = etags
+        self.nb_gets = 0
+        self.nb_sent = 0  # files sent completely
+
+    def app(self) -> web.Application:
+        """Build the app."""
+        app = web.Application()
+        app.router.add_get("/{user}/{model}/resolve/{revision}/{file}", self.get)
+        return app
+
+    def _headers(self, file_name: str) -> Dict[str, str]:
+        return {
+            "ETag": f'"{self.etags[file_name]}"',
+            "X-Repo-Commit": COMMIT,
+            "Content-Length": str(len(CONTENT)),
+        }
+
+    async def get(self, request: web.Request) -> web.StreamResponse:
+        """Send a file in chunks."""
+        file_name = request.match_info["file"]
+        if file_name not in self.etags:
+            return web.Response(status=404)
+        if request.method == "HEAD":
+            return web.Response(headers=self._headers(file_name))
+
+        self.nb_gets += 1
+        response = web.StreamResponse(headers=self._headers(file_name))
+        await response.prepare(request)
+        for i in range(0, len(CONTENT), 1024):
+            await response.write(CONTENT[i : i + 1024])
+            await asyncio.sleep(0.01)
+        await response.write_eof()
+        self.nb_sent += 1
+        return response
+
+
+@pytest.mark.asyncio()
+async def test_proxy(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test a missing file is fetched once, sent and kept in the cache."""
+    HfmcContext.init_with_config(HfmcConfig(cache_dir=str(tmp_path), proxy=True))
+    hub = FakeHub({"lfs.bin": SHA256, "broken.bin": "0" * 64})
+
+    async with TestServer(hub.app()) as hub_server, TestClient(
+        TestServer(daemon_app()),
+    ) as client:
+        monkeypatch.setattr(
+            proxy,
+            "UPSTREAM_ENDPOINTS",
+            [f"http://127.0.0.1:{hub_server.port}"],
+        )
+        url = f"/{REPO}/resolve/main/lfs.bin"
+
+        resp = await client.head(url)
+        assert resp.status == 200
+        assert resp.headers["ETag"] == SHA256
+        assert resp.headers["Content-Length"] == str(len(CONTENT))
+
+        async def get(headers: Dict[str, str] | None = None) -> bytes:
+            resp = await client.get(url, headers=headers)
+            assert resp.status in (200, 206)
+            return await resp.read()
+
+        bodies = await asyncio.gather(get(), get(), get({"Range": "bytes=100-"}))
+        assert bodies == [CONTENT, CONTENT, CONTENT[100:]]
+        assert hub.nb_gets == 1
+
+        snapshot = hf_cache.get_snapshot_path(REPO, COMMIT, "lfs.bin")
+        assert snapshot.read_bytes() == CONTENT
+        assert await get() == CONTENT
+        assert hub.nb_gets == 1
+
+        # a blob is fetched once for requests of different revisions
+        hub.etags["shared.bin"] = SHA256
+        hub.etags["copy.bin"] = SHA256
+        hf_cache.get_blob_path(REPO, SHA256).unlink()
+        blob_store.get_store_path(SHA256).unlink()
+        urls = [f"/{REPO}/resolve/main/shared.bin", f"/{REPO}/resolve/main/copy.bin"]
+        resps = await asyncio.gather(*(client.get(u) for u in urls))
+        assert [await r.read() for r in resps] == [CONTENT, CONTENT]
+        assert hub.nb_sent == 2
+
+        # the last byte of a corrupted file is never sent
+        resp = await client.get(f"/{REPO}/resolve/main/broken.bin")
+        with pytest.raises(aiohttp.ClientPayloadError):
+            await resp.read()
+        assert not hf_cache.get_snapshot_path(REPO, COMMIT, "broken.bin").exists()
+
+        resp = await client.get(f"/{REPO}/resolve/main/missing.bin")
+        assert resp.status == 404
+        resp = await client.head(
+            f"/{REPO}/resolve/main/lfs.bin",
+            headers={HEADER_NO_PROXY: "1"},
+        )
+        assert resp.status == 200
+        resp = await client.get(
+            f"/{REPO}/resolve/main/other.bin",
+            headers={HEADER_NO_PROXY: "1"},
+        )
+        assert resp.status == 404
+        await close_session()
+
+
+@pytest.mark.asyncio()
+async def test_proxy_make_room(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test files are evicted before a fetch fills the cache."""
+    config = HfmcConfig(cache_dir=str(tmp_path), proxy=True, capacity=6000)
+    HfmcContext.init_with_config(config)
+    monkeypatch.setattr(config_manager, "load_config", lambda: config)
+    other = "user/other"
+    old_blob = hf_cache.get_blob_path(other, "0" * 64)
+    old_blob.parent.mkdir(parents=True)
+    old_blob.write_bytes(CONTENT)
+    snapshot = hf_cache.get_snapshot_path(other, COMMIT, "old.bin")
+    snapshot.parent.mkdir(parents=True)
+    snapshot.symlink_to(old_blob)
+    hub = FakeHub({"lfs.bin": SHA256})
+
+    async with TestServer(hub.app()) as hub_server, TestClient(
+        TestServer(daemon_app()),
+    ) as client:
+        monkeypatch.setattr(
+            proxy,
+            "UPSTREAM_ENDPOINTS",
+            [f"http://127.0.0.1:{hub_server.port}"],
+        )
+        index = HfmcContext.get_cache_index()
+        assert index.get_repo(other) is not None
+
+        resp = await client.get(f"/{REPO}/resolve/main/lfs.bin")
+        assert await resp.read() == CONTENT
+        assert not old_blob.exists()
+        assert index.get_repo(other) is None
+        await close_session()
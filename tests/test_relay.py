@@ -0,0 +1,116 @@
+"""Test relaying files being downloaded to peers."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from typing import TYPE_CHECKING, Callable, Dict
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from hfmc.common import hf_cache
+from hfmc.common.api_settings import API_FETCH_FILES_META
+from hfmc.common.cache_index import CacheIndex
+from hfmc.common.context import HfmcContext
+from hfmc.common.peer import Peer
+from hfmc.daemon import relay
+from hfmc.daemon.inventory import Inventory, PeerInventories, etag_key, file_key
+from tests.conftest import COMMIT, CONTENT, REPO
+
+if TYPE_CHECKING:
+    from tests.conftest import FakeCache
+
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+HALF = len(CONTENT) // 2
+
+
+def _start_download() -> hf_cache.PartialFile:
+    """Write half of a file like another process downloading it."""
+    hf_cache.prepare_snapshot(REPO, "lfs.bin", "main", COMMIT)
+    partial = hf_cache.PartialFile(REPO, SHA256, len(CONTENT), "lfs.bin", COMMIT)
+    hf_cache.save_partial(partial)
+    partial.path.write_bytes(CONTENT[:HALF])
+    return partial
+
+
+def test_advertise_partial(fake_cache: FakeCache) -> None:
+    """Test files being downloaded are in the inventory."""
+    _start_download()
+    index = CacheIndex(HfmcContext.get_model_dir())
+    inventory = Inventory(index)
+    index.build()
+    inventory.build()
+
+    peer = Peer("127.0.0.2", 8080)
+    inventories = PeerInventories()
+    inventories.apply(peer, inventory.export())
+    assert inventories.might_have(peer, [file_key(REPO, "main", "lfs.bin")])
+    assert inventories.might_have(peer, [file_key(REPO, COMMIT, "lfs.bin")])
+    assert inventories.might_have(peer, [etag_key(SHA256)])
+
+
+@pytest.mark.asyncio()
+async def test_relay(
+    fake_cache: FakeCache,
+    monkeypatch: pytest.MonkeyPatch,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test a file being downloaded is sent as it arrives."""
+    monkeypatch.setattr(relay, "POLL_SEC", 0.01)
+    partial = _start_download()
+    lock = hf_cache.blob_lock(REPO, SHA256)
+    lock.acquire()
+
+    async with TestClient(TestServer(daemon_app())) as client:
+        url = f"/{REPO}/resolve/main/lfs.bin"
+        resp = await client.head(url)
+        assert resp.status == 200
+        assert resp.headers["ETag"] == SHA256
+        assert resp.headers["Content-Length"] == str(len(CONTENT))
+
+        user, model = REPO.split("/")
+        resp = await client.post(
+            API_FETCH_FILES_META.format(user=user, model=model, revision="main"),
+            json=["lfs.bin"],
+        )
+        assert (await resp.json())["files"]["lfs.bin"]["etag"] == SHA256
+
+        async def get(headers: Dict[str, str] | None = None) -> bytes:
+            resp = await client.get(url, headers=headers)
+            assert resp.status in (200, 206)
+            return await resp.read()
+
+        gets = asyncio.gather(get(), get({"Range": f"bytes={HALF - 10}-"}))
+        await asyncio.sleep(0.1)
+        assert not gets.done()
+
+        with partial.path.open("ab") as f:
+            f.write(CONTENT[HALF:])
+        hf_cache.commit_file(REPO, "lfs.bin", "main", COMMIT, SHA256, partial.path)
+        lock.release()
+        assert await gets == [CONTENT, CONTENT[HALF - 10 :]]
+
+        # served from the cache once committed
+        assert HfmcContext.get_cache_index().get_file(REPO, "main", "lfs.bin")
+        assert await get() == CONTENT
+
+
+@pytest.mark.asyncio()
+async def test_relay_writer_gone(
+    fake_cache: FakeCache,
+    monkeypatch: pytest.MonkeyPatch,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test readers stop waiting for a file nobody writes anymore."""
+    monkeypatch.setattr(relay, "POLL_SEC", 0.01)
+    monkeypatch.setattr(relay, "STALL_SEC", 0.1)
+    _start_download()
+
+    async with TestClient(TestServer(daemon_app())) as client:
+        resp = await client.get(f"/{REPO}/resolve/main/lfs.bin")
+        assert resp.status == 200
+        with pytest.raises(aiohttp.ClientPayloadError):
+            await resp.read()
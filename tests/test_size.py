@@ -0,0 +1,12 @@
+"""Test parsing and formatting sizes."""
+
+from hfmc.utils.size import format_size, parse_size
+
+
+def test_parse_size() -> None:
+    """Test sizes are parsed with or without units."""
+    assert parse_size("1024") == 1024
+    assert parse_size("500G") == 500 * 10**9
+    assert parse_size(" 4tb ") == 4 * 10**12
+    assert parse_size("1.5MB") == 1_500_000
+    assert parse_size(format_size(2 * 10**9)) == 2 * 10**9
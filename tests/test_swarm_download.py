@@ -0,0 +1,108 @@
+"""Test downloading a file from several peers at the same time."""
+
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from hfmc.client import swarm_download
+from hfmc.client.download_scheduler import EndpointLimiter
+from hfmc.client.http_request import close_session
+from hfmc.client.swarm_download import SwarmDownload
+from hfmc.common.hf_cache import verify_etag
+from hfmc.common.peer import Peer
+from tests.conftest import COMMIT, CONTENT, FILE, REPO
+
+if TYPE_CHECKING:
+    from tests.conftest import FakeCache
+
+
+@pytest.mark.asyncio()
+async def test_swarm_download(
+    fake_cache: FakeCache,
+    monkeypatch: pytest.MonkeyPatch,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test chunks are fetched from all peers and a dead peer is dropped."""
+    monkeypatch.setattr(swarm_download, "CHUNK_SIZE", 100)
+    path = fake_cache.cache_dir / "swarm.incomplete"
+
+    async with TestServer(daemon_app()) as s1, TestServer(daemon_app()) as s2:
+        dead = TestServer(daemon_app())
+        await dead.start_server()
+        dead_port = dead.port
+        await dead.close()
+
+        peers = [
+            Peer("127.0.0.1", s1.port),
+            Peer("127.0.0.1", s2.port),
+            Peer("127.0.0.1", dead_port),
+        ]
+        swarm = SwarmDownload(
+            REPO,
+            FILE,
+            COMMIT,
+            len(CONTENT),
+            path,
+            peers,
+            EndpointLimiter(1),
+        )
+        assert await swarm.run()
+        await close_session()
+
+    assert path.read_bytes() == CONTENT
+
+
+@pytest.mark.asyncio()
+async def test_swarm_resume(
+    fake_cache: FakeCache,
+    monkeypatch: pytest.MonkeyPatch,
+    daemon_app: Callable[[], web.Application],
+) -> None:
+    """Test downloaded chunks are kept and the valid prefix is reported."""
+    monkeypatch.setattr(swarm_download, "CHUNK_SIZE", 100)
+    path = fake_cache.cache_dir / "swarm.incomplete"
+    path.write_bytes(CONTENT[:250])
+
+    dead = TestServer(daemon_app())
+    await dead.start_server()
+    peer = Peer("127.0.0.1", dead.port)
+    await dead.close()
+
+    swarm = SwarmDownload(
+        REPO,
+        FILE,
+        COMMIT,
+        len(CONTENT),
+        path,
+        [peer],
+        EndpointLimiter(1),
+        250,
+    )
+    assert not await swarm.run()
+    await close_session()
+
+    # chunks fully before the offset are kept
+    assert swarm.valid_size == 200
+    assert path.read_bytes()[:250] == CONTENT[:250]
+
+
+def test_verify_etag(tmpdir: Path) -> None:
+    """Test verifying sha256 and git sha1 etags."""
+    path = Path(str(tmpdir)) / "blob"
+    path.write_bytes(CONTENT)
+
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    git_sha1 = hashlib.sha1(  # noqa: S324
+        f"blob {len(CONTENT)}\0".encode() + CONTENT,
+    ).hexdigest()
+
+    assert verify_etag(path, sha256)
+    assert verify_etag(path, git_sha1)
+    assert not verify_etag(path, "0" * 64)
+    assert verify_etag(path, "not-a-hash")